@@ -0,0 +1,55 @@
+# Compara una llamada por lotes al modelo YOLO contra llamadas secuenciales de a una imagen,
+# como pasa cuando hay varias cámaras en el mismo ciclo de captura.
+# Usa las fotos de muestra del repositorio, reducidas al tamaño del stream lores.
+#
+#   python batch_benchmark.py --batch 4 --rounds 10
+import argparse
+import glob
+import time
+import statistics
+import cv2
+from ultralytics import YOLO
+
+MODEL_PATH = "best_model.pt"
+LORES_SIZE = (640, 360)
+INFERENCE_SIZE = 640
+SAMPLE_IMAGES = "runs/detect/predict/*.jpg"
+
+def load_frames(pattern, count):
+    paths = sorted(glob.glob(pattern))[:count]
+    if len(paths) < count:
+        raise Exception(f"Need {count} images matching {pattern}, found {len(paths)}")
+    return [cv2.resize(cv2.imread(path), LORES_SIZE, interpolation=cv2.INTER_AREA) for path in paths]
+
+def timed(func, rounds):
+    latencies = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batched vs sequential YOLO inference")
+    parser.add_argument('--batch', type=int, default=4, help="frames per cycle (cameras)")
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--images', default=SAMPLE_IMAGES)
+    args = parser.parse_args()
+
+    model = YOLO(MODEL_PATH)
+    frames = load_frames(args.images, args.batch)
+
+    # Calentar el modelo con las dos formas de llamada antes de medir
+    model(frames[0], imgsz=INFERENCE_SIZE, verbose=False)
+    model(frames, imgsz=INFERENCE_SIZE, verbose=False)
+
+    sequential = timed(lambda: [model(frame, imgsz=INFERENCE_SIZE, verbose=False) for frame in frames], args.rounds)
+    batched = timed(lambda: model(frames, imgsz=INFERENCE_SIZE, verbose=False), args.rounds)
+
+    print("-" * 60)
+    print(f"{args.batch} frames per cycle, {args.rounds} rounds")
+    for name, latencies in (("sequential", sequential), ("batched", batched)):
+        mean = statistics.mean(latencies)
+        print(f"{name:<12} {mean * 1000:8.1f} ms/cycle   {args.batch / mean:6.2f} images/s")
+    print(f"Speed-up     {statistics.mean(sequential) / statistics.mean(batched):.2f}x")
+    print("-" * 60)
@@ -0,0 +1,57 @@
+# Compara la latencia de captura de la configuración still (la que usaba yolo_sender)
+# con la configuración de video con stream lores que usa ahora.
+# Ejecutar con el servicio de cámara detenido, porque la cámara no se puede compartir.
+import time
+import statistics
+from picamera2 import Picamera2
+
+CAPTURE_SIZE = (1280, 720)
+LORES_SIZE = (640, 360)
+SAMPLES = 20
+OUTPUT_PATH = "/tmp/camera_latency_test.jpg"
+
+def report(name, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{name:<28} mean {statistics.mean(latencies):7.1f} ms   p95 {p95:7.1f} ms")
+
+def measure(func):
+    latencies = []
+    for _ in range(SAMPLES):
+        start = time.perf_counter()
+        func()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+picam2 = Picamera2()
+
+try:
+    # Modo anterior: configuración still y capture_file por cada foto
+    picam2.configure(picam2.create_still_configuration(main={"size": CAPTURE_SIZE}))
+    picam2.start()
+    time.sleep(2)
+    still = measure(lambda: picam2.capture_file(OUTPUT_PATH))
+    picam2.stop()
+
+    # Modo nuevo: configuración de video con main + lores, sin cambio de modo
+    picam2.configure(picam2.create_video_configuration(
+        main={"size": CAPTURE_SIZE},
+        lores={"size": LORES_SIZE, "format": "YUV420"}
+    ))
+    picam2.start()
+    time.sleep(2)
+    lores = measure(lambda: picam2.capture_array("lores"))
+    main = measure(lambda: picam2.capture_file(OUTPUT_PATH))
+
+    print("-" * 60)
+    report("still capture_file", still)
+    report("video lores capture_array", lores)
+    report("video main capture_file", main)
+    print("-" * 60)
+
+except KeyboardInterrupt:
+    print("\nProgram stopped by user")
+
+finally:
+    picam2.stop()
+    picam2.close()
@@ -0,0 +1,208 @@
+import io
+import time
+from threading import Lock
+import cv2
+import numpy as np
+import simplejpeg
+
+
+def ewma(previous, value, weight=0.2):
+    """Media móvil exponencial; el primer valor se toma tal cual."""
+    return value if previous is None else (1 - weight) * previous + weight * value
+
+
+def clamp_rois(rois, capture_size):
+    """
+    Ajusta las cajas de las regiones de interés al frame completo y rechaza las vacías, para que
+    un error en la configuración falle al abrir la cámara y no como recortes vacíos en cada captura.
+    """
+    width, height = capture_size
+    clamped = []
+    for roi in rois or []:
+        x1, y1, x2, y2 = (int(v) for v in roi['box'])
+        box = (min(max(x1, 0), width), min(max(y1, 0), height), min(max(x2, 0), width), min(max(y2, 0), height))
+        if box[2] <= box[0] or box[3] <= box[1]:
+            raise ValueError(f"ROI {roi.get('name')} box {roi['box']} is empty inside a {width}x{height} frame")
+        clamped.append({**roi, 'box': box})
+    return clamped
+
+
+class Camera:
+    """
+    Base común de las cámaras: cada una pertenece a una zona y lleva sus propias métricas.
+    capture() devuelve (plano Y lores, frame BGR lores, JPEG del frame completo o None,
+    recortes BGR del frame completo, uno por región de interés).
+    Los frames lores viven en buffers de la cámara que se reescriben en la captura siguiente.
+    """
+
+    def __init__(self, name, id_zona, capture_size, lores_size, rois=None):
+        self.name = name
+        self.id_zona = id_zona
+        self.rois = clamp_rois(rois, capture_size)
+        self.capture_size = capture_size
+        self.lores_size = lores_size
+        self.lock = Lock()
+        self.metrics = {
+            'captures': 0,
+            'failures': 0,
+            'consecutive_failures': 0,
+            'inferences': 0,
+            'skipped': 0,
+            'detections': 0,
+            'lores_ms': None,
+            'main_ms': None,
+            'last_capture': None,
+            'last_error': None
+        }
+
+    def capture(self, archive=False):
+        start = time.perf_counter()
+        try:
+            gray, frame, jpeg, crops, lores_ms = self.grab(archive)
+        except Exception as e:
+            with self.lock:
+                self.metrics['failures'] += 1
+                self.metrics['consecutive_failures'] += 1
+                self.metrics['last_error'] = str(e)
+            raise
+        total_ms = (time.perf_counter() - start) * 1000
+        with self.lock:
+            self.metrics['captures'] += 1
+            self.metrics['consecutive_failures'] = 0
+            self.metrics['last_capture'] = time.time()
+            self.metrics['lores_ms'] = ewma(self.metrics['lores_ms'], lores_ms)
+            if archive:
+                self.metrics['main_ms'] = ewma(self.metrics['main_ms'], total_ms)
+        return gray, frame, jpeg, crops
+
+    def crop_rois(self, image):
+        """Recorta cada región de interés (x1, y1, x2, y2 en pixeles del frame completo) como BGR."""
+        return [image[y1:y2, x1:x2, :3].copy() for x1, y1, x2, y2 in (roi['box'] for roi in self.rois)]
+
+    def record(self, inferred, detections=0):
+        """Cuenta una inferencia (o un salto) para las métricas de esta cámara."""
+        with self.lock:
+            if inferred:
+                self.metrics['inferences'] += 1
+                self.metrics['detections'] += detections
+            else:
+                self.metrics['skipped'] += 1
+
+    def stats(self):
+        with self.lock:
+            stats = self.metrics.copy()
+        stats['id_zona'] = self.id_zona
+        stats['type'] = self.kind
+        return stats
+
+
+class CsiCamera(Camera):
+    """
+    Cámara CSI con Picamera2 en modo video: stream main para archivo y recortes de regiones
+    de interés, y lores YUV420 para inferencia del frame completo.
+    """
+
+    kind = 'csi'
+
+    def __init__(self, name, id_zona, capture_size, lores_size, camera_num=0, stream_quality=70, rois=None):
+        super().__init__(name, id_zona, capture_size, lores_size, rois)
+        from picamera2 import Picamera2
+        from libcamera import controls
+
+        self.stream_quality = stream_quality
+        # Buffer BGR reutilizado en cada captura para no reservar memoria por frame
+        self.bgr_buffer = np.empty((lores_size[1], lores_size[0], 3), dtype=np.uint8)
+        self.picam2 = Picamera2(camera_num)
+        self.picam2.configure(self.picam2.create_video_configuration(
+            main={"size": capture_size, "format": "XRGB8888"},  # Pixeles B, G, R, X como en OpenCV
+            lores={"size": lores_size, "format": "YUV420"}
+        ))
+        if "AfMode" in self.picam2.camera_controls:
+            self.picam2.set_controls({"AfMode": controls.AfModeEnum.Continuous})
+        self.picam2.start()
+
+    def grab(self, archive):
+        start = time.perf_counter()
+        request = self.picam2.capture_request()
+        try:
+            yuv = request.make_array("lores")
+            lores_ms = (time.perf_counter() - start) * 1000
+            crops = self.crop_rois(request.make_array("main")) if self.rois else []
+            jpeg = None
+            if archive:
+                buffer = io.BytesIO()
+                request.save("main", buffer, format="jpeg")
+                jpeg = buffer.getvalue()
+        finally:
+            request.release()
+        height = self.lores_size[1]
+        gray = yuv[:height].copy()
+        return gray, cv2.cvtColor(yuv, cv2.COLOR_YUV420p2BGR, dst=self.bgr_buffer), jpeg, crops, lores_ms
+
+    def stream_jpeg(self):
+        """Frame lores codificado directo desde los planos YUV420, sin pasar a RGB."""
+        width, height = self.lores_size
+        yuv = self.picam2.capture_array("lores")
+        y = yuv[:height]
+        u = yuv[height:height + height // 4].reshape(height // 2, width // 2)
+        v = yuv[height + height // 4:].reshape(height // 2, width // 2)
+        return simplejpeg.encode_jpeg_yuv_planes(y, u, v, quality=self.stream_quality)
+
+    def stop(self):
+        self.picam2.stop()
+        self.picam2.close()
+
+
+class UsbCamera(Camera):
+    """Cámara USB por V4L2 (OpenCV). El frame lores se obtiene reduciendo el frame completo."""
+
+    kind = 'usb'
+
+    def __init__(self, name, id_zona, capture_size, lores_size, device='/dev/video0', stream_quality=70, rois=None):
+        super().__init__(name, id_zona, capture_size, lores_size, rois)
+        self.stream_quality = stream_quality
+        self.device = device
+        self.capture_lock = Lock()
+        # Buffers lores reutilizados en cada captura para no reservar memoria por frame
+        self.lores_buffer = np.empty((lores_size[1], lores_size[0], 3), dtype=np.uint8)
+        self.gray_buffer = np.empty((lores_size[1], lores_size[0]), dtype=np.uint8)
+        self.video = cv2.VideoCapture(device, cv2.CAP_V4L2)
+        if not self.video.isOpened():
+            raise Exception(f"Could not open {device}")
+        self.video.set(cv2.CAP_PROP_FRAME_WIDTH, capture_size[0])
+        self.video.set(cv2.CAP_PROP_FRAME_HEIGHT, capture_size[1])
+        self.video.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Siempre el frame más nuevo
+
+    def read(self):
+        with self.capture_lock:
+            ok, frame = self.video.read()
+        if not ok:
+            raise Exception(f"Could not read a frame from {self.device}")
+        return frame
+
+    def grab(self, archive):
+        start = time.perf_counter()
+        full = self.read()
+        lores = cv2.resize(full, self.lores_size, dst=self.lores_buffer, interpolation=cv2.INTER_AREA)
+        lores_ms = (time.perf_counter() - start) * 1000
+        jpeg = cv2.imencode('.jpg', full)[1].tobytes() if archive else None
+        crops = self.crop_rois(full)
+        return cv2.cvtColor(lores, cv2.COLOR_BGR2GRAY, dst=self.gray_buffer), lores, jpeg, crops, lores_ms
+
+    def stream_jpeg(self):
+        lores = cv2.resize(self.read(), self.lores_size, interpolation=cv2.INTER_AREA)
+        return simplejpeg.encode_jpeg(lores, quality=self.stream_quality, colorspace='BGR')
+
+    def stop(self):
+        self.video.release()
+
+
+def open_camera(config, capture_size, lores_size, stream_quality=70):
+    """Crea la cámara descrita por una entrada de CAMERAS."""
+    if config['type'] == 'csi':
+        return CsiCamera(config['name'], config['id_zona'], capture_size, lores_size,
+                         config.get('camera_num', 0), stream_quality, config.get('rois'))
+    if config['type'] == 'usb':
+        return UsbCamera(config['name'], config['id_zona'], capture_size, lores_size,
+                         config.get('device', '/dev/video0'), stream_quality, config.get('rois'))
+    raise ValueError(f"Unknown camera type: {config['type']}")
@@ -0,0 +1,140 @@
+import time
+import random
+import logging
+from threading import Lock
+import metrics
+
+log = logging.getLogger('invernadero.circuit')
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+STATE_VALUES = {CLOSED: 0, OPEN: 1, HALF_OPEN: 2}
+
+CIRCUIT_STATE = metrics.Gauge('greenhouse_circuit_state', 'Circuit breaker state: 0 closed, 1 open, 2 half-open (probing)', ('circuit',))
+CIRCUIT_OPENS = metrics.Counter('greenhouse_circuit_opens_total', 'Times a circuit breaker opened', ('circuit',))
+CIRCUIT_FAILURES = metrics.Counter('greenhouse_circuit_failures_total', 'Failed attempts that reached the protected service', ('circuit',))
+CIRCUIT_REJECTED = metrics.Counter('greenhouse_circuit_rejected_total', 'Calls refused without trying because the circuit was open', ('circuit',))
+CIRCUIT_RECOVERY_SECONDS = metrics.Histogram(
+    'greenhouse_circuit_recovery_seconds', 'From the circuit opening until it closed again', ('circuit',),
+    buckets=(1, 5, 15, 30, 60, 120, 300, 900, 1800, 3600)
+)
+
+
+class CircuitOpenError(Exception):
+    """La llamada se rechazó sin intentarla: el circuito está abierto."""
+
+
+class CircuitBreaker:
+    """
+    Corta el acceso a un servicio (la base de datos) después de `failure_threshold` fallas
+    seguidas, para que los bucles no lo reintenten en cada iteración mientras está caído.
+
+    Con el circuito abierto check() lanza CircuitOpenError sin tocar la red. Pasada la espera
+    deja pasar una sola llamada de prueba (medio abierto): si sale bien el circuito se cierra,
+    si falla se vuelve a abrir con el doble de espera, hasta `backoff_max`. Cada espera se
+    sortea entre la mitad y el total del valor exponencial (jitter), así varios procesos que
+    comparten la base no reintentan todos a la vez cuando vuelve.
+
+    Thread-safe; quien usa el servicio llama a success() o failure() con el resultado de
+    cada intento que dejó pasar.
+    """
+
+    def __init__(self, name, failure_threshold=3, backoff_base=1.0, backoff_max=60.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.lock = Lock()
+        self.state = CLOSED
+        self.failures = 0       # fallas seguidas con el circuito cerrado
+        self.failed_probes = 0  # pruebas fallidas seguidas; exponente de la espera
+        self.opened_at = None
+        self.retry_at = 0.0
+        self.probe_started = 0.0
+        self.counts = {'failures': 0, 'rejected': 0, 'opens': 0, 'probes': 0}
+        self.last_recovery_s = None
+        CIRCUIT_STATE.set(0, circuit=name)
+
+    @property
+    def closed(self):
+        return self.state == CLOSED
+
+    def backoff(self):
+        delay = min(self.backoff_max, self.backoff_base * 2 ** self.failed_probes)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def set_state(self, state):
+        self.state = state
+        CIRCUIT_STATE.set(STATE_VALUES[state], circuit=self.name)
+
+    def allow(self):
+        """True si se puede intentar ahora: circuito cerrado, o la prueba después de la espera."""
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+            now = time.monotonic()
+            # Una prueba que nunca informó su resultado no deja el circuito trabado
+            if (self.state == OPEN and now >= self.retry_at) or \
+                    (self.state == HALF_OPEN and now - self.probe_started > self.backoff_max):
+                self.set_state(HALF_OPEN)
+                self.probe_started = now
+                self.counts['probes'] += 1
+                return True
+            self.counts['rejected'] += 1
+        CIRCUIT_REJECTED.inc(circuit=self.name)
+        return False
+
+    def check(self):
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} circuit open, next attempt in {self.retry_in():.1f} s")
+
+    def retry_in(self):
+        return max(0.0, self.retry_at - time.monotonic())
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            if self.state == CLOSED:
+                return
+            recovery = time.monotonic() - self.opened_at
+            probes = self.counts['probes']
+            self.set_state(CLOSED)
+            self.failed_probes = 0
+            self.opened_at = None
+            self.last_recovery_s = recovery
+        CIRCUIT_RECOVERY_SECONDS.observe(recovery, circuit=self.name)
+        log.warning("%s reachable again, circuit closed after %.1f s", self.name.capitalize(), recovery,
+                    extra={'latency_ms': round(recovery * 1000), 'count': probes})
+
+    def failure(self, error=None):
+        """Anota un intento fallido; devuelve True si el circuito quedó abierto."""
+        CIRCUIT_FAILURES.inc(circuit=self.name)
+        with self.lock:
+            self.counts['failures'] += 1
+            if self.state == OPEN:
+                return True  # llamada que pasó antes de que se abriera el circuito
+            if self.state == CLOSED:
+                self.failures += 1
+                if self.failures < self.failure_threshold:
+                    return False
+                self.opened_at = time.monotonic()
+                self.counts['opens'] += 1
+                opened = True
+            else:
+                self.failed_probes += 1
+                opened = False
+            delay = self.backoff()
+            self.retry_at = time.monotonic() + delay
+            self.set_state(OPEN)
+        if opened:
+            CIRCUIT_OPENS.inc(circuit=self.name)
+            log.error("%s unavailable after %d failures, circuit open; next attempt in %.1f s: %s",
+                      self.name.capitalize(), self.failure_threshold, delay, error,
+                      extra={'error_class': type(error).__name__})
+        else:
+            log.info("%s still unavailable, next attempt in %.1f s", self.name.capitalize(), delay)
+        return True
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counts, state=self.state, retry_in_s=round(self.retry_in(), 3) if self.state != CLOSED else 0,
+                        last_recovery_s=self.last_recovery_s)
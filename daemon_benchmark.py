@@ -0,0 +1,326 @@
+# Benchmark de punta a punta de main5 con hardware simulado (ver simulation.py): sensores,
+# relés y servo de gpiozero sobre MockFactory, y SQLite en lugar de MySQL. Corre los hilos
+# reales de sensores, base de datos y fotos con los intervalos acelerados `--speedup` veces.
+#
+# Fases:
+#   ingest    read_all_sensors + log_sensor_data sin pausa: filas por segundo
+#   reaction  escalones de temperatura con el modelo congelado: demora desde que el sensor
+#             lee el valor nuevo hasta que el relé del ventilador cambia
+#   parameters  cambios de max_temp en la tabla zona (como desde la interfaz web): segundos
+#             simulados desde el UPDATE hasta que el relé del ventilador cambia
+#   soak      los hilos de main5 durante --duration s: consultas por minuto simulado,
+#             CPU del proceso, RSS y tiempo por iteración de cada bucle
+#
+# Los resultados se comparan con BASELINE_PATH (medido en la misma máquina con --save-baseline)
+# y el script sale con código 1 si alguna métrica empeoró más que su tolerancia.
+#
+#   python daemon_benchmark.py --save-baseline          # en la Pi, sobre un árbol sano
+#   python daemon_benchmark.py                          # después de cada cambio
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import threading
+import statistics
+import simulation
+
+BASELINE_PATH = "daemon_benchmark_baseline.json"
+
+# métrica -> (mejor 'higher' o 'lower', tolerancia relativa, tolerancia absoluta)
+THRESHOLDS = {
+    'ingest_rows_per_s': ('higher', 0.15, 0),
+    'reaction_p50_ms': ('lower', 0.25, 0.5),
+    'reaction_p95_ms': ('lower', 0.50, 1.0),
+    'parameter_effect_p50_s': ('lower', 0.25, 2.0),
+    'queries_per_min': ('lower', 0.10, 1),
+    'cpu_percent': ('lower', 0.25, 1.0),
+    'rss_mb': ('lower', 0.10, 2.0),
+    'rss_growth_mb': ('lower', 0, 2.0),
+    'sensor_loop_ms': ('lower', 0.25, 0.5),
+    'database_loop_ms': ('lower', 0.25, 0.5),
+}
+
+
+class RecordingDevice:
+    """Envuelve un relé de gpiozero y anota cuándo main5 le cambia el valor."""
+
+    def __init__(self, device):
+        object.__setattr__(self, 'device', device)
+        object.__setattr__(self, 'changes', [])
+
+    def __getattr__(self, name):
+        return getattr(self.device, name)
+
+    def __setattr__(self, name, value):
+        if name == 'value':
+            self.changes.append((time.perf_counter(), bool(value)))
+        setattr(self.device, name, value)
+
+
+def rss_mb():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * resource.getpagesize() / 1024 ** 2
+
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def boot(args, workdir, zones=1):
+    """
+    Instala la simulación, importa main5 e inicializa sus componentes como lo hace main().
+    Con más de una zona los relés y servos son simulados (no entran en los pines de la Pi).
+    Devuelve (main5, {id_zona: Greenhouse}, Database, CameraService).
+    """
+    os.environ.setdefault('INVERNADERO_LOG_LEVEL', 'WARNING')
+    import logging_setup
+    logging_setup.setup_logging(level=os.environ['INVERNADERO_LOG_LEVEL'], log_dir=workdir, console=False)
+
+    configs = simulation.zone_configs(zones)
+    greenhouses = {
+        config['id_zona']: simulation.Greenhouse(speedup=args.speedup, seed=args.seed + config['id_zona'],
+                                                 dht_failure_rate=args.dht_failures, device_latency=args.device_latency)
+        for config in configs
+    }
+    database, cameras = simulation.install(
+        greenhouses, os.path.join(workdir, 'invernadero.db'), args.query_latency,
+        zone={'db_update_time': max(1, round(60 / args.speedup))}, zones=configs,
+        gpio='mock' if zones == 1 else 'simulated'
+    )
+    import main5
+    main5.configure_zones(configs)
+
+    main5.SENSOR_READ_INTERVAL = 5 / args.speedup
+    main5.ACTUATOR_CHECK_INTERVAL = 1 / args.speedup
+    main5.PARAMS_CHECK_INTERVAL = 5 / args.speedup
+    main5.DETECTION_FLUSH_INTERVAL = 60 / args.speedup
+    main5.error_log.window = 60 / args.speedup
+    main5.error_log.fallback_path = os.path.join(workdir, 'error_log.jsonl')
+
+    main5.setup_database()
+    main5.update_env_parameters()
+    main5.setup_soil_sensor()
+    main5.setup_hardware()
+    first = main5.zone_ids[0]
+    main5.zone_devices[first]['rele2'] = RecordingDevice(main5.zone_devices[first]['rele2'])
+    main5.error_log.start()
+    for id_zona, greenhouse in greenhouses.items():
+        devices = main5.zone_devices[id_zona]
+        greenhouse.actuators = lambda devices=devices: {
+            'fan': devices['rele2'].value,
+            'humidifier': devices['rele3'].value,
+            'irrigation': devices['riego'].value is not None and devices['riego'].value > -1
+        }
+    return main5, greenhouses, database, cameras
+
+
+def ingest_phase(main5, seconds):
+    iterations = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        values = main5.read_all_sensors()
+        main5.log_sensor_data(values)
+        iterations += 1
+    elapsed = time.perf_counter() - start
+    return {'ingest_rows_per_s': iterations * main5.current_values.size / elapsed}
+
+
+def start_threads(main5):
+    main5.running = True
+    threads = [
+        threading.Thread(target=main5.sensor_reading_thread, name="sensor", daemon=True),
+        threading.Thread(target=main5.database_update_thread, name="database", daemon=True),
+        threading.Thread(target=main5.photo_capture_thread, name="photo", daemon=True),
+    ]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def reaction_phase(main5, greenhouse, steps):
+    """Escalones de temperatura de la primera zona alrededor de max_temp; mide sensor leído -> relé del ventilador."""
+    first = main5.zone_ids[0]
+    fan_relay = main5.zone_devices[first]['rele2']
+    greenhouse.frozen = True
+    max_temp = main5.env_parameters[first]['max_temp']
+    timeout = 20 * main5.SENSOR_READ_INTERVAL
+    latencies, totals = [], []
+    for step in range(steps):
+        fan_on = step % 2 == 0
+        changes = len(fan_relay.changes)
+        stepped_at = time.perf_counter()
+        greenhouse.set(air_temperature=max_temp + 5 if fan_on else max_temp - 5)
+        while time.perf_counter() - stepped_at < timeout:
+            new = [change for change in fan_relay.changes[changes:] if change[1] == fan_on]
+            if new:
+                changed_at = new[0][0]
+                read_at = greenhouse.reads.get('air_temperature', stepped_at)
+                latencies.append((changed_at - max(read_at, stepped_at)) * 1000)
+                totals.append((changed_at - stepped_at) * 1000)
+                break
+            time.sleep(0.001)
+        else:
+            # Estado anterior ya igual al pedido (p. ej. el primer escalón) o el bucle no reaccionó
+            continue
+    greenhouse.frozen = False
+    if not latencies:
+        raise Exception("The fan relay never reacted to a temperature step")
+    return {
+        'reaction_p50_ms': statistics.median(latencies),
+        'reaction_p95_ms': percentile(latencies, 0.95),
+        'reaction_total_p50_ms': statistics.median(totals),
+        'reaction_steps': len(latencies)
+    }
+
+
+def parameter_phase(main5, database, greenhouse, speedup, steps):
+    """
+    Con la temperatura fija en max_temp, baja y vuelve a subir max_temp en la base: cada
+    cambio tiene que prender o apagar el ventilador. Mide desde el UPDATE hasta el relé, en
+    segundos simulados (la demora real depende de PARAMS_CHECK_INTERVAL y SENSOR_READ_INTERVAL).
+    """
+    first = main5.zone_ids[0]
+    fan_relay = main5.zone_devices[first]['rele2']
+    max_temp = main5.env_parameters[first]['max_temp']
+    timeout = 20 * max(main5.PARAMS_CHECK_INTERVAL, main5.SENSOR_READ_INTERVAL)
+    greenhouse.frozen = True
+    greenhouse.set(air_temperature=max_temp)
+    delays = []
+    for step in range(steps):
+        fan_on = step % 2 == 0
+        changes = len(fan_relay.changes)
+        changed_at = time.perf_counter()
+        database.set_zone(first, max_temp=max_temp - 5 if fan_on else max_temp)
+        while time.perf_counter() - changed_at < timeout:
+            new = [change for change in fan_relay.changes[changes:] if change[1] == fan_on]
+            if new:
+                delays.append((new[0][0] - changed_at) * speedup)
+                break
+            time.sleep(0.001)
+    database.set_zone(first, max_temp=max_temp)
+    greenhouse.frozen = False
+    if not delays:
+        raise Exception("The fan relay never reacted to a max_temp change")
+    return {
+        'parameter_effect_p50_s': statistics.median(delays),
+        'parameter_effect_max_s': max(delays),
+        'parameter_steps': len(delays)
+    }
+
+
+def soak_phase(main5, database, speedup, duration):
+    import profiling
+    before = database.snapshot()
+    cpu_before = cpu_seconds()
+    rss_start = rss_mb()
+    rss_samples = [rss_start]
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        time.sleep(1)
+        rss_samples.append(rss_mb())
+    elapsed = time.perf_counter() - start
+    after = database.snapshot()
+    loops = profiling.loops()
+    simulated_minutes = elapsed * speedup / 60
+    return {
+        'queries_per_min': (after['round_trips'] - before['round_trips']) / simulated_minutes,
+        'rows_per_min': (after['rows_written'] - before['rows_written']) / simulated_minutes,
+        'cpu_percent': (cpu_seconds() - cpu_before) / elapsed * 100,
+        'rss_mb': max(rss_samples),
+        'rss_growth_mb': rss_samples[-1] - rss_start,
+        'sensor_loop_ms': loops.get('sensor', {}).get('avg_wall_s', 0) * 1000,
+        'database_loop_ms': loops.get('database', {}).get('avg_wall_s', 0) * 1000,
+        'queries_by_statement': {
+            statement: (count - before['by_statement'].get(statement, 0)) / simulated_minutes
+            for statement, count in after['by_statement'].items()
+        }
+    }
+
+
+def compare(results, baseline):
+    """Lista de (métrica, actual, base, límite, empeoró) para las métricas con umbral."""
+    rows = []
+    for name, (better, relative, absolute) in THRESHOLDS.items():
+        if name not in results or name not in baseline:
+            continue
+        value, base = results[name], baseline[name]
+        if better == 'higher':
+            limit = base * (1 - relative) - absolute
+            regressed = value < limit
+        else:
+            limit = base * (1 + relative) + absolute
+            regressed = value > limit
+        rows.append((name, value, base, limit, regressed))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end main5 benchmark on simulated hardware")
+    parser.add_argument('--duration', type=float, default=60, help="soak phase length (s)")
+    parser.add_argument('--ingest-seconds', type=float, default=5)
+    parser.add_argument('--steps', type=int, default=20, help="temperature steps in the reaction phase")
+    parser.add_argument('--parameter-steps', type=int, default=6, help="max_temp changes in the parameters phase")
+    parser.add_argument('--speedup', type=float, default=20, help="simulated seconds per real second")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--dht-failures', type=float, default=0.05, help="fraction of DHT11 reads that fail")
+    parser.add_argument('--device-latency', type=float, default=0.0, help="seconds per simulated device read")
+    parser.add_argument('--query-latency', type=float, default=0.0, help="seconds per simulated database round trip")
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="invernadero-bench-")
+    main5, greenhouses, database, cameras = boot(args, workdir)
+
+    results = ingest_phase(main5, args.ingest_seconds)
+    threads = start_threads(main5)
+    results.update(reaction_phase(main5, greenhouses[main5.zone_ids[0]], args.steps))
+    results.update(parameter_phase(main5, database, greenhouses[main5.zone_ids[0]], args.speedup, args.parameter_steps))
+    results.update(soak_phase(main5, database, args.speedup, args.duration))
+    main5.running = False
+    for thread in threads:
+        thread.join(timeout=10)
+    main5.error_log.stop()
+    results['settings'] = {'speedup': args.speedup, 'duration': args.duration, 'seed': args.seed,
+                           'dht_failures': args.dht_failures, 'device_latency': args.device_latency,
+                           'query_latency': args.query_latency}
+
+    print("-" * 80)
+    for name, value in results.items():
+        if isinstance(value, float):
+            print(f"{name:<24} {value:12.2f}")
+    print(f"queries per simulated minute by statement: "
+          f"{ {statement: round(count, 1) for statement, count in results['queries_by_statement'].items()} }")
+    print(f"work files in {workdir}")
+    print("-" * 80)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        sys.exit(0)
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline on a known-good tree first")
+        sys.exit(0)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get('settings') != results['settings']:
+        print(f"Warning: baseline was measured with {baseline.get('settings')}")
+    rows = compare(results, baseline)
+    for name, value, base, limit, regressed in rows:
+        print(f"{name:<24} {value:12.2f}  baseline {base:12.2f}  limit {limit:12.2f}  {'REGRESSED' if regressed else 'ok'}")
+    regressions = [row[0] for row in rows if row[4]]
+    if regressions:
+        print(f"Regressions: {', '.join(regressions)}")
+        sys.exit(1)
+    print("No regressions")
@@ -0,0 +1,179 @@
+# Inyección de fallas de la base: arranca main5 con hardware y base simulados (ver
+# simulation.py y daemon_benchmark.py), corre sus hilos, corta la base durante --outage
+# segundos simulados (Database.available = False) y la vuelve a levantar. Mide:
+#
+#   wasted_attempts   conexiones y consultas que fallaron contra la base caída
+#   rejected          llamadas que el circuito rechazó sin tocar la red
+#   errors_logged     registros WARNING o peores de main5 durante el corte
+#   cpu_percent       CPU del proceso durante el corte
+#   recover_s         desde que vuelve la base hasta la primera consulta que anda (s simulados)
+#   replay_s          hasta que las filas guardadas en memoria durante el corte están en la base
+#   outage_rows       filas de sensor_temperatura fechadas durante el corte / las esperadas
+#
+# Corre dos veces, cada una en su propio proceso: con el circuito de main5 y con un umbral
+# infinito (el circuito nunca se abre y cada llamada intenta la base, como antes). Sale con
+# código 1 si con circuito se desperdician tantos intentos como sin él, si se perdieron filas
+# del corte o si la recuperación tardó más que DB_RETRY_MAX.
+#
+#   python db_outage_benchmark.py
+#   python db_outage_benchmark.py --outage 1800 --speedup 60
+import os
+import sys
+import json
+import math
+import time
+import sqlite3
+import logging
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+import daemon_benchmark
+
+MODES = ('breaker', 'no-breaker')
+RECOVERY_SLACK = 5  # s simulados por encima de DB_RETRY_MAX: una vuelta del bucle de la base y la consulta
+
+
+class CountingHandler(logging.Handler):
+    """Cuenta los registros WARNING o peores que llegan al logger de main5."""
+
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+
+
+def outage_rows(path, start, end):
+    connection = sqlite3.connect(path)
+    try:
+        return connection.execute("SELECT COUNT(*) FROM sensor_temperatura WHERE fecha_hora BETWEEN ? AND ?",
+                                  (start.isoformat(' '), end.isoformat(' '))).fetchone()[0]
+    finally:
+        connection.close()
+
+
+def run_child(args):
+    """Un modo: corte de args.outage s simulados con los hilos de main5 corriendo."""
+    workdir = tempfile.mkdtemp(prefix=f"invernadero-outage-{args.child}-")
+    main5, greenhouses, database, cameras = daemon_benchmark.boot(args, workdir)
+    breaker = main5.db_breaker
+    breaker.backoff_base = main5.DB_RETRY_BASE / args.speedup
+    breaker.backoff_max = main5.DB_RETRY_MAX / args.speedup
+    if args.child == 'no-breaker':
+        breaker.failure_threshold = math.inf
+    counter = CountingHandler()
+    logging.getLogger('invernadero').addHandler(counter)
+
+    threads = daemon_benchmark.start_threads(main5)
+    time.sleep(args.warmup / args.speedup)
+
+    # Corte
+    before = database.snapshot()
+    rejected_before = breaker.stats()['rejected']
+    counter.count = 0
+    cpu_before = daemon_benchmark.cpu_seconds()
+    outage_start = datetime.now()
+    database.available = False
+    start = time.perf_counter()
+    time.sleep(args.outage / args.speedup)
+    outage_seconds = time.perf_counter() - start
+    during = database.snapshot()
+    cpu_percent = (daemon_benchmark.cpu_seconds() - cpu_before) / outage_seconds * 100
+    errors_logged = counter.count
+    buffered = main5.buffered_rows
+    outage_end = datetime.now()
+
+    # Vuelta de la base: primera consulta que anda y buffer vacío
+    database.available = True
+    restored = time.perf_counter()
+    deadline = restored + (3 * main5.DB_RETRY_MAX + 60) / args.speedup
+    recovered = replayed = None
+    while time.perf_counter() < deadline and replayed is None:
+        now = time.perf_counter()
+        if recovered is None and database.snapshot()['round_trips'] > during['round_trips']:
+            recovered = now
+        if recovered is not None and not main5.write_buffer:
+            replayed = now
+        time.sleep(0.001)
+
+    main5.running = False
+    for thread in threads:
+        thread.join(timeout=10)
+    main5.error_log.stop()
+
+    db_update_time = main5.env_parameters[main5.zone_ids[0]]['db_update_time']
+    wasted = during['refused'] - before['refused']
+    return {
+        'mode': args.child,
+        'wasted_attempts': wasted,
+        'attempts_per_min': wasted / (outage_seconds * args.speedup / 60),
+        'rejected': breaker.stats()['rejected'] - rejected_before,
+        'errors_logged': errors_logged,
+        'cpu_percent': cpu_percent,
+        'recover_s': None if recovered is None else (recovered - restored) * args.speedup,
+        'replay_s': None if replayed is None else (replayed - restored) * args.speedup,
+        'buffered_rows': buffered,
+        'dropped_rows': main5.DB_BUFFER_DROPPED.values.get((), 0),
+        'outage_rows': outage_rows(database.path, outage_start, outage_end),
+        'expected_rows': int(outage_seconds // db_update_time),
+        'retry_max_s': main5.DB_RETRY_MAX,
+    }
+
+
+def fmt(value, digits=1):
+    return "never" if value is None else f"{value:.{digits}f}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="main5 behaviour while the database is down and after it returns")
+    parser.add_argument('--outage', type=float, default=300, help="outage length in simulated seconds")
+    parser.add_argument('--warmup', type=float, default=30, help="simulated seconds before the outage")
+    parser.add_argument('--speedup', type=float, default=20, help="simulated seconds per real second")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--dht-failures', type=float, default=0.05, help="fraction of DHT11 reads that fail")
+    parser.add_argument('--device-latency', type=float, default=0.0, help="seconds per simulated device read")
+    parser.add_argument('--query-latency', type=float, default=0.0, help="seconds per simulated database round trip")
+    parser.add_argument('--child', choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args)))
+        sys.exit(0)
+
+    options = ['--outage', str(args.outage), '--warmup', str(args.warmup), '--speedup', str(args.speedup),
+               '--seed', str(args.seed), '--dht-failures', str(args.dht_failures),
+               '--device-latency', str(args.device_latency), '--query-latency', str(args.query_latency)]
+    results = {}
+    print(f"{'mode':<11} {'wasted':>7} {'per min':>8} {'rejected':>9} {'errors':>7} {'cpu %':>6} "
+          f"{'recover s':>10} {'replay s':>9} {'buffered':>9} {'dropped':>8} {'outage rows':>12}")
+    for mode in MODES:
+        child = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', mode] + options,
+                               capture_output=True, text=True)
+        if child.returncode != 0:
+            print(child.stderr)
+            sys.exit(f"Outage run '{mode}' failed")
+        result = json.loads(child.stdout.strip().splitlines()[-1])
+        results[mode] = result
+        print(f"{mode:<11} {result['wasted_attempts']:>7} {result['attempts_per_min']:>8.1f} {result['rejected']:>9} "
+              f"{result['errors_logged']:>7} {result['cpu_percent']:>6.1f} {fmt(result['recover_s']):>10} "
+              f"{fmt(result['replay_s']):>9} {result['buffered_rows']:>9} {result['dropped_rows']:>8} "
+              f"{result['outage_rows']:>5}/{result['expected_rows']:<6}")
+
+    breaker, baseline = results['breaker'], results['no-breaker']
+    failures = []
+    if breaker['wasted_attempts'] >= baseline['wasted_attempts']:
+        failures.append(f"the circuit did not reduce wasted attempts ({breaker['wasted_attempts']} "
+                        f"vs {baseline['wasted_attempts']})")
+    if breaker['recover_s'] is None or breaker['recover_s'] > breaker['retry_max_s'] + RECOVERY_SLACK:
+        failures.append(f"recovery took {fmt(breaker['recover_s'])} s (limit {breaker['retry_max_s'] + RECOVERY_SLACK} s)")
+    if breaker['replay_s'] is None or breaker['dropped_rows'] or breaker['outage_rows'] < breaker['expected_rows']:
+        failures.append(f"rows written during the outage were lost ({breaker['outage_rows']} of "
+                        f"{breaker['expected_rows']} reached the database, {breaker['dropped_rows']} dropped)")
+    if failures:
+        for failure in failures:
+            print(failure)
+        sys.exit(1)
+    print(f"Circuit breaker: {breaker['wasted_attempts']} wasted attempts instead of {baseline['wasted_attempts']}, "
+          f"recovered in {breaker['recover_s']:.1f} s, no rows lost")
@@ -0,0 +1,154 @@
+import json
+import logging
+from datetime import datetime
+from threading import Thread, Lock, Event
+import mysql.connector
+import metrics
+from circuit_breaker import CircuitOpenError
+
+log = logging.getLogger('invernadero.errors')
+
+ERRORS_REPORTED = metrics.Counter('greenhouse_errors_reported_total', 'Errors reported to the error log', ('component',))
+# Errores de conexión: solo estos cuentan en el circuito de la base (igual que en main5). Un
+# error de esquema (p. ej. falta aplicar sql/errores.sql) no dice nada de si la base está arriba
+CONNECTION_ERRORS = (mysql.connector.OperationalError, mysql.connector.InterfaceError)
+
+ERROR_LOG_ROWS = metrics.Counter('greenhouse_error_log_rows_total', 'Aggregated error rows written', ('destination',))
+
+
+class ErrorLog:
+    """
+    Registro de errores asíncrono para sensor_error_log.
+    report() solo agrega el mensaje a un diccionario en memoria: los errores repetidos de un
+    mismo componente se juntan en una fila con cantidad, primera y última vez, y un hilo
+    propio los inserta en lote cada `window` segundos con su propia conexión a la base.
+    Si la base no responde, el lote va a un archivo local (una línea JSON por fila) y la
+    conexión se vuelve a abrir en la ventana siguiente; nunca se usa la conexión del llamador.
+    Con `breaker` (el CircuitBreaker de la base) los errores de conexión cuentan en el mismo
+    circuito y, mientras está abierto, el lote va directo al archivo sin intentar conectarse;
+    cualquier otro error solo se registra y el lote va al archivo igual.
+    """
+
+    def __init__(self, db_config, id_zona=1, window=60, fallback_path="error_log.jsonl", max_pending=1000,
+                 breaker=None):
+        self.db_config = db_config
+        self.id_zona = id_zona
+        self.window = window
+        self.fallback_path = fallback_path
+        self.max_pending = max_pending
+        self.breaker = breaker
+        self.lock = Lock()
+        self.pending = {}
+        self.dropped = 0
+        self.connection = None
+        self.stop_event = Event()
+        self.thread = None
+
+    def report(self, component, message, id_zona=None):
+        """
+        Anota un error sin bloquear ni tocar la base (se puede llamar con db_lock tomado).
+        id_zona es la zona del sensor; sin zona se usa la del registro.
+        """
+        now = datetime.now()
+        key = (component, self.id_zona if id_zona is None else id_zona, message)
+        ERRORS_REPORTED.inc(component=component)
+        with self.lock:
+            entry = self.pending.get(key)
+            if entry is not None:
+                entry['count'] += 1
+                entry['last_seen'] = now
+            elif len(self.pending) < self.max_pending:
+                self.pending[key] = {'count': 1, 'first_seen': now, 'last_seen': now}
+            else:
+                self.dropped += 1
+
+    def start(self):
+        self.thread = Thread(target=self.run, name="error-log", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Detiene el hilo y escribe lo que quede pendiente."""
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=self.window + 10)
+        self.flush()
+        if self.connection:
+            try:
+                self.connection.close()
+            except Exception:
+                pass
+
+    def run(self):
+        while not self.stop_event.wait(self.window):
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            batch = self.pending
+            self.pending = {}
+            dropped, self.dropped = self.dropped, 0
+        if dropped:
+            batch[('Sistema', self.id_zona, f"{dropped} error messages dropped (error log full)")] = {
+                'count': dropped, 'first_seen': datetime.now(), 'last_seen': datetime.now()
+            }
+        if not batch:
+            return
+
+        rows = [
+            (component, id_zona, message, entry['count'], entry['first_seen'], entry['last_seen'])
+            for (component, id_zona, message), entry in batch.items()
+        ]
+        try:
+            if self.breaker is not None:
+                self.breaker.check()
+            self.write_database(rows)
+            if self.breaker is not None:
+                self.breaker.success()
+            ERROR_LOG_ROWS.inc(len(rows), destination='database')
+        except CircuitOpenError:
+            self.write_fallback(rows)
+            ERROR_LOG_ROWS.inc(len(rows), destination='file')
+        except Exception as e:
+            if self.breaker is not None:
+                if isinstance(e, CONNECTION_ERRORS):
+                    self.breaker.failure(e)
+                elif isinstance(e, mysql.connector.Error):
+                    self.breaker.success()  # la base respondió; solo rechazó el INSERT
+            log.warning("Could not write the error log to the database, writing %d rows to %s: %s", len(rows),
+                        self.fallback_path, e, extra={'count': len(rows), 'error_class': type(e).__name__})
+            self.connection = None
+            self.write_fallback(rows)
+            ERROR_LOG_ROWS.inc(len(rows), destination='file')
+
+    def write_database(self, rows):
+        if self.connection is None or not self.connection.is_connected():
+            self.connection = mysql.connector.connect(**self.db_config, connection_timeout=5)
+        cursor = self.connection.cursor()
+        try:
+            cursor.executemany("""
+                INSERT INTO sensor_error_log
+                (nombre_sensor, id_zona, mensaje_error, repeticiones, primera_vez, ultima_vez)
+                VALUES (%s, %s, %s, %s, %s, %s)
+            """, rows)
+            self.connection.commit()
+        finally:
+            cursor.close()
+
+    def write_fallback(self, rows):
+        try:
+            with open(self.fallback_path, 'a') as f:
+                for component, id_zona, message, count, first_seen, last_seen in rows:
+                    f.write(json.dumps({
+                        'nombre_sensor': component,
+                        'id_zona': id_zona,
+                        'mensaje_error': message,
+                        'repeticiones': count,
+                        'primera_vez': first_seen.isoformat(),
+                        'ultima_vez': last_seen.isoformat()
+                    }) + '\n')
+        except OSError as e:
+            log.error("Could not write error log fallback %s: %s", self.fallback_path, e)
+
+    def stats(self):
+        with self.lock:
+            return {'pending': len(self.pending), 'dropped': self.dropped}
@@ -0,0 +1,151 @@
+import os
+import time
+import logging
+from collections import deque
+from threading import Condition, Thread
+from PIL import Image
+
+log = logging.getLogger('invernadero.archive')
+
+# Sufijo de los archivos ya decimados y recomprimidos
+DECIMATED_SUFFIX = "_lo.jpg"
+
+
+class ImageArchive:
+    """
+    Archivo de imágenes de un directorio con presupuesto de bytes.
+    Las imágenes de las últimas full_res_hours horas se guardan tal cual; las más viejas
+    se deciman a una cada decimate_seconds y se recomprimen (más chicas y con menos calidad).
+    Si aun así se pasa de byte_budget se borran las más antiguas.
+    El índice vive en memoria (colas ordenadas por tiempo), así que cada add() es O(1)
+    amortizado: cada archivo se degrada una vez y se borra una vez, sin volver a listar el directorio.
+    La recompresión la hace un hilo propio fuera del lock: add() y scan() solo encolan las
+    imágenes vencidas, así la captura no espera a PIL ni el arranque recomprime todo lo atrasado.
+    """
+
+    def __init__(self, directory, byte_budget, full_res_hours=24, decimate_seconds=1800,
+                 quality=60, scale=0.5):
+        self.directory = directory
+        self.byte_budget = byte_budget
+        self.full_res_seconds = full_res_hours * 3600
+        self.decimate_seconds = decimate_seconds
+        self.quality = quality
+        self.scale = scale
+        self.lock = Condition()
+        self.recent = deque()   # (timestamp, path, bytes) a resolución completa
+        self.pending = deque()  # (timestamp, path, bytes) vencidas, esperando al hilo de degradación
+        self.older = deque()    # (timestamp, path, bytes) decimadas y recomprimidas
+        self.total_bytes = 0
+        self.scan()
+        Thread(target=self.demote_thread, name=f"archive-{os.path.basename(directory)}", daemon=True).start()
+
+    def scan(self):
+        """Construye el índice una sola vez al arrancar a partir de lo que ya hay en disco."""
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".jpg") and os.path.isfile(path):
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, path, stat.st_size))
+        entries.sort()
+        with self.lock:
+            for entry in entries:
+                (self.older if entry[1].endswith(DECIMATED_SUFFIX) else self.recent).append(entry)
+                self.total_bytes += entry[2]
+            self.enforce(time.time())
+
+    def add(self, path, timestamp=None):
+        """Registra una imagen nueva y aplica la política de retención."""
+        timestamp = timestamp or time.time()
+        size = os.path.getsize(path)
+        with self.lock:
+            # Misma ruta que la anterior (dos capturas en el mismo segundo): se sobrescribió el archivo
+            if self.recent and self.recent[-1][1] == path:
+                self.total_bytes -= self.recent.pop()[2]
+            self.recent.append((timestamp, path, size))
+            self.total_bytes += size
+            self.enforce(timestamp)
+
+    def latest(self):
+        """Ruta de la imagen más reciente, o None si el archivo está vacío."""
+        with self.lock:
+            if self.recent:
+                return self.recent[-1][1]
+            if self.pending:
+                return self.pending[-1][1]
+            if self.older:
+                return self.older[-1][1]
+            return None
+
+    def stats(self):
+        with self.lock:
+            return {
+                'full_res_images': len(self.recent),
+                'pending_demotion': len(self.pending),
+                'decimated_images': len(self.older),
+                'bytes': self.total_bytes,
+                'byte_budget': self.byte_budget
+            }
+
+    def enforce(self, now):
+        """Encola lo que salió de la ventana de resolución completa y recorta hasta el presupuesto."""
+        cutoff = now - self.full_res_seconds
+        if self.recent and self.recent[0][0] < cutoff:
+            while self.recent and self.recent[0][0] < cutoff:
+                self.pending.append(self.recent.popleft())
+            self.lock.notify()
+        self.trim()
+
+    def trim(self):
+        # Nunca se borra la imagen más reciente
+        while self.total_bytes > self.byte_budget and (self.older or self.pending or len(self.recent) > 1):
+            queue = self.older or self.pending or self.recent
+            self.remove(queue.popleft())
+
+    def demote_thread(self):
+        """Pasa las imágenes vencidas al tramo decimado, de a una y en orden: se descartan o se recomprimen."""
+        while True:
+            with self.lock:
+                self.lock.wait_for(lambda: self.pending)
+                entry = self.pending[0]
+                if self.older and entry[0] - self.older[-1][0] < self.decimate_seconds:
+                    self.remove(self.pending.popleft())
+                    continue
+
+            decimated = self.recompress(entry)
+
+            with self.lock:
+                if not self.pending or self.pending[0] is not entry:
+                    # El presupuesto la borró mientras se recomprimía
+                    if decimated:
+                        os.remove(decimated[1])
+                    continue
+                self.remove(self.pending.popleft())
+                if decimated:
+                    self.older.append(decimated)
+                    self.total_bytes += decimated[2]
+                    self.trim()
+
+    def recompress(self, entry):
+        """Guarda la versión chica de una imagen; devuelve su entrada del índice, o None si falló."""
+        timestamp, path, size = entry
+        decimated_path = path[:-len(".jpg")] + DECIMATED_SUFFIX
+        try:
+            with Image.open(path) as image:
+                width, height = image.size
+                image = image.convert("RGB").resize((int(width * self.scale), int(height * self.scale)))
+                image.save(decimated_path, "JPEG", quality=self.quality)
+            # Conservar la hora original para que el índice se reconstruya en orden al reiniciar
+            os.utime(decimated_path, (timestamp, timestamp))
+            return timestamp, decimated_path, os.path.getsize(decimated_path)
+        except Exception as e:
+            log.error("Could not recompress %s: %s", path, e, extra={'error_class': type(e).__name__})
+            return None
+
+    def remove(self, entry):
+        _, path, size = entry
+        self.total_bytes -= size
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
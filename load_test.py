@@ -0,0 +1,275 @@
+# Prueba de carga local para el servicio de cámara (yolo_sender.py) y la API de sensores (main5.py).
+# Modo http: cada cliente reutiliza una conexión keep-alive y pide los endpoints en ronda;
+# reporta requests/s y latencias p50/p95/p99 por endpoint.
+# Modo api: lo mismo contra los endpoints de sensores servidos desde memoria (puerto 5001).
+# Modo stream: abre muchos clientes contra /stream y reporta los fps que recibe cada uno; los que
+# pasan del tope del servidor reciben 503. Mientras tanto pide los demás endpoints para comprobar
+# que los streams no se quedan con todos los hilos de waitress.
+# Modo events: abre muchos clientes contra /api/events (SSE); con --slow algunos leen despacio
+# para comprobar que no frenan a los demás. Igual que en modo stream, los que pasan del tope
+# reciben 503 y se sondean los endpoints cortos de la API mientras tanto.
+#
+#   python load_test.py --mode http --clients 32 --duration 30
+#   python load_test.py --mode http --conditional          # clientes que mandan If-None-Match
+#   python load_test.py --mode api --url http://127.0.0.1:5001 --clients 32
+#   python load_test.py --mode stream --clients 50 --source raw --fps 5
+#   python load_test.py --mode events --url http://127.0.0.1:5001 --clients 12 --slow 2
+import argparse
+import http.client
+import statistics
+import time
+from threading import Thread
+from urllib.parse import urlparse
+
+HTTP_ENDPOINTS = ['/latest-capture', '/latest-processed', '/stats']
+STREAM_PROBE_ENDPOINTS = ['/latest-capture', '/stats', '/metrics']
+EVENTS_PROBE_ENDPOINTS = ['/api/values', '/api/events/stats', '/metrics']
+STREAM_PROBE_DELAY = 2           # Segundos para que los streams se conecten antes de empezar a sondear
+API_ENDPOINTS = ['/api/values', '/api/actuators', '/api/parameters', '/api/history?minutes=10']
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def http_client(base_url, endpoints, duration, conditional, results, index):
+    """Pide los endpoints en ronda sobre una sola conexión keep-alive y guarda las latencias."""
+    parsed = urlparse(base_url)
+    latencies = {endpoint: [] for endpoint in endpoints}
+    statuses = {}
+    etags = {}
+    errors = []
+    conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=30)
+    end = time.time() + duration
+    i = 0
+    while time.time() < end:
+        endpoint = endpoints[i % len(endpoints)]
+        i += 1
+        headers = {}
+        if conditional and endpoint in etags:
+            headers['If-None-Match'] = etags[endpoint]
+        start = time.perf_counter()
+        try:
+            conn.request('GET', endpoint, headers=headers)
+            response = conn.getresponse()
+            response.read()
+        except Exception as e:
+            errors.append(f"{endpoint}: {e}")
+            conn.close()
+            conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=30)
+            continue
+        latencies[endpoint].append((time.perf_counter() - start) * 1000)
+        statuses[response.status] = statuses.get(response.status, 0) + 1
+        if response.getheader('ETag'):
+            etags[endpoint] = response.getheader('ETag')
+    conn.close()
+    results[index] = (latencies, statuses, errors)
+
+def http_test(base_url, endpoints, clients, duration, conditional):
+    results = [None] * clients
+    threads = [
+        Thread(target=http_client, args=(base_url, endpoints, duration, conditional, results, i))
+        for i in range(clients)
+    ]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+
+    statuses = {}
+    errors = []
+    for _, client_statuses, client_errors in results:
+        for status, count in client_statuses.items():
+            statuses[status] = statuses.get(status, 0) + count
+        errors.extend(client_errors)
+
+    print("-" * 72)
+    print(f"HTTP {clients} keep-alive clients, {elapsed:.1f} s, conditional={conditional}")
+    width = max(20, max(len(endpoint) for endpoint in endpoints) + 2)
+    print(f"{'endpoint':<{width}}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    total = 0
+    for endpoint in endpoints:
+        latencies = [latency for client_latencies, _, _ in results for latency in client_latencies[endpoint]]
+        total += len(latencies)
+        if not latencies:
+            print(f"{endpoint:<{width}}{'-':>10}")
+            continue
+        print(f"{endpoint:<{width}}{len(latencies) / elapsed:>10.1f}"
+              f"{percentile(latencies, 0.50):>10.1f}{percentile(latencies, 0.95):>10.1f}"
+              f"{percentile(latencies, 0.99):>10.1f}{max(latencies):>10.1f}")
+    print(f"{'total':<{width}}{total / elapsed:>10.1f}")
+    print(f"Status codes     {dict(sorted(statuses.items()))}")
+    print(f"Errors           {len(errors)}")
+    for error in sorted(set(errors))[:10]:
+        print(f"  {error}")
+    print("-" * 72)
+
+def start_probe(base_url, endpoints, duration):
+    """Un cliente que pide endpoints cortos mientras los streams están conectados."""
+    probe = [None]
+    prober = Thread(target=http_client, args=(base_url, endpoints, max(1.0, duration - 2 * STREAM_PROBE_DELAY),
+                                              False, probe, 0))
+    time.sleep(STREAM_PROBE_DELAY)
+    prober.start()
+    return prober, probe
+
+def print_probe(probe, endpoints):
+    latencies, statuses, errors = probe[0]
+    print(f"Other endpoints while streaming, status codes {dict(sorted(statuses.items()))}")
+    for endpoint in endpoints:
+        if latencies[endpoint]:
+            print(f"  {endpoint:<18} {len(latencies[endpoint]):>5} requests   "
+                  f"p95 {percentile(latencies[endpoint], 0.95):.1f} ms   max {max(latencies[endpoint]):.1f} ms")
+        else:
+            print(f"  {endpoint:<18} no response")
+    for error in sorted(set(errors))[:10]:
+        print(f"  {error}")
+
+def read_mjpeg_frames(url, duration, results, index):
+    """Lee partes multipart de /stream durante duration segundos y guarda cuántos frames llegaron."""
+    parsed = urlparse(url)
+    frames = 0
+    received = 0
+    try:
+        conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=30)
+        conn.request('GET', f"{parsed.path}?{parsed.query}")
+        response = conn.getresponse()
+        if response.status == 503:
+            conn.close()
+            results[index] = (0, 0, 'rejected')
+            return
+        if response.status != 200:
+            raise Exception(f"HTTP {response.status}")
+
+        end = time.time() + duration
+        while time.time() < end:
+            # Cabeceras de la parte: --frame, Content-Type, Content-Length, línea vacía
+            length = None
+            while True:
+                line = response.readline()
+                if not line:
+                    raise Exception("stream closed by server")
+                line = line.strip()
+                if line.lower().startswith(b'content-length:'):
+                    length = int(line.split(b':')[1])
+                elif not line and length is not None:
+                    break
+            received += len(response.read(length))
+            frames += 1
+        conn.close()
+        results[index] = (frames, received, None)
+    except Exception as e:
+        results[index] = (frames, received, str(e))
+
+def stream_test(base_url, clients, duration, source, fps):
+    url = f"{base_url}/stream?source={source}&fps={fps}"
+    results = [None] * clients
+    threads = [Thread(target=read_mjpeg_frames, args=(url, duration, results, i)) for i in range(clients)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    prober, probe = start_probe(base_url, STREAM_PROBE_ENDPOINTS, duration)
+    for thread in threads:
+        thread.join()
+    prober.join()
+    elapsed = time.time() - start
+
+    served = [result for result in results if result[2] != 'rejected']
+    rejected = clients - len(served)
+    client_fps = [frames / duration for frames, _, _ in served]
+    errors = [error for _, _, error in served if error]
+    total_bytes = sum(received for _, received, _ in served)
+
+    print("-" * 60)
+    print(f"Stream {source} at {fps} fps, {clients} clients, {elapsed:.1f} s")
+    print(f"Served / 503     {len(served)} / {rejected}")
+    if client_fps:
+        print(f"Per-client fps   min {min(client_fps):.2f}   mean {statistics.mean(client_fps):.2f}   max {max(client_fps):.2f}")
+    print(f"Total throughput {total_bytes / elapsed / 1024:.0f} KiB/s")
+    print(f"Errors           {len(errors)}")
+    for error in sorted(set(errors)):
+        print(f"  {error}")
+    print_probe(probe, STREAM_PROBE_ENDPOINTS)
+    print("-" * 60)
+
+def read_events(url, duration, delay, results, index):
+    """Cuenta los eventos SSE recibidos; delay simula un cliente lento entre lectura y lectura."""
+    parsed = urlparse(url)
+    events = 0
+    try:
+        conn = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=30)
+        conn.request('GET', parsed.path)
+        response = conn.getresponse()
+        if response.status == 503:
+            conn.close()
+            results[index] = (0, 'rejected')
+            return
+        if response.status != 200:
+            raise Exception(f"HTTP {response.status}")
+        end = time.time() + duration
+        while time.time() < end:
+            line = response.readline()
+            if not line:
+                raise Exception("stream closed by server")
+            if line.startswith(b'event:'):
+                events += 1
+                time.sleep(delay)
+        conn.close()
+        results[index] = (events, None)
+    except Exception as e:
+        results[index] = (events, str(e))
+
+def events_test(base_url, clients, duration, slow):
+    url = f"{base_url}/api/events"
+    results = [None] * clients
+    threads = [
+        Thread(target=read_events, args=(url, duration, 2.0 if i < slow else 0.0, results, i))
+        for i in range(clients)
+    ]
+    for thread in threads:
+        thread.start()
+    prober, probe = start_probe(base_url, EVENTS_PROBE_ENDPOINTS, duration)
+    for thread in threads:
+        thread.join()
+    prober.join()
+
+    rejected = sum(1 for _, error in results if error == 'rejected')
+    fast = [events for events, error in results[slow:] if error != 'rejected']
+    errors = [error for _, error in results if error and error != 'rejected']
+    print("-" * 60)
+    print(f"Events {clients} clients ({slow} slow), {duration:.1f} s")
+    print(f"Served / 503     {clients - rejected} / {rejected}")
+    if fast:
+        print(f"Events per fast client   min {min(fast)}   mean {statistics.mean(fast):.1f}   max {max(fast)}")
+    if slow:
+        print(f"Events per slow client   {[events for events, _ in results[:slow]]}")
+    print(f"Errors           {len(errors)}")
+    for error in sorted(set(errors)):
+        print(f"  {error}")
+    print_probe(probe, EVENTS_PROBE_ENDPOINTS)
+    print("-" * 60)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test for the camera service and the sensor API")
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--mode', default='http', choices=['http', 'api', 'stream', 'events'])
+    parser.add_argument('--conditional', action='store_true', help="send If-None-Match with the last ETag")
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--source', default='raw', choices=['raw', 'processed'])
+    parser.add_argument('--fps', type=float, default=5)
+    parser.add_argument('--slow', type=int, default=0, help="events mode: clients that read one event every 2 s")
+    args = parser.parse_args()
+
+    try:
+        if args.mode == 'http':
+            http_test(args.url, HTTP_ENDPOINTS, args.clients, args.duration, args.conditional)
+        elif args.mode == 'api':
+            http_test(args.url, API_ENDPOINTS, args.clients, args.duration, args.conditional)
+        elif args.mode == 'events':
+            events_test(args.url, args.clients, args.duration, args.slow)
+        else:
+            stream_test(args.url, args.clients, args.duration, args.source, args.fps)
+    except KeyboardInterrupt:
+        print("\nLoad test stopped by user")
@@ -0,0 +1,127 @@
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+from datetime import datetime
+import metrics
+
+LOG_DIR = "logs"
+LOG_FILE = "invernadero.log"
+LOG_MAX_BYTES = 5 * 1024 ** 2     # Tamaño de cada archivo antes de rotar
+LOG_BACKUPS = 5                   # Archivos rotados que se conservan
+LOG_QUEUE_SIZE = 10000            # Registros en espera; si se llena se descartan en vez de bloquear
+LOG_LEVEL = os.environ.get('INVERNADERO_LOG_LEVEL', 'INFO')
+ROOT_LOGGER = 'invernadero'
+
+# Campos estructurados que se copian al JSON cuando vienen en extra={...}
+STRUCTURED_FIELDS = ('zone', 'sensor', 'actuator', 'camera', 'operation', 'latency_ms', 'error_class', 'count')
+
+listener = None
+dropped_records = 0
+metrics.Gauge('greenhouse_log_records_dropped', 'Log records dropped because the log queue was full',
+              function=lambda: dropped_records)
+
+
+class JsonFormatter(logging.Formatter):
+    """Una línea JSON por registro: hora, nivel, componente (logger), hilo, mensaje y campos extra."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'component': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage()
+        }
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_text:
+            entry['traceback'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Encola el registro para el hilo de escritura y vuelve enseguida. El mensaje se arma acá
+    (los argumentos pueden cambiar después), pero el formateo y la escritura a disco o a la
+    consola los hace el QueueListener. Con la cola llena se descarta el registro.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            if getattr(record, 'error_class', None) is None:
+                record.error_class = record.exc_info[0].__name__
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        global dropped_records
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            dropped_records += 1
+
+
+def setup_logging(level=LOG_LEVEL, log_dir=LOG_DIR, console=True):
+    """
+    Configura el logger 'invernadero': archivo JSON rotativo en log_dir y, con console=True,
+    líneas de texto por stderr (systemd les agrega la hora). Se puede llamar más de una vez.
+    """
+    global listener
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel(level)
+    if listener is not None:
+        return root
+
+    os.makedirs(log_dir, exist_ok=True)
+    file_handler = logging.handlers.RotatingFileHandler(
+        os.path.join(log_dir, LOG_FILE), maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS
+    )
+    file_handler.setFormatter(JsonFormatter())
+    handlers = [file_handler]
+    if console:
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(logging.Formatter('%(levelname)s %(name)s: %(message)s'))
+        handlers.append(console_handler)
+
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    root.addHandler(DroppingQueueHandler(log_queue))
+    root.propagate = False
+    return root
+
+
+def stop_logging():
+    """Vacía la cola y cierra los archivos (al apagar el servicio)."""
+    global listener
+    if listener is not None:
+        listener.stop()
+        listener = None
+
+
+def set_level(name, level):
+    """Cambia en caliente el nivel de un logger (p. ej. 'invernadero.sensors.modbus', 'DEBUG')."""
+    if name != ROOT_LOGGER and not name.startswith(ROOT_LOGGER + '.'):
+        raise ValueError(f"Logger must be under '{ROOT_LOGGER}'")
+    level = level.upper()
+    if level not in ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL', 'NOTSET'):
+        raise ValueError(f"Unknown level: {level}")
+    logging.getLogger(name).setLevel(level)
+
+
+def levels():
+    """Nivel configurado de cada logger del servicio (NOTSET hereda del padre)."""
+    names = [ROOT_LOGGER] + sorted(
+        name for name in logging.root.manager.loggerDict if name.startswith(ROOT_LOGGER + '.')
+    )
+    return {name: logging.getLevelName(logging.getLogger(name).level) for name in names}
@@ -1,19 +1,66 @@
 import time
+PROCESS_START = time.perf_counter()  # startup breakdown: imports are measured from here
+import json
+import math
+import hashlib
+import logging
 import board
 import adafruit_dht
 import gpiozero
 import mysql.connector
 import minimalmodbus
-from datetime import datetime
-from threading import Lock
+import numpy as np
+from datetime import datetime, timezone
+from threading import Lock, Condition
+from collections import deque
+from flask import Flask, Response, jsonify, request
 import busio
 import adafruit_ads1x15.ads1115 as ADS
 from adafruit_ads1x15.analog_in import AnalogIn
-from yolo_sender import capture_and_process
+import metrics
+import profiling
+from sensor_registry import SensorRegistry, REGISTRY_PATH
+from error_log import ErrorLog
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from logging_setup import setup_logging, stop_logging, set_level, levels
+
+# Logging has to be configured before yolo_sender is imported (it logs from import and init_vision)
+setup_logging()
+log = logging.getLogger('invernadero.control')
+sensor_log = logging.getLogger('invernadero.sensors')
+db_log = logging.getLogger('invernadero.db')
+actuator_log = logging.getLogger('invernadero.actuators')
+camera_log = logging.getLogger('invernadero.camera')
+
+from yolo_sender import init_vision, vision_status, capture_and_process, next_capture_interval, start_http_server, stop_camera_service, MIN_CAPTURE_INTERVAL, MAX_CAPTURE_INTERVAL
 
 # Configurable intervals (in seconds)
 SENSOR_READ_INTERVAL = 5
 ACTUATOR_CHECK_INTERVAL = 1
+PARAMS_CHECK_INTERVAL = 5  # checksum of the zona rows; the thresholds are re-read only when it changes
+
+# Startup: components initialise concurrently, each loop starts as soon as what it needs is
+# ready. STARTUP_TIMEOUTS are reporting deadlines, not limits on a setup call: the startup
+# summary waits that long for each control component and reports the ones not up yet as
+# unavailable (degraded mode). They keep being retried in the background, and a setup call
+# that hangs is not interrupted; each driver bounds its own calls (e.g. the Modbus serial timeout)
+STARTUP_TIMEOUTS = {'database': 30, 'soil': 30, 'hardware': 30}
+CONTROL_COMPONENTS = ('database', 'soil', 'hardware')  # the startup summary waits for these
+COMPONENT_RETRY_BASE = 5    # seconds before retrying a component that failed, doubled after each failure
+COMPONENT_RETRY_MAX = 300
+DB_FAILURE_THRESHOLD = 3  # consecutive failed database operations that open the circuit
+DB_RETRY_BASE = 1         # seconds before the first reconnect attempt once open, doubled (with jitter) per failure
+DB_RETRY_MAX = 30
+MAX_BUFFERED_ROWS = 20000  # sensor and actuator rows kept in memory while the database is down
+REJECTED_ROWS_FILE = 'rejected_rows.jsonl'  # rows the database refused (missing table, bad data), never retried
+
+# Live REST API served from memory (dashboards read here instead of querying MySQL)
+API_PORT = 5001
+API_THREADS = 16    # every client connected to /api/events holds one of these threads
+MAX_EVENT_CLIENTS = 12  # /api/events clients at once; the other threads stay free for short requests
+HISTORY_SIZE = 720  # read cycles kept for /api/history (one hour at SENSOR_READ_INTERVAL = 5)
+EVENT_QUEUE_SIZE = 50  # events buffered per /api/events client; the oldest are dropped when full
+EVENT_KEEPALIVE = 15   # seconds between keep-alive comments on an idle event stream
 
 # Database configuration
 db_config = {
@@ -23,76 +70,235 @@ db_config = {
     'database': 'INVERNADERO'
 }
 
-# Global sensor values with thread safety
-values_lock = Lock()
-current_values = {
-    'air_temperature': None,
-    'air_humidity': None,
-    'soil_temperature': None,
-    'soil_moisture': None,
-    'soil_ph': None,
-    'light_intensity' : None
-}
+# Zones run by this controller, each with its own sensors, actuators and `zona` row.
+# Sensor devices in sensors.json take their per-zone wiring from these keys: dht_pin is a
+# board pin name; the photoresistor is read on light_channel of the ADS1115 at ads_address
+# (zones can share one ADS1115); every Modbus sensor sits on the RS485 bus at MODBUS_PORT
+# with its own address. Relays and the irrigation servo are GPIO numbers.
+MODBUS_PORT = '/dev/ttyUSB0'
+ZONES = [
+    {'id_zona': 1, 'dht_pin': 'D4', 'ads_address': 0x49, 'light_channel': 'P0', 'modbus_address': 1,
+     'lamp_pin': 27, 'fan_pin': 22, 'humidifier_pin': 23, 'servo_pin': 12},
+]
 
-# Cache for last valid readings
-last_valid_values = {
-    'air_temperature': 25.0,
-    'air_humidity': 50.0,
-    'soil_temperature': 25.0,
-    'soil_moisture': 50.0,
-    'soil_ph': 7.0,
-    'light_intensity' : 50.0
-}
+# Sensor devices and channels (driver, address, scale, calibration, valid range, table)
+# come from sensors.json; see sensor_registry.py
+SENSORS = SensorRegistry.load(REGISTRY_PATH)
+SENSOR_NAMES = SENSORS.names
+SENSOR_COLUMN = SENSORS.column
+DEFAULT_VALUES = SENSORS.defaults  # reading returned for a sensor that has not answered yet
+SENSOR_TABLES = SENSORS.tables     # table and row name; the zone is appended to the name (Sensor_Temp_Aire_Z1)
 
-# Global actuator states with cache for state tracking
-actuator_states = {
-    'rele1': False,  # Lamp relay
-    'rele2': False,  # Fan relay
-    'rele3': False,  # Humidifier relay
-    'riego': False   # valve servo
-}
+ACTUATORS = ('rele1', 'rele2', 'rele3', 'riego')  # lamp, fan, humidifier relays and irrigation valve servo
+ACTUATOR_TABLES = {actuator: f'actuador_{actuator}' for actuator in ACTUATORS}
 
-actuator_states_cache = {
-    'rele1': None,
-    'rele2': None,
-    'rele3': None,
-    'riego': None
-}
+# Automatic control: (actuator, reading, zona parameter, on when the reading is above it)
+CONTROL_RULES = (
+    ('rele2', 'air_temperature', 'max_temp', True),            # fan
+    ('rele3', 'air_humidity', 'min_air_humidity', False),      # humidifier
+    ('riego', 'soil_moisture', 'min_soil_moisture', False)     # irrigation
+)
+RULE_SENSORS = [SENSOR_COLUMN[sensor] for _, sensor, _, _ in CONTROL_RULES]
+RULE_ACTUATORS = [ACTUATORS.index(actuator) for actuator, _, _, _ in CONTROL_RULES]
+RULE_ABOVE = np.array([above for _, _, _, above in CONTROL_RULES])
+RULE_DEVICES = [SENSORS.channels[SENSOR_COLUMN[sensor]]['device'] for _, sensor, _, _ in CONTROL_RULES]
+RELAY_PINS = {'rele1': 'lamp_pin', 'rele2': 'fan_pin', 'rele3': 'humidifier_pin'}
 
-# Environmental control parameters (will be updated from database)
-env_parameters = {
+# Environmental control parameters of a zone until they are read from the database
+DEFAULT_PARAMETERS = {
     'max_temp': 30.0,
     'min_air_humidity': 50.0,
     'min_soil_moisture': 30.0,
-    'db_update_time': 60  # Default 5 minutes in seconds
+    'db_update_time': 60  # seconds
 }
 
-# Global device objects
-soil_sensor = None
+# Per-zone state, built by configure_zones. Array rows follow zone_ids; values_lock guards
+# the readings and the history. thresholds and env_parameters are replaced as a whole when
+# the parameters are reloaded, so readers only need to take the reference once.
+values_lock = Lock()
+zone_configs = []
+zone_ids = []
+zone_index = {}              # id_zona -> array row
+zone_devices = {}            # id_zona -> {sensor device name (sensors.json), 'rele1', 'rele2', 'rele3', 'riego'}
+current_values = None        # (zones, sensors) latest valid reading, NaN until the sensor first answers
+last_valid_values = None     # (zones, sensors) returned when a read fails
+actuator_states_cache = None # (zones, actuators) physical state: 1.0 on, 0.0 off, NaN unknown
+env_parameters = {}          # id_zona -> zona parameters, as served on /api/parameters
+thresholds = None            # (zones, rules) parameter compared by each CONTROL_RULES entry
+parameters_checksum = None   # (rows, checksum) of the zona rows behind env_parameters
+parameters_checked = None    # perf_counter of the last check that found the zona rows unchanged
+parameters_changed = None    # (thresholds, parameters_checked) of a reload until the control loop applies it
+actuator_states_query = None
+rule_enabled = None          # (zones, rules) True once the rule's sensor device and actuator are open
+
+# Recent readings for /api/history: ring buffer of HISTORY_SIZE read cycles, one row per cycle
+history_times = None         # (HISTORY_SIZE,) unix time of each row, NaN while unused
+history_values = None        # (HISTORY_SIZE, zones, sensors)
+history_next = 0
+
+def configure_zones(zones):
+    """Build the per-zone state for `zones` (entries like ZONES); devices are set up later."""
+    global zone_configs, zone_ids, zone_index, zone_devices, current_values, last_valid_values
+    global actuator_states_cache, env_parameters, thresholds, actuator_states_query, rule_enabled
+    global history_times, history_values, history_next
+    zone_configs = list(zones)
+    zone_ids = [zone['id_zona'] for zone in zone_configs]
+    zone_index = {id_zona: row for row, id_zona in enumerate(zone_ids)}
+    zone_devices = {id_zona: {} for id_zona in zone_ids}
+    current_values = np.full((len(zone_ids), len(SENSOR_NAMES)), np.nan)
+    last_valid_values = np.tile([DEFAULT_VALUES[name] for name in SENSOR_NAMES], (len(zone_ids), 1))
+    actuator_states_cache = np.full((len(zone_ids), len(ACTUATORS)), np.nan)
+    env_parameters = {id_zona: DEFAULT_PARAMETERS.copy() for id_zona in zone_ids}
+    thresholds = parameter_thresholds(env_parameters)
+    actuator_states_query = latest_actuator_states_query(len(zone_ids))
+    rule_enabled = np.zeros((len(zone_ids), len(CONTROL_RULES)), dtype=bool)
+    history_times = np.full(HISTORY_SIZE, np.nan)
+    history_values = np.full((HISTORY_SIZE, len(zone_ids), len(SENSOR_NAMES)), np.nan)
+    history_next = 0
+
+def parameter_thresholds(parameters):
+    return np.array([[parameters[id_zona][parameter] for _, _, parameter, _ in CONTROL_RULES] for id_zona in zone_ids],
+                    dtype=float).reshape(len(zone_ids), len(CONTROL_RULES))
+
+def zone_placeholders():
+    return ', '.join(['%s'] * len(zone_ids))
+
+def latest_actuator_states_query(zone_count):
+    """One query for the latest row of every actuator table in every zone (params: zone_ids per table)."""
+    placeholders = ', '.join(['%s'] * zone_count)
+    return " UNION ALL ".join(f"""
+        SELECT '{actuator}' AS actuador, t.id_zona, t.estado
+        FROM {table} t
+        JOIN (SELECT id_zona, MAX(fecha_hora) AS fecha_hora
+              FROM {table}
+              WHERE id_zona IN ({placeholders})
+              GROUP BY id_zona) latest
+          ON t.id_zona = latest.id_zona AND t.fecha_hora = latest.fecha_hora""" for actuator, table in ACTUATOR_TABLES.items())
+
+def zone_values(values):
+    """(zones, sensors) array as {id_zona: {sensor: value or None}}, for the API and the database."""
+    return {
+        id_zona: {name: None if math.isnan(value) else value for name, value in zip(SENSOR_NAMES, row)}
+        for id_zona, row in zip(zone_ids, values.tolist())
+    }
+
+def actuator_snapshot():
+    with values_lock:
+        states = actuator_states_cache.tolist()
+    return {
+        id_zona: {actuator: None if math.isnan(state) else bool(state) for actuator, state in zip(ACTUATORS, row)}
+        for id_zona, row in zip(zone_ids, states)
+    }
+
+configure_zones(ZONES)
+
+# Prebuilt JSON responses for the API: name -> (body, etag, last modified).
+# publish_snapshot replaces the whole tuple, so readers never need a lock.
+api_snapshots = {}
+
+# Server-Sent Events: one bounded deque per connected client. publish_snapshot appends the
+# already-encoded event to every deque; a full deque drops its oldest event, so a slow
+# client only loses updates and never blocks the thread that produced them.
+events_condition = Condition()
+event_subscribers = []
+event_stats = {
+    'published': 0,
+    'dropped': 0,
+    'rejected': 0
+}
+
+# Every database access goes through one circuit breaker: after DB_FAILURE_THRESHOLD failures
+# in a row the loops stop trying and only one probe goes out per backoff period
+db_breaker = CircuitBreaker('database', DB_FAILURE_THRESHOLD, DB_RETRY_BASE, DB_RETRY_MAX)
+# Errors that mean the database is unreachable: they open the circuit and buffered writes are
+# retried. Anything else (a missing table, bad data) would fail the same way on every retry
+CONNECTION_ERRORS = (mysql.connector.OperationalError, mysql.connector.InterfaceError, CircuitOpenError)
+
+# Errors are aggregated per component and message and written once per window,
+# through their own connection; a local file takes them while the database is down
+ERROR_LOG_WINDOW = 60  # seconds
+ERROR_LOG_FALLBACK = 'error_log.jsonl'
+error_log = ErrorLog(db_config, id_zona=zone_ids[0], window=ERROR_LOG_WINDOW, fallback_path=ERROR_LOG_FALLBACK,
+                     breaker=db_breaker)
+
+# Sensor and actuator inserts that could not be written, replayed in order once the database is back
+write_buffer_lock = Lock()
+write_buffer = deque()  # (statement, rows)
+buffered_rows = 0
+
+# Capture results waiting to be written to the database in one batch
+DETECTION_FLUSH_INTERVAL = 60  # seconds
+MAX_PENDING_CAPTURES = 500
+detections_lock = Lock()
+pending_captures = []
+
+# Instrumentation, exported in Prometheus text format on /metrics (see metrics.py)
+SENSOR_READS = metrics.Counter('greenhouse_sensor_reads_total', 'Sensor reads by outcome', ('sensor', 'result'))
+SENSOR_READ_SECONDS = metrics.Histogram('greenhouse_sensor_read_seconds', 'Sensor read latency', ('sensor',))
+DB_QUERY_SECONDS = metrics.Histogram('greenhouse_db_query_seconds', 'Database operation latency, including db_lock wait', ('operation',))
+DB_ERRORS = metrics.Counter('greenhouse_db_errors_total', 'Failed database operations', ('operation',))
+PARAMETER_RELOADS = metrics.Counter('greenhouse_parameter_reloads_total', 'zona parameters re-read after their checksum changed')
+PARAMETER_APPLY_SECONDS = metrics.Histogram(
+    'greenhouse_parameter_apply_seconds',
+    'From the last check that saw the old zona parameters to the first control check using the new ones',
+    buckets=(0.5, 1, 2.5, 5, 10, 15, 30, 60, 120, 300)
+)
+ACTUATOR_CHANGES = metrics.Counter('greenhouse_actuator_changes_total', 'Actuator state changes', ('actuator', 'state'))
+STARTUP_SECONDS = metrics.Gauge('greenhouse_startup_seconds', 'Seconds from process start until a component or loop was ready', ('component',))
+LOOP_LATENESS = metrics.Histogram('greenhouse_loop_lateness_seconds', 'Delay past the scheduled start of a loop iteration', ('loop',))
+metrics.Gauge('greenhouse_pending_captures', 'Capture results waiting for the next database flush', function=lambda: len(pending_captures))
+metrics.Gauge('greenhouse_db_buffered_rows', 'Rows waiting in memory for the database to come back', function=lambda: buffered_rows)
+DB_BUFFER_DROPPED = metrics.Counter('greenhouse_db_buffer_dropped_rows_total', 'Buffered rows dropped because the buffer was full')
+DB_REJECTED_ROWS = metrics.Counter('greenhouse_db_rejected_rows_total', f'Rows the database refused, saved to {REJECTED_ROWS_FILE}')
+metrics.Gauge('greenhouse_event_clients', 'Connected /api/events clients', function=lambda: len(event_subscribers))
+COMPONENT_AVAILABLE = metrics.Gauge('greenhouse_component_available', 'Component initialised (1) or unavailable and being retried (0)', ('component',))
+COMPONENT_RETRIES = metrics.Counter('greenhouse_component_retries_total', 'Failed initialisation attempts of a component', ('component',))
+DEVICE_AVAILABLE = metrics.Gauge('greenhouse_device_available', 'Sensor or actuator device open (1) or missing (0)', ('zone', 'device'))
+metrics.Gauge('greenhouse_control_rules_enabled', 'Zone control rules whose sensor and actuator are available',
+              function=lambda: int(rule_enabled.sum()))
+
+# Global database connection; sensor and actuator objects live in zone_devices
 db_connection = None
-dht_device = None
-lamp_relay = None
-fan_relay = None
-humidifier_relay = None
-irrigation_servo = None
-light_sensor = None
 
 
-def setup_soil_sensor():
-    """Initialize Modbus soil sensor (JXBS-3001-TR)"""
-    global soil_sensor
+def open_device(id_zona, name, open_func):
+    """
+    Open one device of a zone into zone_devices unless it is already open. A device that
+    fails is left out (its readings and rules stay off) and opened again on the next call.
+    Returns True when the device is available.
+    """
+    if zone_devices[id_zona].get(name) is not None:
+        return True
     try:
-        soil_sensor = minimalmodbus.Instrument('/dev/ttyUSB0', 1)
-        soil_sensor.serial.baudrate = 9600
-        soil_sensor.serial.bytesize = 8
-        soil_sensor.serial.parity = 'N'
-        soil_sensor.serial.stopbits = 1
-        soil_sensor.serial.timeout = 1
-        print("Soil sensor initialized successfully")
-        return soil_sensor
+        zone_devices[id_zona][name] = open_func()
+        DEVICE_AVAILABLE.set(1, zone=id_zona, device=name)
+        return True
     except Exception as e:
-        print(f"Error initializing soil sensor: {e}")
-        return None
+        DEVICE_AVAILABLE.set(0, zone=id_zona, device=name)
+        log.error("Error initializing %s of zone %d: %s", name, id_zona, e,
+                  extra={'sensor': name, 'zone': id_zona, 'error_class': type(e).__name__})
+        return False
+
+def open_modbus_instrument(name, zone):
+    instrument = minimalmodbus.Instrument(MODBUS_PORT, SENSORS.device_parameter(name, 'address', zone))
+    instrument.serial.baudrate = 9600
+    instrument.serial.bytesize = 8
+    instrument.serial.parity = 'N'
+    instrument.serial.stopbits = 1
+    instrument.serial.timeout = 1
+    return instrument
+
+def setup_soil_sensor():
+    """
+    Initialize the Modbus sensors of sensors.json (the JXBS-3001-TR soil sensor), one address
+    per zone on the shared RS485 bus. Returns True once every instrument is open.
+    """
+    results = [
+        open_device(zone['id_zona'], name, lambda name=name, zone=zone: open_modbus_instrument(name, zone))
+        for zone in zone_configs for name in SENSORS.devices_for('modbus')
+    ]
+    refresh_control_rules()
+    return all(results)
 
 def setup_database():
     """Initialize database connection"""
@@ -100,755 +306,1250 @@ def setup_database():
     try:
         db_connection = mysql.connector.connect(**db_config)
         if db_connection.is_connected():
-            print("Database connection established successfully")
+            db_log.info("Database connection established successfully")
             return db_connection
     except mysql.connector.Error as e:
-        print(f"Error connecting to database: {e}")
+        db_log.error("Error connecting to database: %s", e, extra={'error_class': type(e).__name__})
         return None
 
-#sets up dht11 sensor and relays, and servo
+# I2C bus and ADS1115 ADCs, opened with the first device that needs them (zones can share an ADC)
+i2c = None
+adcs = {}
+
+def ads1115(address):
+    global i2c
+    if i2c is None:
+        i2c = busio.I2C(board.SCL, board.SDA)
+    if address not in adcs:
+        adcs[address] = ADS.ADS1115(i2c, address=address)
+    return adcs[address]
+
+def open_hardware_device(zone, name):
+    """Open one GPIO or I2C device of a zone: a DHT11 or ADS1115 device of sensors.json, a relay or the servo."""
+    if name in RELAY_PINS:
+        # active_high=False for active-low relay modules
+        return gpiozero.OutputDevice(zone[RELAY_PINS[name]], active_high=False, initial_value=False)
+    if name == 'riego':
+        # Servo for irrigation, starting at 0 position
+        servo = gpiozero.Servo(zone['servo_pin'])
+        try:
+            servo.min()
+        except Exception:
+            servo.close()
+            raise
+        return servo
+    if SENSORS.devices[name]['driver'] == 'dht11':
+        return adafruit_dht.DHT11(getattr(board, SENSORS.device_parameter(name, 'pin', zone)))
+    adc = ads1115(SENSORS.device_parameter(name, 'address', zone))
+    return AnalogIn(adc, getattr(ADS, SENSORS.device_parameter(name, 'channel', zone)))
+
+#sets up dht11 sensors, light sensors, relays and servos of every zone
 def setup_hardware():
-    """Initialize GPIO devices (sensors and actuators)"""
-    global dht_device, lamp_relay, fan_relay, humidifier_relay, irrigation_servo, light_sensor
+    """
+    Initialize GPIO and I2C devices (sensors and actuators) of every zone, each one on its
+    own: the devices that open are used right away, the rest are retried on the next call.
+    Returns True once every device is open.
+    """
+    names = SENSORS.devices_for('dht11', 'ads1115') + list(RELAY_PINS) + ['riego']
+    results = [
+        open_device(zone['id_zona'], name, lambda name=name, zone=zone: open_hardware_device(zone, name))
+        for zone in zone_configs for name in names
+    ]
+    refresh_control_rules()
+    return all(results)
+
+def setup_vision():
+    """
+    Open the cameras and load the model (init_vision skips what is already open). The photo
+    loop starts as soon as the model is loaded, with the cameras that opened; returns True
+    once every camera is open, so the missing ones keep being retried.
+    """
+    ready = init_vision()
+    status = vision_status()
+    for name, camera in status['cameras'].items():
+        DEVICE_AVAILABLE.set(int(camera['open']), zone=camera['id_zona'], device=f'camera_{name}')
+    with startup_lock:
+        photo_started = 'photo' in startup['loops']
+    if status['model'] and not photo_started:
+        start_loop(photo_capture_thread, "photo")
+    return ready is not None
+
+def refresh_control_rules():
+    """Enable the control rules of every zone whose sensor device and actuator are open."""
+    global rule_enabled
+    enabled = np.array([
+        [zone_devices[id_zona].get(device) is not None and zone_devices[id_zona].get(actuator) is not None
+         for (actuator, _, _, _), device in zip(CONTROL_RULES, RULE_DEVICES)]
+        for id_zona in zone_ids
+    ], dtype=bool).reshape(len(zone_ids), len(CONTROL_RULES))
+    rows, rules = np.nonzero(enabled & ~rule_enabled)
+    if len(rows):
+        actuator_log.info("Control rules enabled: %s", ", ".join(
+            f"zone {zone_ids[row]} {CONTROL_RULES[rule][0]} from {CONTROL_RULES[rule][1]}"
+            for row, rule in zip(rows.tolist(), rules.tolist())
+        ), extra={'count': len(rows)})
+    rule_enabled = enabled
+
+db_lock = Lock()
+
+def database_connection():
+    """
+    The shared connection, reconnected if it dropped, for a caller holding db_lock. Raises
+    CircuitOpenError without touching the network while the circuit is open or before
+    setup_database first connected.
+    """
+    if db_connection is None:
+        raise CircuitOpenError("Database not connected yet")
+    db_breaker.check()
+    if not db_connection.is_connected():
+        db_connection.reconnect(attempts=1, delay=0)
+    return db_connection
+
+def database_error(operation, error_msg, e):
+    """
+    Record a failed database operation. Calls refused by the open circuit are not errors.
+    Connection errors count towards opening it and are logged only while it is still closed,
+    so an outage leaves a few errors and the circuit transitions instead of one error per loop
+    iteration. Any other error is always logged and leaves the circuit alone.
+    """
+    if isinstance(e, CircuitOpenError):
+        return
+    DB_ERRORS.inc(operation=operation)
+    logged = True
+    if isinstance(e, CONNECTION_ERRORS):
+        logged = db_breaker.closed
+        db_breaker.failure(e)
+    elif isinstance(e, mysql.connector.Error):
+        # The server answered, only this statement was refused
+        db_breaker.success()
+    if logged:
+        db_log.error(error_msg, extra={'operation': operation, 'error_class': type(e).__name__})
+        log_error('Sistema', error_msg)
+    else:
+        db_log.debug(error_msg, extra={'operation': operation, 'error_class': type(e).__name__})
+
+def rollback(e):
+    """Roll back a failed transaction, unless the circuit refused it before it started."""
+    if not isinstance(e, CircuitOpenError) and db_connection.is_connected():
+        db_connection.rollback()
+
+def buffer_writes(writes):
+    """
+    Keep (statement, rows) inserts for the next write_rows. Past MAX_BUFFERED_ROWS the oldest
+    are dropped: after a long outage the latest readings are the ones worth keeping.
+    """
+    global buffered_rows
+    dropped = 0
+    with write_buffer_lock:
+        write_buffer.extend(writes)
+        buffered_rows += sum(len(rows) for _, rows in writes)
+        while buffered_rows > MAX_BUFFERED_ROWS:
+            _, rows = write_buffer.popleft()
+            buffered_rows -= len(rows)
+            dropped += len(rows)
+    if dropped:
+        DB_BUFFER_DROPPED.inc(dropped)
+        db_log.warning("Write buffer full, dropped the oldest %d rows", dropped, extra={'count': dropped})
+
+def reject_rows(operation, statement, rows, e):
+    """Rows the database refused for a reason other than an outage: logged and saved to REJECTED_ROWS_FILE, not retried."""
+    statement = " ".join(statement.split())
+    DB_REJECTED_ROWS.inc(len(rows))
+    database_error(operation, f"Database rejected {len(rows)} rows ({statement.split('(')[0].strip()}): {e}", e)
     try:
-        # Initialize DHT11 sensor
-        dht_device = adafruit_dht.DHT11(board.D4)
+        with open(REJECTED_ROWS_FILE, 'a') as f:
+            f.write(json.dumps({'time': datetime.now().isoformat(), 'statement': statement, 'error': str(e),
+                                'rows': rows}, default=str) + '\n')
+    except OSError as error:
+        db_log.error("Could not write rejected rows to %s: %s", REJECTED_ROWS_FILE, error)
 
-        # Initialize ADS1115 ADC
-        i2c = busio.I2C(board.SCL, board.SDA)
-        ads = ADS.ADS1115(i2c, address=0x49)
-        light_sensor = AnalogIn(ads, ADS.P0)
-        
-        # Initialize relays (active_high=False for active-low relay modules)
-        lamp_relay = gpiozero.OutputDevice(27, active_high=False, initial_value=False)
-        fan_relay = gpiozero.OutputDevice(22, active_high=False, initial_value=False)
-        humidifier_relay = gpiozero.OutputDevice(23, active_high=False, initial_value=False)
-        
-        # Initialize servo for irrigation
-        irrigation_servo = gpiozero.Servo(12)
-        # Ensure servo starts at 0 position
-        irrigation_servo.min()
-        
-        print("Hardware devices initialized successfully")
-        return (dht_device, lamp_relay, fan_relay, humidifier_relay, irrigation_servo)
+def execute_writes(writes):
+    """Run (statement, rows) inserts in one transaction; rolled back if any fails. Caller holds db_lock."""
+    cursor = None
+    try:
+        connection = database_connection()
+        cursor = connection.cursor()
+        for statement, rows in writes:
+            cursor.executemany(statement, rows)
+        connection.commit()
     except Exception as e:
-        print(f"Error initializing hardware: {e}")
-        return (None, None, None, None, None)
+        rollback(e)
+        raise
+    finally:
+        if cursor:
+            cursor.close()
+    db_breaker.success()
 
-db_lock = Lock()
+def write_rows(operation, description, writes):
+    """
+    Insert (statement, rows) pairs after the buffered ones, so rows reach the database in
+    order, in one transaction. While the database is unreachable they all go (back) to the
+    buffer. If the database refuses one of them, each statement is retried in its own
+    transaction and only the refused ones are dropped (see reject_rows), so a bad batch never
+    holds back the rest. Returns True when every row was written.
+    """
+    global buffered_rows
+    with db_lock:
+        # Only taken and refilled under db_lock, so concurrent writers keep their order
+        with write_buffer_lock:
+            pending = list(write_buffer)
+            write_buffer.clear()
+            replayed, buffered_rows = buffered_rows, 0
+        pending.extend(writes)
+        if not pending:
+            return True
+        try:
+            execute_writes(pending)
+        except CONNECTION_ERRORS as e:
+            buffer_writes(pending)
+            database_error(operation, f"Error logging {description}: {e}", e)
+            return False
+        except Exception:
+            written = True
+            for index, (statement, rows) in enumerate(pending):
+                try:
+                    execute_writes([(statement, rows)])
+                except CONNECTION_ERRORS as e:
+                    buffer_writes(pending[index:])
+                    database_error(operation, f"Error logging {description}: {e}", e)
+                    return False
+                except Exception as e:
+                    reject_rows(operation, statement, rows, e)
+                    written = False
+            return written
+    if replayed:
+        db_log.info("Wrote %d rows buffered while the database was unavailable", replayed, extra={'count': replayed})
+    return True
+
+def zona_checksum(cursor):
+    """(rows, checksum) of the zona parameters of every zone; one primary key lookup. Caller holds db_lock."""
+    cursor.execute(f"""
+        SELECT COUNT(*) AS filas,
+               COALESCE(SUM(CRC32(CONCAT_WS('|', id_zona, max_temp, min_air_humidity,
+                                            min_soil_moisture, db_update_time))), 0) AS checksum
+        FROM zona
+        WHERE id_zona IN ({zone_placeholders()})
+    """, zone_ids)
+    row = cursor.fetchone()
+    return int(row['filas']), int(row['checksum'])
 
+@metrics.timed(DB_QUERY_SECONDS, operation='check_env_parameters')
+def check_env_parameters():
+    """
+    Cheap change check for the parameter cache: compare the checksum of the zona rows with
+    the one behind env_parameters and re-read them only when it differs (or was never read).
+    """
+    global parameters_checked
+    cursor = None
+    changed = False
+    with db_lock:
+        try:
+            cursor = database_connection().cursor(dictionary=True)
+            if zona_checksum(cursor) == parameters_checksum:
+                parameters_checked = time.perf_counter()
+            else:
+                changed = True
+            db_breaker.success()
+        except Exception as e:
+            database_error('check_env_parameters', f"Error checking environmental parameters: {e}", e)
+        finally:
+            if cursor:
+                cursor.close()
+    if changed:
+        update_env_parameters()
+
+@metrics.timed(DB_QUERY_SECONDS, operation='update_env_parameters')
 def update_env_parameters():
-    """Update environmental parameters from database"""
-    global env_parameters
+    """Update environmental parameters of every zone from database, in one query"""
+    global env_parameters, thresholds, parameters_checksum, parameters_changed
     cursor = None
     with db_lock:
         try:
-            if not db_connection.is_connected():
-                db_connection.reconnect()
-            
-            cursor = db_connection.cursor(dictionary=True)
-            query = """
-                SELECT max_temp, min_air_humidity, min_soil_moisture, db_update_time
+            cursor = database_connection().cursor(dictionary=True)
+            # Checksum first: a change that lands between both queries is re-read on the next check
+            checksum = zona_checksum(cursor)
+            query = f"""
+                SELECT id_zona, max_temp, min_air_humidity, min_soil_moisture, db_update_time
                 FROM zona
-                WHERE id_zona = 1
+                WHERE id_zona IN ({zone_placeholders()})
             """
-            cursor.execute(query)
-            result = cursor.fetchone()
+            cursor.execute(query, zone_ids)
+            results = cursor.fetchall()
+            db_breaker.success()
             
-            if result:
-                env_parameters.update({
-                    'max_temp': float(result['max_temp']),
-                    'min_air_humidity': float(result['min_air_humidity']),
-                    'min_soil_moisture': float(result['min_soil_moisture']),
-                    'db_update_time': int(result['db_update_time'])
-                })
-                print("Environmental parameters updated successfully")
+            if results:
+                parameters = {id_zona: zone_parameters.copy() for id_zona, zone_parameters in env_parameters.items()}
+                for result in results:
+                    parameters[result['id_zona']] = {
+                        'max_temp': float(result['max_temp']),
+                        'min_air_humidity': float(result['min_air_humidity']),
+                        'min_soil_moisture': float(result['min_soil_moisture']),
+                        'db_update_time': int(result['db_update_time'])
+                    }
+                # Swap both references; the control loop never sees a half-updated set
+                thresholds = parameter_thresholds(parameters)
+                env_parameters = parameters
+                if parameters_checksum is not None:
+                    PARAMETER_RELOADS.inc()
+                    parameters_changed = (thresholds, parameters_checked)
+                parameters_checksum = checksum
+                publish_snapshot('parameters', env_parameters)
+                db_log.info("Environmental parameters updated successfully", extra={'count': len(results)})
         except Exception as e:
-            error_msg = f"Error updating environmental parameters: {e}"
-            print(error_msg)
-            log_error('Sistema', error_msg)
+            database_error('update_env_parameters', f"Error updating environmental parameters: {e}", e)
         finally:
             if cursor:
                 cursor.close()
 
-def read_dht11_sensor():
-    """Read temperature and humidity from DHT11 sensor."""
-    global current_values, last_valid_values
-    
-    try:
-        temperature = dht_device.temperature
-        humidity = dht_device.humidity
-        
-        if temperature is not None and humidity is not None:
-            with values_lock:
-                current_values['air_temperature'] = temperature
-                current_values['air_humidity'] = humidity
-                last_valid_values['air_temperature'] = temperature
-                last_valid_values['air_humidity'] = humidity
-            
-            return temperature, humidity
-            
-    except Exception as e:
-        error_msg = f"Error reading DHT11: {str(e)}"
-        print(error_msg)
-        log_error('DHT11', error_msg)
-        return (last_valid_values['air_temperature'], 
-                last_valid_values['air_humidity'])
-
-def read_light_sensor():
-    """Read light intensity from ADS1115 ADC with photoresistor."""
-    global current_values, last_valid_values
-    
-    try:
-        if light_sensor is None:
-            raise Exception("Light sensor not initialized")
-            
-        # Read voltage value (0V to 5V)
-        voltage = light_sensor.voltage
-        
-        # Convert to percentage (assuming higher voltage means more light)
-        # Map 0-5V to 0-100%
-        light_intensity = (voltage / 3.3) * 100
-        
-        # Validate reading is in expected range
-        if 0 <= light_intensity <= 100:
-            with values_lock:
-                current_values['light_intensity'] = light_intensity
-                last_valid_values['light_intensity'] = light_intensity
-            
-            return light_intensity
-            
-    except Exception as e:
-        error_msg = f"Error reading light sensor: {str(e)}"
-        print(error_msg)
-        log_error('Light_Sensor', error_msg)
-        return last_valid_values['light_intensity']
-    
-def read_soil_sensor():
-    """Read all parameters from soil sensor."""
-        
-    global current_values, last_valid_values
-    
+def record_sensor_read(sensor, seconds, result):
+    """Record latency and outcome ('ok', 'invalid' or 'error') of one sensor device read."""
+    SENSOR_READ_SECONDS.observe(seconds, sensor=sensor)
+    SENSOR_READS.inc(sensor=sensor, result=result)
+
+# One logger per driver, e.g. invernadero.sensors.modbus
+driver_logs = {name: sensor_log.getChild(device['driver']) for name, device in SENSORS.devices.items()}
+
+def read_sensor_device(id_zona, name, raw):
+    """Read the raw channels of one sensor device into raw (its zone row). Returns the read time or None on error."""
+    start = time.perf_counter()
     try:
-        if soil_sensor is None:
-            raise Exception("Soil sensor not initialized")
-            
-        temp = soil_sensor.read_register(0x0013) * 0.1    # Temperature
-        moisture = soil_sensor.read_register(0x0012) * 0.1  # Moisture
-        ph = soil_sensor.read_register(0x0006) * 0.01     # pH
-        
-        if (0 <= temp <= 50 and 
-            0 <= moisture <= 100 and 
-            0 <= ph <= 14):
-            
-            with values_lock:
-                current_values['soil_temperature'] = temp
-                current_values['soil_moisture'] = moisture
-                current_values['soil_ph'] = ph
-                last_valid_values['soil_temperature'] = temp
-                last_valid_values['soil_moisture'] = moisture
-                last_valid_values['soil_ph'] = ph
-            
-            return temp, moisture, ph
-            
+        SENSORS.read(name, zone_devices[id_zona][name], raw)
+        seconds = time.perf_counter() - start
+        device_log = driver_logs[name]
+        if device_log.isEnabledFor(logging.DEBUG):
+            device_log.debug("Raw %s in %.1f ms", {SENSOR_NAMES[column]: raw[column] for column in SENSORS.device_columns[name]},
+                             seconds * 1000, extra={'sensor': name, 'zone': id_zona})
+        return seconds
     except Exception as e:
-        error_msg = f"Error reading soil sensor: {str(e)}"
-        print(error_msg)
-        log_error('Soil_Sensor', error_msg)
-        return (last_valid_values['soil_temperature'],
-                last_valid_values['soil_moisture'],
-                last_valid_values['soil_ph'])
+        raw[SENSORS.device_columns[name]] = np.nan
+        record_sensor_read(name, time.perf_counter() - start, 'error')
+        component = SENSORS.devices[name]['component']
+        error_msg = f"Error reading {component}: {str(e)}"
+        sensor_log.error(error_msg, extra={'sensor': name, 'zone': id_zona, 'error_class': type(e).__name__})
+        log_error(component, error_msg, id_zona)
+        return None
 
 def read_all_sensors():
-    """Read all sensors and update global values."""
-    # Read DHT11
-    air_temp, air_hum = read_dht11_sensor()
-    print(f"Air - Temperature: {air_temp:.1f} C  Humidity: {air_hum:.1f}%")
-    
-    # Read soil sensor
-    soil_temp, soil_moisture, soil_ph = read_soil_sensor()
-    print(f"Soil - Temperature: {soil_temp:.1f} C  Moisture: {soil_moisture:.1f}%  pH: {soil_ph:.2f}")
-    
-    # Read light sensor
-    light_intensity = read_light_sensor()
-    print(f"Light Intensity: {light_intensity:.1f}%")
-    
+    """
+    Read every sensor device of every zone, then convert all raw readings to engineering
+    values and check them against their valid ranges in one vectorized pass (sensors.json).
+    Valid readings update the global values. Returns {id_zona: {sensor: value}}.
+    """
+    global history_next
+    raw = np.full((len(zone_ids), len(SENSOR_NAMES)), np.nan)
+    reads = []
+    for row, id_zona in enumerate(zone_ids):
+        for name in SENSORS.devices:
+            # Devices that failed to open are retried by their component; nothing to read yet
+            if zone_devices[id_zona].get(name) is None:
+                continue
+            seconds = read_sensor_device(id_zona, name, raw[row])
+            if seconds is not None:
+                reads.append((row, name, seconds))
+
+    readings, valid = SENSORS.calibrate(raw)
+    valid_rows = valid.tolist()
+    for row, name, seconds in reads:
+        ok = all(valid_rows[row][column] for column in SENSORS.device_columns[name])
+        record_sensor_read(name, seconds, 'ok' if ok else 'invalid')
+    if sensor_log.isEnabledFor(logging.DEBUG):
+        for id_zona, zone_readings in zone_values(np.where(valid, readings, np.nan)).items():
+            sensor_log.debug("Zone %d readings: %s", id_zona, zone_readings, extra={'zone': id_zona})
+
+    now = time.time()
     with values_lock:
-        return current_values.copy()
+        # Invalid or missing readings keep the last valid value
+        current_values[valid] = readings[valid]
+        last_valid_values[valid] = readings[valid]
+        values = current_values.copy()
+        history_times[history_next] = now
+        history_values[history_next] = values
+        history_next = (history_next + 1) % HISTORY_SIZE
+    values = zone_values(values)
+    publish_snapshot('values', {'time': now, 'zones': values})
+    return values
 
+@metrics.timed(DB_QUERY_SECONDS, operation='get_actuator_states')
 def get_actuator_states():
     """
-    Get current states of all actuators from database.
-    Updates global actuator_states.
+    Get the latest state of every actuator in every zone from database, in one query.
+    States changed from the database (dashboard) are applied to the hardware.
     Returns:
-        dict: Current states of all actuators
+        dict: {id_zona: {actuator: state}}
     """
-    global actuator_states
-    
+    cursor = None
     try:
-        if not db_connection.is_connected():
-            raise mysql.connector.Error("Database connection lost")
-            
-        cursor = db_connection.cursor(dictionary=True)
+        with db_lock:
+            cursor = database_connection().cursor(dictionary=True)
+            cursor.execute(actuator_states_query, zone_ids * len(ACTUATORS))
+            rows = cursor.fetchall()
+        db_breaker.success()
         
-        # Query each actuator's latest state
-        actuator_queries = {
-            'rele1': """
-                SELECT estado 
-                FROM actuador_rele1 
-                WHERE id_zona = 1 
-                ORDER BY fecha_hora DESC 
-                LIMIT 1
-            """,
-            'rele2': """
-                SELECT estado 
-                FROM actuador_rele2 
-                WHERE id_zona = 1 
-                ORDER BY fecha_hora DESC 
-                LIMIT 1
-            """,
-            'rele3': """
-                SELECT estado 
-                FROM actuador_rele3 
-                WHERE id_zona = 1 
-                ORDER BY fecha_hora DESC 
-                LIMIT 1
-            """,
-            'riego': """
-                SELECT estado 
-                FROM actuador_riego 
-                WHERE id_zona = 1 
-                ORDER BY fecha_hora DESC 
-                LIMIT 1
-            """
-        }
-        
-        # Update global actuator states
-        for actuator, query in actuator_queries.items():
-            try:
-                cursor.execute(query)
-                result = cursor.fetchone()
-                if result:
-                    actuator_states[actuator] = bool(result['estado'])
-                    # Update physical state if different from database
-                    if actuator_states_cache[actuator] != actuator_states[actuator]:
-                        update_actuator_state(actuator, actuator_states[actuator])
-            except mysql.connector.Error as e:
-                print(f"Error reading {actuator} state: {e}")
-                
-        cursor.close()
-        return actuator_states.copy()
+        # One state per zone and actuator, even if two rows share the latest fecha_hora
+        states = {(row['id_zona'], row['actuador']): bool(row['estado']) for row in rows if row['id_zona'] in zone_index}
+        apply_actuator_changes([(id_zona, actuator, state) for (id_zona, actuator), state in states.items()])
         
-    except mysql.connector.Error as e:
-        error_msg = f"Database error in get_actuator_states: {str(e)}"
-        print(error_msg)
-        log_error('Sistema', error_msg)
-        return actuator_states.copy()
+    except (mysql.connector.Error, CircuitOpenError) as e:
+        database_error('get_actuator_states', f"Database error in get_actuator_states: {str(e)}", e)
+    finally:
+        if cursor:
+            cursor.close()
+    return actuator_snapshot()
 
+@metrics.timed(DB_QUERY_SECONDS, operation='log_sensor_data')
 def log_sensor_data(sensor_data):
     """
-    Log all sensor readings to database in one transaction.
+    Log all sensor readings of the given zones to database in one transaction,
+    one multi-row insert per sensor table whatever the number of zones.
+    Buffered in memory while the database is unavailable (see write_rows).
     Args:
-        sensor_data (dict): Dictionary containing current sensor values
+        sensor_data (dict): {id_zona: {sensor: value}}, as returned by zone_values
     """
-    try:
-        if not db_connection.is_connected():
-            raise mysql.connector.Error("Database connection lost")
-            
-        cursor = db_connection.cursor()
-        current_time = datetime.now()
-        
-        # Prepare all insert queries
-        queries = [
-            # Air temperature
-            """INSERT INTO sensor_temperatura 
-               (nombre, id_zona, fecha_hora, valor) 
-               VALUES (%s, %s, %s, %s)""",
-            # Air humidity
-            """INSERT INTO sensor_humedad_aire 
-               (nombre, id_zona, fecha_hora, valor) 
-               VALUES (%s, %s, %s, %s)""",
-            # Soil temperature
-            """INSERT INTO sensor_temperatura_suelo
-               (nombre, id_zona, fecha_hora, valor) 
-               VALUES (%s, %s, %s, %s)""",
-            # Soil moisture
-            """INSERT INTO sensor_humedad_suelo 
-               (nombre, id_zona, fecha_hora, valor) 
-               VALUES (%s, %s, %s, %s)""",
-            # Soil pH
-            """INSERT INTO sensor_ph_suelo 
-               (nombre, id_zona, fecha_hora, valor) 
-               VALUES (%s, %s, %s, %s)""",
-            # Light intensity
-            """INSERT INTO sensor_intensidad_luz 
-               (nombre, id_zona, fecha_hora, valor) 
-               VALUES (%s, %s, %s, %s)"""
-        ]
-        
-        # Prepare data for each query
-        data = [
-            ('Sensor_Temp_Aire_Z1', 1, current_time, sensor_data['air_temperature']),
-            ('Sensor_Hum_Aire_Z1', 1, current_time, sensor_data['air_humidity']),
-            ('Sensor_Temp_Suelo_Z1', 1, current_time, sensor_data['soil_temperature']),
-            ('Sensor_Hum_Suelo_Z1', 1, current_time, sensor_data['soil_moisture']),
-            ('Sensor_PH_Suelo_Z1', 1, current_time, sensor_data['soil_ph'])
-            ('Sensor_Luz_Z1', 1, current_time, sensor_data['light_intensity'])
-        ]
-        
-        # Execute all queries in a single transaction
-        for query, values in zip(queries, data):
-            cursor.execute(query, values)
-            
-        db_connection.commit()
-        cursor.close()
-        print("Sensor data logged successfully")
-        
-    except mysql.connector.Error as e:
-        error_msg = f"Error logging sensor data: {str(e)}"
-        print(error_msg)
-        log_error('Sistema', error_msg)
-        if db_connection.is_connected():
-            db_connection.rollback()
+    current_time = datetime.now()
+    rows = {name: [] for name in SENSOR_NAMES}
+    for id_zona, values in sensor_data.items():
+        for name in SENSOR_NAMES:
+            rows[name].append((f'{SENSOR_TABLES[name][1]}_Z{id_zona}', id_zona, current_time, values[name]))
 
-def log_error(sensor_name, error_message):
+    writes = [(f"""
+        INSERT INTO {SENSOR_TABLES[name][0]}
+        (nombre, id_zona, fecha_hora, valor)
+        VALUES (%s, %s, %s, %s)
+    """, table_rows) for name, table_rows in rows.items()]
+    if write_rows('log_sensor_data', "sensor data", writes):
+        db_log.debug("Sensor data logged successfully", extra={'count': len(sensor_data)})
+
+def log_error(sensor_name, error_message, id_zona=None):
     """
-    Log errors to database
+    Queue an error for sensor_error_log. Never blocks or touches db_connection:
+    repeats are aggregated and written in batches by the error_log thread.
     Args:
         sensor_name (str): Name of the sensor or system component
         error_message (str): Description of the error
+        id_zona (int): Zone of the sensor; None for system errors
+    """
+    error_log.report(sensor_name, error_message, id_zona)
+
+def queue_capture_results(captures):
+    """Queue one capture cycle (one result per camera) for the next batched insert."""
+    with detections_lock:
+        pending_captures.extend(captures)
+        # Drop the oldest captures if the database has been unreachable for a long time
+        del pending_captures[:-MAX_PENDING_CAPTURES]
+
+@metrics.timed(DB_QUERY_SECONDS, operation='flush_capture_results')
+def flush_capture_results():
     """
-    if db_connection and db_connection.is_connected():
+    Write all queued captures in one transaction: one summary row per capture and zone,
+    per-class counts and one row per detection for captures that ran inference.
+    A camera split into regions of interest covers several zones; each detection
+    is stored under the zone of the region it was found in.
+    """
+    with detections_lock:
+        batch = pending_captures[:]
+        pending_captures.clear()
+    if not batch:
+        return
+
+    capture_rows = []
+    count_rows = []
+    detection_rows = []
+    for capture in batch:
+        fecha_hora = capture['time'].replace(microsecond=0)
+        detections = capture['detections'] if capture['inferred'] else []
+        for id_zona in capture['zones']:
+            key = (id_zona, capture['camera'], fecha_hora)
+            zone_detections = [d for d in detections if d['id_zona'] == id_zona]
+            capture_rows.append((*key, capture['inferred'], len(zone_detections)))
+            counts = {}
+            for index, detection in enumerate(zone_detections):
+                counts[detection['class']] = counts.get(detection['class'], 0) + 1
+                detection_rows.append((*key, index, detection['class'], detection['confidence'], *detection['bbox']))
+            count_rows.extend((*key, cls, count) for cls, count in counts.items())
+
+    with db_lock:
+        cursor = None
         try:
-            cursor = db_connection.cursor()
-            query = """
-                INSERT INTO sensor_error_log 
-                (nombre_sensor, id_zona, mensaje_error)
-                VALUES (%s, %s, %s)
-            """
-            cursor.execute(query, (sensor_name, 1, error_message))
-            db_connection.commit()
-            cursor.close()
-        except mysql.connector.Error as e:
-            print(f"Error logging to database: {e}")
+            connection = database_connection()
+            cursor = connection.cursor()
+            cursor.executemany("""
+                INSERT IGNORE INTO captura (id_zona, camara, fecha_hora, inferida, total_detecciones)
+                VALUES (%s, %s, %s, %s, %s)
+            """, capture_rows)
+            if count_rows:
+                cursor.executemany("""
+                    INSERT IGNORE INTO captura_conteo (id_zona, camara, fecha_hora, clase, cantidad)
+                    VALUES (%s, %s, %s, %s, %s)
+                """, count_rows)
+            if detection_rows:
+                cursor.executemany("""
+                    INSERT IGNORE INTO deteccion (id_zona, camara, fecha_hora, indice, clase, confianza, x1, y1, x2, y2)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                """, detection_rows)
+            connection.commit()
+            db_breaker.success()
+            db_log.info("Logged %d captures and %d detections", len(capture_rows), len(detection_rows),
+                        extra={'operation': 'flush_capture_results', 'count': len(capture_rows)})
 
-def update_actuator_state(actuator_name, new_state):
-    """Update physical state of an actuator and log to database if state has changed."""
-    global actuator_states_cache
+        except CONNECTION_ERRORS as e:
+            rollback(e)
+            # Put the batch back so it is retried on the next flush
+            with detections_lock:
+                pending_captures[:0] = batch
+                del pending_captures[:-MAX_PENDING_CAPTURES]
+            database_error('flush_capture_results', f"Error logging detections: {e}", e)
+        except Exception as e:
+            # Refused by the database: it would fail the same way on every flush
+            rollback(e)
+            database_error('flush_capture_results', f"Error logging detections, dropped {len(batch)} captures: {e}", e)
+        finally:
+            if cursor:
+                cursor.close()
+
+def update_actuator_state(id_zona, actuator_name, new_state):
+    """Update physical state of an actuator if it has changed. Returns True when it was switched."""
+    row, column = zone_index[id_zona], ACTUATORS.index(actuator_name)
     
     # Check if state has actually changed
-    if actuator_states_cache[actuator_name] == new_state:
-        return
+    if actuator_states_cache[row, column] == new_state:
+        return False
+        
+    # Not open yet (degraded mode): the state stays unknown until the device is available
+    device = zone_devices[id_zona].get(actuator_name)
+    if device is None:
+        return False
         
     try:
         # Update physical actuator
-        if actuator_name == 'rele1' and lamp_relay:
-            lamp_relay.value = new_state
-        elif actuator_name == 'rele2' and fan_relay:
-            fan_relay.value = new_state
-        elif actuator_name == 'rele3' and humidifier_relay:
-            humidifier_relay.value = new_state
-        elif actuator_name == 'riego' and irrigation_servo:
+        if actuator_name == 'riego':
             if new_state:
-                irrigation_servo.mid()  # 90 degrees position
+                device.mid()  # 90 degrees position
             else:
-                irrigation_servo.min()  # 0 degrees position
+                device.min()  # 0 degrees position
+        else:
+            device.value = new_state
         
         # Update cache
-        actuator_states_cache[actuator_name] = new_state
-        
-        # Log state change to database
-        if db_connection.is_connected():
-            cursor = db_connection.cursor()
-            
-            table_name = {
-                'rele1': 'actuador_rele1',
-                'rele2': 'actuador_rele2',
-                'rele3': 'actuador_rele3',
-                'riego': 'actuador_riego'
-            }.get(actuator_name)
-            
-            if table_name:
-                query = f"""
-                    INSERT INTO {table_name}
-                    (nombre, id_zona, fecha_hora, estado)
-                    VALUES (%s, %s, %s, %s)
-                """
-                cursor.execute(query, (
-                    f'Actuador_{actuator_name}_Z1',
-                    1,
-                    datetime.now(),
-                    new_state
-                ))
-                db_connection.commit()
-            cursor.close()
+        with values_lock:
+            actuator_states_cache[row, column] = new_state
+        ACTUATOR_CHANGES.inc(actuator=actuator_name, state='on' if new_state else 'off')
+        return True
             
     except Exception as e:
         error_msg = f"Error updating {actuator_name}: {str(e)}"
-        print(error_msg)
-        log_error('Sistema', error_msg)
+        actuator_log.error(error_msg, extra={'actuator': actuator_name, 'zone': id_zona, 'error_class': type(e).__name__})
+        log_error('Sistema', error_msg, id_zona)
+        return False
+
+def apply_actuator_changes(changes):
+    """Switch the actuators in `changes` ((id_zona, actuator, state) tuples) and log the switched ones together."""
+    switched = [change for change in changes if update_actuator_state(*change)]
+    if switched:
+        publish_snapshot('actuators', actuator_snapshot())
+        log_actuator_changes(switched)
+
+@metrics.timed(DB_QUERY_SECONDS, operation='log_actuator_state')
+def log_actuator_changes(changes):
+    """Log actuator state changes to database: one multi-row insert per actuator table, buffered while it is unavailable."""
+    current_time = datetime.now()
+    rows = {}
+    for id_zona, actuator_name, new_state in changes:
+        rows.setdefault(ACTUATOR_TABLES[actuator_name], []).append(
+            (f'Actuador_{actuator_name}_Z{id_zona}', id_zona, current_time, new_state)
+        )
+
+    write_rows('log_actuator_state', "actuator changes", [(f"""
+        INSERT INTO {table_name}
+        (nombre, id_zona, fecha_hora, estado)
+        VALUES (%s, %s, %s, %s)
+    """, table_rows) for table_name, table_rows in rows.items()])
 
 def check_environmental_conditions():
-    """Check sensor values against thresholds and control actuators accordingly."""
+    """
+    Check the readings of every zone against its thresholds in one vectorized comparison
+    (fan above max_temp, humidifier below min_air_humidity, irrigation below min_soil_moisture)
+    and switch only the actuators whose state changes.
+    """
+    global parameters_changed
     with values_lock:
-        air_temp = current_values['air_temperature']
-        air_humidity = current_values['air_humidity']
-        soil_moisture = current_values['soil_moisture']
+        readings = current_values[:, RULE_SENSORS]
+        states = actuator_states_cache[:, RULE_ACTUATORS]
+    limits = thresholds
+    enabled = rule_enabled
     
     try:
-        # Temperature control - Fan
-        if air_temp > env_parameters['max_temp']:
-            update_actuator_state('rele2', True)  # Turn on fan
-        else:
-            update_actuator_state('rele2', False)  # Turn off fan
-        
-        # Air humidity control - Humidifier
-        if air_humidity < env_parameters['min_air_humidity']:
-            update_actuator_state('rele3', True)  # Turn on humidifier
-        else:
-            update_actuator_state('rele3', False)  # Turn off humidifier
+        desired = np.where(RULE_ABOVE, readings > limits, readings < limits)
+        # Unknown states (NaN) always differ; zones without a reading yet, or whose sensor or
+        # actuator is not available, are left alone
+        changed = (desired != states) & ~np.isnan(readings) & enabled
+        rows, rules = np.nonzero(changed)
+        apply_actuator_changes([
+            (zone_ids[row], CONTROL_RULES[rule][0], bool(desired[row, rule]))
+            for row, rule in zip(rows.tolist(), rules.tolist())
+        ])
         
-        # Soil moisture control - Irrigation
-        if soil_moisture < env_parameters['min_soil_moisture']:
-            update_actuator_state('riego', True)  # Turn on irrigation
-        else:
-            update_actuator_state('riego', False)  # Turn off irrigation
+        # First check with reloaded parameters: record how long the change took to reach the control loop
+        changed = parameters_changed
+        if changed is not None and changed[0] is limits:
+            parameters_changed = None
+            if changed[1] is not None:
+                seconds = time.perf_counter() - changed[1]
+                PARAMETER_APPLY_SECONDS.observe(seconds)
+                actuator_log.info("New zona parameters applied within %.1f s of the change", seconds,
+                                  extra={'latency_ms': round(seconds * 1000)})
             
     except Exception as e:
         error_msg = f"Error in environmental control: {str(e)}"
-        print(error_msg)
+        actuator_log.error(error_msg, extra={'error_class': type(e).__name__})
         log_error('Sistema', error_msg)
 
-def calculate_24h_average_temp():
-    """Calculate average temperature from last 24 hours"""
-    with db_lock:
-        try:
-            if not db_connection.is_connected():
-                db_connection.reconnect()
-                
-            cursor = db_connection.cursor(dictionary=True)
-            
-            # Get temperatures from last 24 hours
-            query = """
-                SELECT valor
-                FROM sensor_temperatura
-                WHERE id_zona = 1 
-                AND fecha_hora >= NOW() - INTERVAL 24 HOUR
-            """
-            cursor.execute(query)
-            temperatures = cursor.fetchall()
-            cursor.close()
-            
-            if temperatures:
-                # Calculate average temperature
-                avg_temp = sum(record['valor'] for record in temperatures) / len(temperatures)
-                return avg_temp
-            return None
-            
-        except Exception as e:
-            error_msg = f"Error calculating 24h average temperature: {e}"
-            print(error_msg)
-            log_error('Sistema', error_msg)
-            return None
+@metrics.timed(DB_QUERY_SECONDS, operation='average_temperature')
+def calculate_24h_average_temps(cursor):
+    """Average temperature of the last 24 hours per zone, computed by the database. Caller holds db_lock."""
+    query = f"""
+        SELECT id_zona, AVG(valor) AS promedio
+        FROM sensor_temperatura
+        WHERE id_zona IN ({zone_placeholders()})
+        AND fecha_hora >= NOW() - INTERVAL 24 HOUR
+        GROUP BY id_zona
+    """
+    cursor.execute(query, zone_ids)
+    return {row['id_zona']: float(row['promedio']) for row in cursor.fetchall() if row['promedio'] is not None}
 
 
 #aquí se calcula el gdd diario, se actualiza el gdd acumulado y se estima el tiempo hasta la cosecha
 #aquí se define la temperatura base en 10°C
+@metrics.timed(DB_QUERY_SECONDS, operation='update_gdd')
 def update_gdd_and_harvest_estimate():
     """
-    Calculate daily GDD, update cumulative GDD and estimate days until harvest.
-    Base temperature is 10°C.
+    Calculate daily GDD, update cumulative GDD and estimate days until harvest for every zone.
+    Base temperature is 10°C. Returns False if the database was unavailable and it should be retried.
     """
     with db_lock:
+        cursor = None
         try:
-            if not db_connection.is_connected():
-                db_connection.reconnect()
-                
-            cursor = db_connection.cursor(dictionary=True)
+            cursor = database_connection().cursor(dictionary=True)
             
             # First get current GDD and GDD needed for harvest
-            query = """
-                SELECT gdd, gdd_for_harvest
+            query = f"""
+                SELECT id_zona, gdd, gdd_for_harvest
                 FROM zona
-                WHERE id_zona = 1
+                WHERE id_zona IN ({zone_placeholders()})
             """
-            cursor.execute(query)
-            result = cursor.fetchone()
-            
-            if not result:
-                cursor.close()
-                return
-                
-            current_gdd = result['gdd'] if result['gdd'] else 0
-            gdd_for_harvest = result['gdd_for_harvest']
+            cursor.execute(query, zone_ids)
+            zones = cursor.fetchall()
+            db_breaker.success()
+            if not zones:
+                return True
             
             # Calculate today's GDD
-            avg_temp = calculate_24h_average_temp()
-            if avg_temp is None:
-                cursor.close()
-                return
+            averages = calculate_24h_average_temps(cursor)
+            updates = []
+            for zone in zones:
+                avg_temp = averages.get(zone['id_zona'])
+                if avg_temp is None:
+                    continue
+                current_gdd = zone['gdd'] if zone['gdd'] else 0
                 
-            # Calculate GDD for today (simple method)
-            daily_gdd = max(0, avg_temp - 10)  # Base temp is 10°C
-            
-            # Add to cumulative GDD
-            new_total_gdd = current_gdd + daily_gdd
-            
-            # Calculate estimated days until harvest
-            if daily_gdd > 0:
-                remaining_gdd = gdd_for_harvest - new_total_gdd
-                est_days = remaining_gdd / daily_gdd if remaining_gdd > 0 else 0
-            else:
-                est_days = None
+                # Calculate GDD for today (simple method)
+                daily_gdd = max(0, avg_temp - 10)  # Base temp is 10°C
+                
+                # Add to cumulative GDD
+                new_total_gdd = current_gdd + daily_gdd
+                
+                # Calculate estimated days until harvest
+                if daily_gdd > 0:
+                    remaining_gdd = zone['gdd_for_harvest'] - new_total_gdd
+                    est_days = remaining_gdd / daily_gdd if remaining_gdd > 0 else 0
+                else:
+                    est_days = None
+                updates.append((new_total_gdd, est_days, zone['id_zona']))
+                log.info("Zone %d updated GDD: %.2f, Estimated days until harvest: %s", zone['id_zona'], new_total_gdd,
+                         f"{est_days:.1f}" if est_days is not None else 'N/A', extra={'zone': zone['id_zona']})
                 
             # Update the database
-            update_query = """
-                UPDATE zona
-                SET gdd = %s,
-                    est_days_harvest = %s
-                WHERE id_zona = 1
-            """
-            cursor.execute(update_query, (new_total_gdd, est_days))
-            db_connection.commit()
-            cursor.close()
-            
-            print(f"Updated GDD: {new_total_gdd:.2f}, Estimated days until harvest: {est_days:.1f if est_days else 'N/A'}")
+            if updates:
+                cursor.executemany("""
+                    UPDATE zona
+                    SET gdd = %s,
+                        est_days_harvest = %s
+                    WHERE id_zona = %s
+                """, updates)
+                db_connection.commit()
+            return True
             
         except Exception as e:
-            error_msg = f"Error updating GDD and harvest estimate: {e}"
-            print(error_msg)
-            log_error('Sistema', error_msg)
+            rollback(e)
+            database_error('update_gdd', f"Error updating GDD and harvest estimate: {e}", e)
+            # Retry while the database is unreachable; other errors wait for tomorrow, as before
+            return not isinstance(e, CONNECTION_ERRORS)
+        finally:
+            if cursor:
+                cursor.close()
+
+def publish_snapshot(name, data):
+    """
+    Serialize state once for the API; every reader gets the same bytes until the next change.
+    The same body is pushed to /api/events subscribers as an event named after the snapshot.
+    """
+    body = json.dumps(data).encode()
+    api_snapshots[name] = (body, hashlib.sha1(body).hexdigest(), datetime.now(timezone.utc).replace(microsecond=0))
+    broadcast_event(name, body)
+
+def broadcast_event(name, body):
+    """Queue one encoded SSE event for every subscriber without waiting on any of them."""
+    with events_condition:
+        event_stats['published'] += 1
+        event = b"id: %d\nevent: %s\ndata: %s\n\n" % (event_stats['published'], name.encode(), body)
+        for queue in event_subscribers:
+            if len(queue) == queue.maxlen:
+                event_stats['dropped'] += 1
+            queue.append(event)
+        events_condition.notify_all()
+
+def subscribe_events():
+    """
+    Register an /api/events client and return its queue, or None when MAX_EVENT_CLIENTS are
+    already connected: each one holds an API thread, and without a cap they would leave none
+    for /api/values and the other short requests.
+    """
+    queue = deque(maxlen=EVENT_QUEUE_SIZE)
+    for name in ('values', 'actuators', 'parameters'):
+        if name in api_snapshots:
+            queue.append(b"event: %s\ndata: %s\n\n" % (name.encode(), api_snapshots[name][0]))
+    with events_condition:
+        if len(event_subscribers) >= MAX_EVENT_CLIENTS:
+            event_stats['rejected'] += 1
+            return None
+        event_subscribers.append(queue)
+    return queue
+
+def unsubscribe_events(queue):
+    with events_condition:
+        event_subscribers.remove(queue)
+
+def event_stream(queue):
+    """Generator for one /api/events client: current state first, then every new event."""
+    while True:
+        with events_condition:
+            events_condition.wait_for(lambda: queue, timeout=EVENT_KEEPALIVE)
+            events = list(queue)
+            queue.clear()
+        # Write outside the lock: a slow socket only stalls this client's own thread
+        yield b"".join(events) if events else b": keep-alive\n\n"
+
+# Live REST API, served on its own port by start_http_server in main()
+api = Flask(__name__)
+
+def serve_snapshot(name):
+    """Serve a prebuilt snapshot with ETag/Last-Modified; 304 if the client already has it."""
+    snapshot = api_snapshots.get(name)
+    if snapshot is None:
+        return jsonify({"error": "No data available yet"}), 503
+    body, etag, modified = snapshot
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.last_modified = modified
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@api.route('/api/values', methods=['GET'])
+def get_current_values():
+    return serve_snapshot('values')
+
+@api.route('/api/actuators', methods=['GET'])
+def get_actuators():
+    return serve_snapshot('actuators')
+
+@api.route('/api/parameters', methods=['GET'])
+def get_parameters():
+    return serve_snapshot('parameters')
+
+@api.route('/api/events', methods=['GET'])
+def get_events():
+    """Server-Sent Events push of readings ('values'), actuator changes and parameter updates."""
+    queue = subscribe_events()
+    if queue is None:
+        return jsonify({"error": "Too many event clients"}), 503, {'Retry-After': str(EVENT_KEEPALIVE)}
+    response = Response(event_stream(queue), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    # waitress closes the response when the client leaves, even if the generator never started
+    response.call_on_close(lambda: unsubscribe_events(queue))
+    return response
+
+@api.route('/api/events/stats', methods=['GET'])
+def get_event_stats():
+    with events_condition:
+        stats = event_stats.copy()
+        stats['clients'] = len(event_subscribers)
+        stats['queued'] = sum(len(queue) for queue in event_subscribers)
+    return jsonify(stats)
+
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@api.route('/api/logging', methods=['GET', 'POST'])
+def logging_levels():
+    """
+    GET lists the level of every service logger. POST ?logger=&level= changes one at runtime,
+    e.g. logger=invernadero.sensors.modbus&level=DEBUG to trace Modbus reads without a restart.
+    """
+    if request.method == 'POST':
+        try:
+            set_level(request.args.get('logger', 'invernadero'), request.args.get('level', ''))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+    return jsonify(levels())
+
+@api.route('/api/startup', methods=['GET'])
+def get_startup():
+    """Startup breakdown: import time, then status and timing of every component and loop."""
+    return jsonify(startup_report())
+
+@api.route('/api/profile/loops', methods=['GET'])
+def get_loop_profile():
+    """Wall and CPU time per iteration of the sensor, database and photo loops."""
+    return jsonify(profiling.loops())
+
+@api.route('/api/profile/cpu', methods=['GET'])
+def get_cpu_profile():
+    """
+    Samples every thread for ?seconds= (default 10) and returns collapsed stacks, one
+    'stack count' line each, ready for flamegraph.pl or speedscope. Needs INVERNADERO_PROFILING=1.
+    """
+    if not profiling.PROFILING:
+        return jsonify({"error": "Profiling disabled"}), 404
+    profile = profiling.cpu_profile(request.args.get('seconds', 10, type=float),
+                                    request.args.get('interval', profiling.PROFILE_INTERVAL, type=float))
+    if profile is None:
+        return jsonify({"error": "A profile is already running"}), 409
+    path, text = profile
+    return Response(text, mimetype='text/plain', headers={'X-Profile-Path': path})
+
+@api.route('/api/profile/memory', methods=['GET', 'DELETE'])
+def memory_profile():
+    """
+    GET starts tracemalloc the first time, then writes a snapshot (and the growth since the
+    previous one) as collapsed stacks weighted by bytes. DELETE stops tracing.
+    """
+    if not profiling.PROFILING:
+        return jsonify({"error": "Profiling disabled"}), 404
+    if request.method == 'DELETE':
+        profiling.stop_memory_tracing()
+        return jsonify({"tracing": False})
+    return jsonify(profiling.memory_snapshot())
+
+@api.route('/api/history', methods=['GET'])
+def get_history():
+    """
+    Recent readings as {id_zona: {sensor: [[time, value], ...]}}: ?zone= and ?sensor= (default all)
+    and ?minutes= (default all kept in memory).
+    """
+    sensor = request.args.get('sensor')
+    if sensor is not None and sensor not in SENSOR_COLUMN:
+        return jsonify({"error": "Unknown sensor"}), 404
+    zone = request.args.get('zone', type=int)
+    if zone is not None and zone not in zone_index:
+        return jsonify({"error": "Unknown zone"}), 404
+    minutes = request.args.get('minutes', type=float)
+    since = time.time() - minutes * 60 if minutes else 0
+    names = [sensor] if sensor else list(SENSOR_NAMES)
+    zones = [zone] if zone is not None else zone_ids
+    with values_lock:
+        rows = np.flatnonzero(history_times >= since)
+        rows = rows[np.argsort(history_times[rows])]
+        times = history_times[rows].tolist()
+        values = history_values[rows][:, [zone_index[id_zona] for id_zona in zones]][:, :, [SENSOR_COLUMN[name] for name in names]]
+    history = {
+        id_zona: {
+            name: [[t, value] for t, value in zip(times, values[:, z, n].tolist()) if not math.isnan(value)]
+            for n, name in enumerate(names)
+        }
+        for z, id_zona in enumerate(zones)
+    }
+    return jsonify(history)
 
 import threading
 
 # Global control flags
 running = True
 
+# Startup breakdown (see /api/startup); times in seconds since PROCESS_START
+startup_lock = Lock()
+startup = {'imports_s': None, 'components': {}, 'loops': {}}
+loop_threads = []
+shutdown_event = threading.Event()  # stops the background retries of components
+
 #read sensors and update greenhouse activation parameters
 #update greenhouse actuators irl
 def sensor_reading_thread():
     """Thread function to continuously read sensors"""
     global running
     
+    scheduled = time.perf_counter()
     while running:
         try:
-            # Read all sensors, update global values
-            read_all_sensors()
-            # Check and update environmental controls, modify global actuator states
-            check_environmental_conditions()
+            start = time.perf_counter()
+            LOOP_LATENESS.observe(max(0.0, start - scheduled), loop='sensor')
+            with profiling.loop_iteration('sensor'):
+                # Read all sensors, update global values
+                read_all_sensors()
+                # Check and update environmental controls, modify global actuator states
+                check_environmental_conditions()
             
+            scheduled = time.perf_counter() + SENSOR_READ_INTERVAL
             time.sleep(SENSOR_READ_INTERVAL)
             
         except Exception as e:
             error_msg = f"Error in sensor reading thread: {str(e)}"
-            print(error_msg)
+            log.exception(error_msg)
             log_error('Sistema', error_msg)
             time.sleep(5)  # Wait before retry
 
-#uploads sensor data to database every db_update_time seconds, and updates environmental parameters every 5 minutes
+#uploads sensor data to database every db_update_time seconds, and re-reads environmental parameters when they change
 #gets actuator states from database every ACTUATOR_CHECK_INTERVAL seconds
 def database_update_thread():
     """Thread function to handle database operations"""
     global running
 
-    last_upload_time = time.time()
-    last_params_update = time.time()
+    last_upload_time = {id_zona: time.time() for id_zona in zone_ids}  # per zone, each has its own db_update_time
+    last_params_check = time.time()
+    last_detections_flush = time.time()
     last_gdd_update = None  # Track last GDD update
     
+    scheduled = time.perf_counter()
     while running:
         try:
-            current_time = time.time()
-            current_datetime = datetime.now()
+            start = time.perf_counter()
+            LOOP_LATENESS.observe(max(0.0, start - scheduled), loop='database')
+            with profiling.loop_iteration('database'):
+                current_time = time.time()
+                current_datetime = datetime.now()
             
-            # Update environmental parameters every 5 minutes
-            if current_time - last_params_update >= 300:
-                update_env_parameters()
-                last_params_update = current_time
+                # Re-read environmental parameters when their checksum changes
+                if current_time - last_params_check >= PARAMS_CHECK_INTERVAL:
+                    check_env_parameters()
+                    last_params_check = current_time
             
-            # Upload to database based on db_update_time from zone
-            if current_time - last_upload_time >= env_parameters['db_update_time']:
-                with values_lock:
-                    sensor_data = current_values.copy()
-                log_sensor_data(sensor_data)
-                last_upload_time = current_time
+                # Upload to database based on db_update_time from zone; zones due together share one batch
+                parameters = env_parameters
+                due = [id_zona for id_zona in zone_ids
+                       if current_time - last_upload_time[id_zona] >= parameters[id_zona]['db_update_time']]
+                if due:
+                    with values_lock:
+                        sensor_data = zone_values(current_values)
+                    log_sensor_data({id_zona: sensor_data[id_zona] for id_zona in due})
+                    for id_zona in due:
+                        last_upload_time[id_zona] = current_time
+            
+                # Write queued capture results in one batch
+                if current_time - last_detections_flush >= DETECTION_FLUSH_INTERVAL:
+                    flush_capture_results()
+                    last_detections_flush = current_time
             
-            # Update GDD at noon each day
-            current_hour = current_datetime.hour
-            current_date = current_datetime.date()
+                # Update GDD at noon each day
+                current_hour = current_datetime.hour
+                current_date = current_datetime.date()
             
-            if (current_hour == 12 and 
-                (last_gdd_update is None or last_gdd_update != current_date)):
-                update_gdd_and_harvest_estimate()
-                last_gdd_update = current_date
+                if (current_hour == 12 and 
+                    (last_gdd_update is None or last_gdd_update != current_date)):
+                    # Retried every iteration until it goes through (e.g. the database was down at noon)
+                    if update_gdd_and_harvest_estimate():
+                        last_gdd_update = current_date
                     
-            # Get actuator states from database
-            get_actuator_states()
+                # Rows buffered during an outage go out as soon as the database answers again
+                # (write_rows probes it through the circuit)
+                if write_buffer:
+                    write_rows('log_buffered_rows', "buffered rows", [])
+                
+                # Get actuator states from database. Not while actuator changes made during an
+                # outage are still buffered: the latest rows there would be the stale ones from
+                # before it, and they would switch the relays back
+                if not write_buffer:
+                    get_actuator_states()
             
+            scheduled = time.perf_counter() + ACTUATOR_CHECK_INTERVAL
             time.sleep(ACTUATOR_CHECK_INTERVAL)
             
         except Exception as e:
             error_msg = f"Error in database update thread: {str(e)}"
-            print(error_msg)
+            log.exception(error_msg)
             log_error('Sistema', error_msg)
             time.sleep(5)
+
+def sensor_anomaly():
+    """True when a reading of any zone is outside its environmental thresholds (something is happening)."""
+    with values_lock:
+        readings = current_values[:, RULE_SENSORS]
+    limits = thresholds
+    # NaN (no reading yet) compares False either way
+    return bool(np.any(np.where(RULE_ABOVE, readings > limits, readings < limits)))
+
 #function para actualizar foto
 def photo_capture_thread():
-    """Thread function to handle periodic photo capture and processing."""
+    """Thread function to handle photo capture and processing on an adaptive schedule."""
     global running
     last_photo_capture = time.time()
-    capture_interval = 300  # Intervalo de captura en segundos (e.g., 5 minutos)
+    capture_interval = MIN_CAPTURE_INTERVAL  # Primera foto pronto; next_capture_interval lo alarga tras cada captura
+    previous_anomaly = False
+    anomaly_pending = False
 
     while running:
         try:
             current_time = time.time()
+            elapsed = current_time - last_photo_capture
             
-            # Capturar y procesar fotos en intervalos especificados
-            if current_time - last_photo_capture >= capture_interval:
-                print("[INFO] Capturing and processing photo...")
-                capture_and_process()  # Llama a la función del yolo_sender.py
+            # Capturar cuando vence el intervalo, o antes si acaba de aparecer una anomalía
+            anomaly = sensor_anomaly()
+            anomaly_pending = anomaly_pending or (anomaly and not previous_anomaly)
+            previous_anomaly = anomaly
+            if elapsed >= capture_interval or (anomaly_pending and elapsed >= MIN_CAPTURE_INTERVAL):
+                camera_log.info("Capturing and processing photo...")
+                with values_lock:
+                    light = current_values[:, SENSOR_COLUMN['light_intensity']].tolist()
+                # Light per zone: each camera checks the zone it belongs to
+                light_intensity = {id_zona: None if math.isnan(value) else value for id_zona, value in zip(zone_ids, light)}
+                # Llama a la función del yolo_sender.py: un resultado por cámara, inferidos en un solo lote.
+                # Se salta YOLO en las cámaras donde está oscuro o nada cambió
+                with profiling.loop_iteration('photo'):
+                    captures = capture_and_process(light_intensity)
+                    queue_capture_results(captures)
+                for capture in captures:
+                    if not capture['inferred']:
+                        camera_log.info("%s: inference skipped (%s), reusing %d detections", capture['camera'], capture['skip_reason'], len(capture['detections']), extra={'camera': capture['camera']})
+                capture_interval = next_capture_interval(captures, light_intensity, anomaly)
+                camera_log.info("Next capture in %.0f s", capture_interval)
                 last_photo_capture = current_time
+                anomaly_pending = False
 
             time.sleep(1)  # Pausa breve para evitar espera activa
         except Exception as e:
-            print(f"[ERROR] Photo capture thread error: {e}")
+            camera_log.exception("Photo capture thread error: %s", e)
             time.sleep(5)  # Espera antes de reintentar en caso de error
 
 #function to close gpio connections, idk what happens if i dont do it
 def cleanup_hardware():
     """Safely cleanup all hardware devices"""
-    try:
-        # Turn off all actuators
-        if lamp_relay:
-            lamp_relay.off()
-            lamp_relay.close()
-        if fan_relay:
-            fan_relay.off()
-            fan_relay.close()
-        if humidifier_relay:
-            humidifier_relay.off()
-            humidifier_relay.close()
-        if irrigation_servo:
-            irrigation_servo.min()  # Return to 0 position
-            irrigation_servo.close()
-            
-        # Add DHT cleanup
-        if dht_device:
-            dht_device.exit()
-    
-            
-        # Add soil sensor cleanup
-        if soil_sensor:
-            soil_sensor.serial.close()
-            
-    except Exception as e:
-        print(f"Error during hardware cleanup: {e}")
+    for id_zona, devices in zone_devices.items():
+        try:
+            # Turn off all actuators
+            for relay in ('rele1', 'rele2', 'rele3'):
+                if devices.get(relay):
+                    devices[relay].off()
+                    devices[relay].close()
+            if devices.get('riego'):
+                devices['riego'].min()  # Return to 0 position
+                devices['riego'].close()
+                
+            # Add DHT cleanup
+            for name in SENSORS.devices_for('dht11'):
+                if devices.get(name):
+                    devices[name].exit()
+                
+            # Add soil sensor cleanup (the zones share the RS485 port)
+            for name in SENSORS.devices_for('modbus'):
+                if devices.get(name):
+                    devices[name].serial.close()
+                
+        except Exception as e:
+            log.error("Error during hardware cleanup: %s", e, extra={'zone': id_zona, 'error_class': type(e).__name__})
 
 #function to setup sensors and hardware with retries using the component name and its setup function
-#returns object to that component
-def setup_component(setup_func, component_name, max_retries=3):
-    """Generic setup function with retries"""
-    for attempt in range(max_retries):
+#retries in the background until the component is up; the rest of the service runs meanwhile
+def setup_component(name, component_name, setup_func, on_ready=None):
+    """
+    Call setup_func until it returns something truthy, waiting COMPONENT_RETRY_BASE seconds
+    after the first failure and doubling up to COMPONENT_RETRY_MAX. Partial progress is kept
+    between attempts (setup_hardware keeps the devices that opened). Runs in the component's
+    own thread; on_ready runs there once the component is up. Returns True when it is ready,
+    False if the service stopped first.
+    """
+    delay = COMPONENT_RETRY_BASE
+    attempt = 0
+    start = time.perf_counter()
+    while not shutdown_event.is_set():
+        attempt += 1
         try:
-            component = setup_func()
-            if component:
-                print(f"{component_name} initialized successfully")
-                return component
+            ready = bool(setup_func())
         except Exception as e:
-            print(f"Attempt {attempt + 1}/{max_retries} failed for {component_name}: {e}")
-            
-        if attempt < max_retries - 1:
-            time.sleep(5)
-            
-    print(f"Failed to initialize {component_name} after {max_retries} attempts")
-    return None
+            log.warning("Attempt %d failed for %s: %s", attempt, component_name, e, extra={'error_class': type(e).__name__})
+            ready = False
+        if ready:
+            break
+        COMPONENT_RETRIES.inc(component=name)
+        with startup_lock:
+            startup['components'][name].update(status='retrying', attempts=attempt)
+        if attempt == 1:
+            log_error('Sistema', f"{component_name} unavailable, running without it and retrying in the background")
+        log.warning("%s unavailable (attempt %d), retrying in %.0f s", component_name, attempt, delay,
+                    extra={'count': attempt})
+        shutdown_event.wait(delay)
+        delay = min(delay * 2, COMPONENT_RETRY_MAX)
+    else:
+        return False
+
+    ready_at = since_start()
+    with startup_lock:
+        startup['components'][name].update(status='ready', attempts=attempt, ready_at_s=ready_at,
+                                           seconds=round(time.perf_counter() - start, 3))
+    COMPONENT_AVAILABLE.set(1, component=name)
+    STARTUP_SECONDS.set(ready_at, component=name)
+    log.info("%s initialized successfully", component_name, extra={'count': attempt})
+    if on_ready:
+        on_ready()
+    return True
+
+def since_start():
+    return round(time.perf_counter() - PROCESS_START, 3)
+
+def start_component(name, component_name, setup_func, on_ready=None):
+    """
+    Run setup_component for one component in its own thread and record its timing.
+    Returns an Event that is set when the component is ready.
+    """
+    done = threading.Event()
+    with startup_lock:
+        startup['components'][name] = {'status': 'starting', 'attempts': 0, 'started_at_s': since_start()}
+    COMPONENT_AVAILABLE.set(0, component=name)
+
+    def run():
+        if setup_component(name, component_name, setup_func, on_ready):
+            done.set()
+
+    threading.Thread(target=run, name=f"init-{name}", daemon=True).start()
+    return done
+
+def wait_component(name, done):
+    """Wait for a control component until its STARTUP_TIMEOUTS deadline for the startup summary; True when it is ready."""
+    with startup_lock:
+        started_at = startup['components'][name]['started_at_s']
+    return done.wait(max(0.0, started_at + STARTUP_TIMEOUTS[name] - since_start()))
+
+def start_loop(target, name):
+    """Start one of the named loop threads (daemon, so they close with the main program)."""
+    if not running:
+        return
+    thread = threading.Thread(target=target, name=name, daemon=True)
+    thread.start()
+    loop_threads.append(thread)
+    ready_at = since_start()
+    with startup_lock:
+        startup['loops'][name] = ready_at
+    STARTUP_SECONDS.set(ready_at, component=f'{name}_loop')
+    log.info("%s loop started %.1f s after start", name.capitalize(), ready_at)
+
+def startup_report():
+    with startup_lock:
+        report = {
+            'imports_s': startup['imports_s'],
+            'components': {name: dict(component) for name, component in startup['components'].items()},
+            'loops': dict(startup['loops'])
+        }
+    # Degraded mode: devices not open yet and the control rules running in each zone
+    names = list(SENSORS.devices) + list(ACTUATORS)
+    report['missing_devices'] = {
+        id_zona: missing for id_zona in zone_ids
+        if (missing := [name for name in names if zone_devices[id_zona].get(name) is None])
+    }
+    for name, camera in vision_status()['cameras'].items():
+        if not camera['open']:
+            report['missing_devices'].setdefault(camera['id_zona'], []).append(f'camera_{name}')
+    enabled = rule_enabled.tolist()
+    report['control_rules'] = {
+        id_zona: [actuator for (actuator, _, _, _), on in zip(CONTROL_RULES, row) if on]
+        for id_zona, row in zip(zone_ids, enabled)
+    }
+    return report
+
+def database_ready():
+    # Thresholds from the database right away; until then the control loop uses DEFAULT_PARAMETERS
+    update_env_parameters()
 
 def main():
-    global running, soil_sensor, db_connection, dht_device
-    global lamp_relay, fan_relay, humidifier_relay, irrigation_servo, light_sensor  # Add light_sensor
+    global running, db_connection
     
     try:
-        print("Initializing components...")
-        
-        # Setup database
-        db_connection = setup_component(
-            setup_database,
-            "Database connection"
-        )
-        if not db_connection:
-            raise Exception("Failed to initialize database connection")
-        
-        # Get initial environmental parameters
-        update_env_parameters()
-            
-        # Setup soil sensor
-        soil_sensor = setup_component(
-            setup_soil_sensor,
-            "Soil sensor"
-        )
-        if not soil_sensor:
-            raise Exception("Failed to initialize soil sensor")
-            
-        # Setup hardware
-        hw_results = setup_component(
-            setup_hardware,
-            "Hardware devices"
-        )
-        if not all(hw_results):
-            raise Exception("Failed to initialize hardware devices")
-            
-        # Update this line to include light_sensor
-        dht_device, lamp_relay, fan_relay, humidifier_relay, irrigation_servo, light_sensor = hw_results
-        
-        print("All components initialized successfully")
+        with startup_lock:
+            startup['imports_s'] = since_start()
+        STARTUP_SECONDS.set(startup['imports_s'], component='imports')
+        log.info("Initializing components...", extra={'latency_ms': round(startup['imports_s'] * 1000)})
+        error_log.start()
+        profiling.install_signal_handlers()
         
-        # Start threads
-        sensor_thread = threading.Thread(target=sensor_reading_thread)
-        time.sleep(0.1)  # maybe with this the threads dont go stupid
-        db_thread = threading.Thread(target=database_update_thread)
-        photo_thread = threading.Thread(target=photo_capture_thread)
+        # Serve the camera API (latest images, stream, stats) and the live sensor API from the
+        # start; their snapshots fill in as the components come up
+        publish_snapshot('parameters', env_parameters)
+        publish_snapshot('actuators', actuator_snapshot())
+        start_http_server()
+        start_http_server(api, API_PORT, API_THREADS)
         
-        # Set threads as daemon so they will automatically close when the main program exits
-        sensor_thread.daemon = True
-        db_thread.daemon = True
-        photo_thread.daemon = True
+        # Independent components start together and any of them may be missing (degraded
+        # mode): each is retried in the background until it is up. The control loop starts
+        # right away with whatever devices are open; a zone's rule turns on once its sensor
+        # and actuator are available, on the default thresholds until the database answers.
+        # Named threads so logs and CPU profiles show which loop is which
+        components = {
+            'database': start_component('database', "Database connection", setup_database, database_ready),
+            'soil': start_component('soil', "Soil sensors", setup_soil_sensor),
+            'hardware': start_component('hardware', "Hardware devices", setup_hardware),
+            'vision': start_component('vision', "Camera service", setup_vision),
+        }
+        start_loop(sensor_reading_thread, "sensor")
+        # Runs before the database connects: uploads are buffered (write_rows) until it does
+        start_loop(database_update_thread, "database")
+        unavailable = [name for name in CONTROL_COMPONENTS if not wait_component(name, components[name])]
         
-        sensor_thread.start()
-        db_thread.start()
-        photo_thread.start()
+        report = startup_report()
+        ready = ", ".join(f"{name} {component['seconds']:.1f} s" for name, component in report['components'].items()
+                          if name in CONTROL_COMPONENTS and component['status'] == 'ready')
+        if unavailable:
+            log.error("Running in degraded mode after %.1f s: %s unavailable (retrying), missing devices %s, ready: %s",
+                      since_start(), ", ".join(unavailable), report['missing_devices'], ready or "none")
+        else:
+            log.info("All components initialized successfully: imports %.1f s, %s", report['imports_s'], ready,
+                     extra={'count': len(zone_ids)})
         
         # Main loop
         while True:
             time.sleep(1)
             
     except KeyboardInterrupt:
-        print("\nPrograma detenido, esperando a que terminen de ejecutarse las threads")
+        log.info("Programa detenido, esperando a que terminen de ejecutarse las threads")
         running = False
         
     except Exception as e:
         error_msg = f"Error masivo, reinicia todo porfa: {str(e)}"
-        print(error_msg)
+        log.exception(error_msg)
         log_error('Sistema', error_msg)
         running = False
         
     finally:
         # Cleanup
         running = False
+        shutdown_event.set()
         
         # Wait for threads to finish
-        if 'sensor_thread' in locals() and sensor_thread.is_alive():
-            sensor_thread.join(timeout=6)  
-        if 'db_thread' in locals() and db_thread.is_alive():
-            db_thread.join(timeout=6)  
-        if 'photo_thread' in locals() and photo_thread.is_alive():  
-            photo_thread.join(timeout=6)
+        for thread in list(loop_threads):
+            if thread.is_alive():
+                thread.join(timeout=6)
         
         cleanup_hardware()
+        stop_camera_service()
             
-        # Close database connection
+        # Close database connection, writing any buffered rows and queued capture results first
         if db_connection and db_connection.is_connected():
+            write_rows('log_buffered_rows', "buffered rows", [])
+            flush_capture_results()
             db_connection.close()
+        if buffered_rows:
+            db_log.warning("%d buffered rows were never written to the database", buffered_rows,
+                           extra={'count': buffered_rows})
+        error_log.stop()
             
-        print("Todo cerrado, bye")
+        log.info("Todo cerrado, bye")
+        stop_logging()
 
 if __name__ == "__main__":
     main()
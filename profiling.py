@@ -0,0 +1,195 @@
+import os
+import sys
+import time
+import signal
+import logging
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from threading import Lock
+import metrics
+
+# Perfilado bajo demanda: se habilita con INVERNADERO_PROFILING=1 (señales y endpoints HTTP).
+# El tiempo por iteración de los bucles se mide siempre: son dos lecturas de reloj.
+PROFILING = os.environ.get('INVERNADERO_PROFILING') == '1'
+PROFILE_DIR = "profiles"
+PROFILE_SECONDS = 30            # Duración de un perfil disparado por señal
+PROFILE_INTERVAL = 0.01         # Segundos entre muestras de pilas (100 Hz)
+MAX_PROFILE_SECONDS = 120
+TRACEMALLOC_FRAMES = 25         # Profundidad de las pilas que guarda tracemalloc
+
+log = logging.getLogger('invernadero.profiling')
+
+LOOP_SECONDS = metrics.Histogram('greenhouse_loop_seconds', 'Work time of one loop iteration', ('loop',))
+LOOP_CPU_SECONDS = metrics.Histogram('greenhouse_loop_cpu_seconds', 'CPU time of one loop iteration (its own thread)', ('loop',))
+
+stats_lock = Lock()
+loop_stats = {}
+profile_lock = Lock()
+memory_lock = Lock()
+previous_snapshot = None
+
+
+@contextmanager
+def loop_iteration(loop):
+    """
+    Mide una iteración de un bucle: tiempo de pared y CPU del hilo que la ejecuta
+    (time.thread_time). Si la CPU se acerca a la pared, el bucle está calculando; si es
+    mucho menor, está esperando E/S o un lock.
+    """
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - wall_start
+        cpu = time.thread_time() - cpu_start
+        LOOP_SECONDS.observe(wall, loop=loop)
+        LOOP_CPU_SECONDS.observe(cpu, loop=loop)
+        with stats_lock:
+            stats = loop_stats.get(loop)
+            if stats is None:
+                stats = loop_stats[loop] = {'iterations': 0, 'wall_s': 0.0, 'cpu_s': 0.0,
+                                            'max_wall_s': 0.0, 'max_cpu_s': 0.0}
+            stats['iterations'] += 1
+            stats['wall_s'] += wall
+            stats['cpu_s'] += cpu
+            stats['max_wall_s'] = max(stats['max_wall_s'], wall)
+            stats['max_cpu_s'] = max(stats['max_cpu_s'], cpu)
+            stats['last_wall_s'] = wall
+            stats['last_cpu_s'] = cpu
+
+
+def loops():
+    """Resumen por bucle: iteraciones, promedios, máximos y última iteración."""
+    with stats_lock:
+        summary = {loop: stats.copy() for loop, stats in loop_stats.items()}
+    for stats in summary.values():
+        stats['avg_wall_s'] = stats['wall_s'] / stats['iterations']
+        stats['avg_cpu_s'] = stats['cpu_s'] / stats['iterations']
+    return summary
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def sample_stacks(seconds, interval=PROFILE_INTERVAL):
+    """
+    Perfilador de muestreo: cada `interval` segundos toma la pila de todos los hilos con
+    sys._current_frames() y cuenta cada pila. Devuelve un Counter de pilas colapsadas
+    ('hilo;función (archivo:línea);...'), la raíz primero, como las espera flamegraph.pl.
+    """
+    own = threading.get_ident()
+    samples = Counter()
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame))
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            samples[';'.join(reversed(stack))] += 1
+        time.sleep(interval)
+    return samples
+
+
+def write_folded(samples, kind):
+    """Guarda las pilas colapsadas ('pila cantidad' por línea) en PROFILE_DIR y devuelve la ruta y el texto."""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"{kind}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.folded")
+    text = ''.join(f"{stack} {count}\n" for stack, count in samples.most_common() if count > 0)
+    with open(path, 'w') as f:
+        f.write(text)
+    return path, text
+
+
+def cpu_profile(seconds=PROFILE_SECONDS, interval=PROFILE_INTERVAL):
+    """
+    Toma un perfil de CPU de `seconds` segundos y lo guarda. Devuelve (ruta, texto) o None
+    si ya hay otro perfil en curso. Bloquea al llamador durante el perfil.
+    """
+    seconds = min(seconds, MAX_PROFILE_SECONDS)
+    if not profile_lock.acquire(blocking=False):
+        return None
+    try:
+        log.info("CPU profile started for %.0f s", seconds)
+        path, text = write_folded(sample_stacks(seconds, interval), 'cpu')
+        log.info("CPU profile written to %s", path)
+        return path, text
+    finally:
+        profile_lock.release()
+
+
+def traceback_label(traceback):
+    # Desde Python 3.7 las tramas van de la más antigua a la más reciente: la raíz queda primero
+    return ';'.join(f"{os.path.basename(frame.filename)}:{frame.lineno}" for frame in traceback)
+
+
+def memory_snapshot():
+    """
+    Primera llamada: empieza a registrar asignaciones con tracemalloc (tiene costo, por eso
+    no está activo desde el arranque) y toma la instantánea base. Llamadas siguientes: guarda las asignaciones vivas
+    por pila y, comparando con la instantánea anterior, lo que creció desde entonces, ambos
+    en formato colapsado con bytes como cantidad. Devuelve un resumen.
+    """
+    global previous_snapshot
+    with memory_lock:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            previous_snapshot = tracemalloc.take_snapshot()
+            log.info("tracemalloc started")
+            return {'tracing': True, 'started': True}
+
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        ])
+        current, peak = tracemalloc.get_traced_memory()
+        allocated = Counter({traceback_label(stat.traceback): stat.size
+                             for stat in snapshot.statistics('traceback')})
+        summary = {'tracing': True, 'traced_bytes': current, 'peak_bytes': peak,
+                   'allocations': write_folded(allocated, 'memory')[0]}
+        if previous_snapshot is not None:
+            growth = snapshot.compare_to(previous_snapshot, 'traceback')
+            grown = Counter({traceback_label(stat.traceback): stat.size_diff
+                             for stat in growth if stat.size_diff > 0})
+            summary['growth'] = write_folded(grown, 'memory-growth')[0]
+            summary['top_growth'] = [
+                {'where': str(stat.traceback[-1]), 'size_diff': stat.size_diff, 'count_diff': stat.count_diff}
+                for stat in growth[:10]
+            ]
+        previous_snapshot = snapshot
+        log.info("Memory snapshot written to %s (%d bytes traced)", summary['allocations'], current)
+        return summary
+
+
+def stop_memory_tracing():
+    global previous_snapshot
+    with memory_lock:
+        tracemalloc.stop()
+        previous_snapshot = None
+
+
+def install_signal_handlers():
+    """
+    SIGUSR1 toma un perfil de CPU de PROFILE_SECONDS y SIGUSR2 una instantánea de memoria,
+    ambos en un hilo aparte (el manejador de la señal vuelve enseguida):
+        kill -USR1 $(pgrep -f main5.py)
+    Se llama desde el hilo principal y solo con PROFILING habilitado.
+    """
+    if not PROFILING:
+        return
+    signal.signal(signal.SIGUSR1, lambda signum, frame: threading.Thread(
+        target=cpu_profile, name="profiler", daemon=True).start())
+    signal.signal(signal.SIGUSR2, lambda signum, frame: threading.Thread(
+        target=memory_snapshot, name="memory-snapshot", daemon=True).start())
+    log.info("Profiling enabled: SIGUSR1 = CPU profile, SIGUSR2 = memory snapshot, output in %s/", PROFILE_DIR)
@@ -0,0 +1,94 @@
+# Compara la inferencia del frame completo reducido al stream lores (como las cámaras sin 'rois')
+# contra la inferencia por recortes de regiones de interés del frame completo, en un solo lote.
+# Usa las fotos de muestra del repositorio (1280x720). No hay etiquetas, así que la comparación
+# es de detecciones encontradas, confianza y detecciones chicas, además del tiempo por imagen.
+#
+#   python roi_benchmark.py --rois "0,0,640,720;640,0,1280,720" --limit 40
+import argparse
+import glob
+import time
+import statistics
+import cv2
+from ultralytics import YOLO
+
+MODEL_PATH = "best_model.pt"
+LORES_SIZE = (640, 360)
+INFERENCE_SIZE = 640
+SAMPLE_IMAGES = "runs/detect/predict/*.jpg"
+DEFAULT_ROIS = "0,0,640,720;640,0,1280,720"
+SMALL_BOX_AREA = 48 * 48         # Área (pixeles del frame completo) por debajo de la cual una caja es "chica"
+MATCH_IOU = 0.5
+
+def parse_rois(text):
+    return [tuple(int(v) for v in box.split(',')) for box in text.split(';') if box]
+
+def boxes(result, scale=1.0, offset=(0, 0)):
+    dx, dy = offset
+    return [
+        (x1 * scale + dx, y1 * scale + dy, x2 * scale + dx, y2 * scale + dy, conf)
+        for (x1, y1, x2, y2), conf in zip(result.boxes.xyxy.tolist(), result.boxes.conf.tolist())
+    ]
+
+def iou(a, b):
+    width = min(a[2], b[2]) - max(a[0], b[0])
+    height = min(a[3], b[3]) - max(a[1], b[1])
+    if width <= 0 or height <= 0:
+        return 0.0
+    inter = width * height
+    return inter / ((a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter)
+
+def summarize(name, detections, latencies, images):
+    confidences = [d[4] for d in detections]
+    small = sum(1 for d in detections if (d[2] - d[0]) * (d[3] - d[1]) < SMALL_BOX_AREA)
+    mean_conf = statistics.mean(confidences) if confidences else 0.0
+    print(f"{name:<10} {len(detections):6d} detections  {small:5d} small  "
+          f"mean conf {mean_conf:.3f}  {statistics.mean(latencies) * 1000:7.1f} ms/image  "
+          f"({images} model inputs per image)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Full-frame vs ROI-cropped YOLO inference")
+    parser.add_argument('--rois', default=DEFAULT_ROIS, help="x1,y1,x2,y2;... in full-frame pixels")
+    parser.add_argument('--images', default=SAMPLE_IMAGES)
+    parser.add_argument('--limit', type=int, default=40)
+    args = parser.parse_args()
+
+    rois = parse_rois(args.rois)
+    paths = sorted(glob.glob(args.images))[:args.limit]
+    if not paths:
+        raise Exception(f"No images match {args.images}")
+    model = YOLO(MODEL_PATH)
+
+    full_frames = [cv2.imread(path) for path in paths]
+    scale = full_frames[0].shape[1] / LORES_SIZE[0]
+
+    # Calentar el modelo con las dos formas de llamada antes de medir
+    lores = cv2.resize(full_frames[0], LORES_SIZE, interpolation=cv2.INTER_AREA)
+    model([lores], imgsz=INFERENCE_SIZE, verbose=False)
+    model([full_frames[0][y1:y2, x1:x2] for x1, y1, x2, y2 in rois], imgsz=INFERENCE_SIZE, verbose=False)
+
+    full_detections, roi_detections = [], []
+    full_latencies, roi_latencies = [], []
+    only_full = only_roi = 0
+    for frame in full_frames:
+        start = time.perf_counter()
+        lores = cv2.resize(frame, LORES_SIZE, interpolation=cv2.INTER_AREA)
+        found_full = boxes(model([lores], imgsz=INFERENCE_SIZE, verbose=False)[0], scale)
+        full_latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        crops = [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in rois]
+        results = model(crops, imgsz=INFERENCE_SIZE, verbose=False)
+        found_roi = [d for (x1, y1, _, _), result in zip(rois, results) for d in boxes(result, offset=(x1, y1))]
+        roi_latencies.append(time.perf_counter() - start)
+
+        only_full += sum(1 for a in found_full if all(iou(a, b) < MATCH_IOU for b in found_roi))
+        only_roi += sum(1 for b in found_roi if all(iou(a, b) < MATCH_IOU for a in found_full))
+        full_detections.extend(found_full)
+        roi_detections.extend(found_roi)
+
+    print("-" * 100)
+    print(f"{len(paths)} images, {len(rois)} regions: {args.rois}")
+    summarize("full", full_detections, full_latencies, 1)
+    summarize("roi", roi_detections, roi_latencies, len(rois))
+    print(f"Only found on the full frame: {only_full}   only found on ROI crops: {only_roi}   (IoU < {MATCH_IOU})")
+    print("-" * 100)
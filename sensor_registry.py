@@ -0,0 +1,157 @@
+import os
+import json
+import numpy as np
+
+# Registro declarativo de sensores: qué dispositivos hay en cada zona, qué canales lee cada
+# uno y cómo se pasa del valor crudo al valor de ingeniería. Agregar un sensor es agregar
+# una entrada en sensors.json (y su tabla en la base), sin tocar main5.
+REGISTRY_PATH = os.environ.get('INVERNADERO_SENSORS',
+                               os.path.join(os.path.dirname(os.path.abspath(__file__)), "sensors.json"))
+
+# driver -> parámetros del dispositivo. Cada parámetro es el nombre de una clave de la
+# configuración de la zona (main5.ZONES), cuyo valor se toma por zona, o un valor literal.
+DRIVERS = {
+    'dht11': ('pin',),                  # pin de board; canales: atributos 'temperature', 'humidity'
+    'ads1115': ('address', 'channel'),  # dirección I2C y entrada del ADS1115; canal: atributo 'voltage'
+    'modbus': ('address',),             # dirección en el bus RS485; canal: número de registro
+}
+
+
+class SensorRegistry:
+    """
+    Dispositivos y canales de sensores cargados de sensors.json.
+
+    devices: nombre -> {'driver', 'component' (nombre en sensor_error_log), parámetros del driver}
+    channels: lista de {'name', 'device', 'address', 'scale', 'calibration' (opcional),
+              'valid' [mín, máx], 'default', 'table', 'label'}
+
+    El valor de un canal es crudo * scale; si tiene 'calibration' (pares [crudo escalado,
+    valor] con el crudo creciente) se interpola linealmente entre los puntos y una lectura
+    fuera de la curva es inválida en vez de extrapolarse. calibrate() convierte todos los
+    canales de todas las zonas en una sola pasada de NumPy.
+    """
+
+    def __init__(self, devices, channels):
+        self.devices = devices
+        self.channels = channels
+        self.validate()
+
+        self.names = tuple(channel['name'] for channel in channels)
+        self.column = {name: column for column, name in enumerate(self.names)}
+        self.defaults = {channel['name']: float(channel['default']) for channel in channels}
+        self.tables = {channel['name']: (channel['table'], channel['label']) for channel in channels}
+        # dispositivo -> columnas de sus canales, en el orden en que se leen
+        self.device_columns = {name: [] for name in devices}
+        for column, channel in enumerate(channels):
+            self.device_columns[channel['device']].append(column)
+        self.addresses = [self.channel_address(channel) for channel in channels]
+
+        self.scale = np.array([float(channel.get('scale', 1.0)) for channel in channels])
+        self.valid_min = np.array([float(channel['valid'][0]) for channel in channels])
+        self.valid_max = np.array([float(channel['valid'][1]) for channel in channels])
+        self.build_curves()
+
+    @classmethod
+    def load(cls, path=REGISTRY_PATH):
+        with open(path) as f:
+            registry = json.load(f)
+        return cls(registry['devices'], registry['channels'])
+
+    def validate(self):
+        """ValueError con el primer problema encontrado; se llama al cargar, antes de abrir ningún dispositivo."""
+        for name, device in self.devices.items():
+            if device.get('driver') not in DRIVERS:
+                raise ValueError(f"Device {name}: unknown driver {device.get('driver')!r}")
+            missing = [parameter for parameter in DRIVERS[device['driver']] if parameter not in device]
+            if missing:
+                raise ValueError(f"Device {name}: missing {', '.join(missing)}")
+        seen = set()
+        for channel in self.channels:
+            name = channel.get('name')
+            missing = [key for key in ('name', 'device', 'address', 'valid', 'default', 'table', 'label')
+                       if key not in channel]
+            if missing:
+                raise ValueError(f"Channel {name}: missing {', '.join(missing)}")
+            if name in seen:
+                raise ValueError(f"Channel {name} is defined twice")
+            seen.add(name)
+            if channel['device'] not in self.devices:
+                raise ValueError(f"Channel {name}: unknown device {channel['device']!r}")
+            if len(channel['valid']) != 2 or channel['valid'][0] > channel['valid'][1]:
+                raise ValueError(f"Channel {name}: valid must be [min, max]")
+            curve = channel.get('calibration')
+            if curve is not None:
+                raw = [point[0] for point in curve]
+                if len(curve) < 2 or any(len(point) != 2 for point in curve):
+                    raise ValueError(f"Channel {name}: calibration needs at least two [raw, value] points")
+                if any(b <= a for a, b in zip(raw, raw[1:])):
+                    raise ValueError(f"Channel {name}: calibration raw values must be strictly increasing")
+
+    def channel_address(self, channel):
+        """Registro Modbus como entero (acepta "0x0013"); para los otros drivers, el nombre del atributo."""
+        if self.devices[channel['device']]['driver'] == 'modbus':
+            address = channel['address']
+            return int(address, 0) if isinstance(address, str) else int(address)
+        return channel['address']
+
+    def build_curves(self):
+        """
+        Junta todas las curvas en un solo par de arreglos para poder interpolar con un único
+        np.interp: cada curva se corre en el eje crudo (shift) para que quede a continuación
+        de la anterior sin solaparse. Antes de interpolar el crudo se recorta al dominio de
+        su curva, así nunca cae en la de otro canal.
+        """
+        count = len(self.channels)
+        self.has_curve = np.zeros(count, dtype=bool)
+        self.domain_min = np.full(count, -np.inf)
+        self.domain_max = np.full(count, np.inf)
+        self.shift = np.zeros(count)
+        curve_x, curve_y = [], []
+        end = 0.0
+        for column, channel in enumerate(self.channels):
+            curve = channel.get('calibration')
+            if curve is None:
+                continue
+            raw = np.array([point[0] for point in curve], dtype=float)
+            value = np.array([point[1] for point in curve], dtype=float)
+            self.has_curve[column] = True
+            self.domain_min[column], self.domain_max[column] = raw[0], raw[-1]
+            self.shift[column] = end + 1.0 - raw[0]
+            curve_x.append(raw + self.shift[column])
+            curve_y.append(value)
+            end = curve_x[-1][-1]
+        self.curve_x = np.concatenate(curve_x) if curve_x else None
+        self.curve_y = np.concatenate(curve_y) if curve_y else None
+
+    def calibrate(self, raw):
+        """
+        raw: (zonas, canales) con NaN donde no hubo lectura. Devuelve (valores, válidos):
+        valores de ingeniería y una máscara con los que están dentro de la curva y del rango válido.
+        """
+        scaled = raw * self.scale
+        values = scaled
+        if self.curve_x is not None:
+            clipped = np.clip(scaled, self.domain_min, self.domain_max) + self.shift
+            values = np.where(self.has_curve, np.interp(clipped, self.curve_x, self.curve_y), scaled)
+        # Las comparaciones con NaN dan False: un canal sin lectura queda inválido
+        valid = ((scaled >= self.domain_min) & (scaled <= self.domain_max) &
+                 (values >= self.valid_min) & (values <= self.valid_max))
+        return values, valid
+
+    def read(self, device_name, device, out):
+        """Lee los canales crudos de un dispositivo en `out` (la fila de su zona)."""
+        driver = self.devices[device_name]['driver']
+        for column in self.device_columns[device_name]:
+            if driver == 'modbus':
+                out[column] = device.read_register(self.addresses[column])
+            else:
+                value = getattr(device, self.addresses[column])
+                out[column] = np.nan if value is None else value
+
+    def device_parameter(self, device_name, parameter, zone):
+        """Parámetro del dispositivo para una zona: la clave de la zona si existe, si no el valor literal."""
+        value = self.devices[device_name][parameter]
+        return zone.get(value, value) if isinstance(value, str) else value
+
+    def devices_for(self, *drivers):
+        return [name for name, device in self.devices.items() if device['driver'] in drivers]
@@ -0,0 +1,550 @@
+# Hardware y base de datos simulados para correr main5 sin la Raspberry Pi.
+# install() registra en sys.modules versiones simuladas de board, adafruit_dht, busio,
+# adafruit_ads1x15, minimalmodbus, mysql.connector (sobre SQLite) y yolo_sender, y pone
+# gpiozero sobre MockFactory. Hay que llamarlo antes de importar main5:
+#
+#   greenhouse = simulation.Greenhouse(speedup=20)
+#   simulation.install({1: greenhouse}, "/tmp/invernadero.db")
+#   import main5
+#
+# Con varias zonas, zone_configs(n) arma las entradas de main5.ZONES (pasarlas también a
+# main5.configure_zones) y cada zona lee de su propio Greenhouse. Como no entran cuatro
+# salidas por zona en los pines de la Pi, gpio='simulated' reemplaza a gpiozero por relés
+# y servos simulados.
+import re
+import sys
+import time
+import types
+import random
+import sqlite3
+import zlib
+from datetime import datetime
+from functools import lru_cache
+from threading import Lock
+
+# Esquema mínimo con las tablas que usa main5 (los tipos de MySQL se reducen a los de SQLite)
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS zona (
+    id_zona INTEGER PRIMARY KEY, max_temp REAL, min_air_humidity REAL, min_soil_moisture REAL,
+    db_update_time INTEGER, gdd REAL, gdd_for_harvest REAL, est_days_harvest REAL
+);
+CREATE TABLE IF NOT EXISTS sensor_temperatura (nombre TEXT, id_zona INTEGER, fecha_hora TEXT, valor REAL);
+CREATE TABLE IF NOT EXISTS sensor_humedad_aire (nombre TEXT, id_zona INTEGER, fecha_hora TEXT, valor REAL);
+CREATE TABLE IF NOT EXISTS sensor_temperatura_suelo (nombre TEXT, id_zona INTEGER, fecha_hora TEXT, valor REAL);
+CREATE TABLE IF NOT EXISTS sensor_humedad_suelo (nombre TEXT, id_zona INTEGER, fecha_hora TEXT, valor REAL);
+CREATE TABLE IF NOT EXISTS sensor_ph_suelo (nombre TEXT, id_zona INTEGER, fecha_hora TEXT, valor REAL);
+CREATE TABLE IF NOT EXISTS sensor_intensidad_luz (nombre TEXT, id_zona INTEGER, fecha_hora TEXT, valor REAL);
+CREATE TABLE IF NOT EXISTS actuador_rele1 (nombre TEXT, id_zona INTEGER, fecha_hora TEXT, estado INTEGER);
+CREATE TABLE IF NOT EXISTS actuador_rele2 (nombre TEXT, id_zona INTEGER, fecha_hora TEXT, estado INTEGER);
+CREATE TABLE IF NOT EXISTS actuador_rele3 (nombre TEXT, id_zona INTEGER, fecha_hora TEXT, estado INTEGER);
+CREATE TABLE IF NOT EXISTS actuador_riego (nombre TEXT, id_zona INTEGER, fecha_hora TEXT, estado INTEGER);
+CREATE TABLE IF NOT EXISTS sensor_error_log (
+    nombre_sensor TEXT, id_zona INTEGER, mensaje_error TEXT, repeticiones INTEGER, primera_vez TEXT, ultima_vez TEXT
+);
+CREATE TABLE IF NOT EXISTS captura (
+    id_zona INTEGER, camara TEXT, fecha_hora TEXT, inferida INTEGER, total_detecciones INTEGER,
+    PRIMARY KEY (id_zona, camara, fecha_hora)
+);
+CREATE TABLE IF NOT EXISTS captura_conteo (
+    id_zona INTEGER, camara TEXT, fecha_hora TEXT, clase TEXT, cantidad INTEGER,
+    PRIMARY KEY (id_zona, camara, fecha_hora, clase)
+);
+CREATE TABLE IF NOT EXISTS deteccion (
+    id_zona INTEGER, camara TEXT, fecha_hora TEXT, indice INTEGER, clase TEXT, confianza REAL,
+    x1 REAL, y1 REAL, x2 REAL, y2 REAL,
+    UNIQUE (id_zona, camara, fecha_hora, indice)
+);
+"""
+
+# Fila inicial de `zona` para cada zona (los mismos umbrales por defecto de main5)
+DEFAULT_ZONE = {'max_temp': 30.0, 'min_air_humidity': 50.0, 'min_soil_moisture': 30.0,
+                'db_update_time': 60, 'gdd': 0.0, 'gdd_for_harvest': 1200.0}
+
+# La misma zona que main5.ZONES trae por defecto, para que MockFactory acepte sus pines
+DEFAULT_ZONES = [
+    {'id_zona': 1, 'dht_pin': 'D4', 'ads_address': 0x49, 'light_channel': 'P0', 'modbus_address': 1,
+     'lamp_pin': 27, 'fan_pin': 22, 'humidifier_pin': 23, 'servo_pin': 12},
+]
+
+SIM_CAMERAS = [{'name': 'cam0', 'id_zona': 1}]
+SIM_CLASSES = ('tomato', 'flower', 'leaf')
+
+
+class Greenhouse:
+    """
+    Modelo simple del invernadero. Los valores derivan hacia el ambiente exterior y los
+    actuadores los empujan (ventilador enfría, humidificador humedece, riego moja el suelo).
+    El tiempo simulado avanza `speedup` veces más rápido que el real. Con frozen=True los
+    valores quedan fijos, para escalones controlados.
+    """
+
+    def __init__(self, speedup=1.0, seed=0, dht_failure_rate=0.05, device_latency=0.0):
+        self.speedup = speedup
+        self.random = random.Random(seed)
+        self.dht_failure_rate = dht_failure_rate    # El DHT11 real falla el checksum seguido
+        self.device_latency = device_latency        # Segundos por lectura de cada dispositivo
+        self.lock = Lock()
+        self.frozen = False
+        self.actuators = lambda: {}
+        self.last_step = time.monotonic()
+        self.values = {
+            'air_temperature': 26.0,
+            'air_humidity': 55.0,
+            'soil_temperature': 22.0,
+            'soil_moisture': 45.0,
+            'soil_ph': 6.8,
+            'light_intensity': 60.0
+        }
+        self.reads = {}
+
+    def step(self):
+        now = time.monotonic()
+        with self.lock:
+            minutes = (now - self.last_step) * self.speedup / 60
+            self.last_step = now
+            if self.frozen or minutes <= 0:
+                return
+            actuators = self.actuators()
+            values = self.values
+            values['air_temperature'] += minutes * (0.05 * (32.0 - values['air_temperature'])
+                                                    - (0.4 if actuators.get('fan') else 0.0))
+            values['air_humidity'] += minutes * (0.03 * (40.0 - values['air_humidity'])
+                                                 + (1.5 if actuators.get('humidifier') else 0.0))
+            values['soil_moisture'] += minutes * (-0.05 + (2.0 if actuators.get('irrigation') else 0.0))
+            for name, (low, high) in (('air_humidity', (0, 100)), ('soil_moisture', (0, 100))):
+                values[name] = min(high, max(low, values[name]))
+            values['light_intensity'] = min(100.0, max(0.0, values['light_intensity'] + self.random.gauss(0, 0.5)))
+
+    def read(self, name):
+        """Valor actual de una magnitud, avanzando el modelo y simulando la demora del dispositivo."""
+        if self.device_latency:
+            time.sleep(self.device_latency)
+        self.step()
+        with self.lock:
+            self.reads[name] = time.perf_counter()
+            return self.values[name]
+
+    def set(self, **values):
+        with self.lock:
+            self.values.update(values)
+
+
+# --- Sensores -------------------------------------------------------------------------
+
+class DHT11:
+    def __init__(self, greenhouse, pin):
+        self.greenhouse = greenhouse
+        self.pin = pin
+
+    def check(self):
+        if self.greenhouse.random.random() < self.greenhouse.dht_failure_rate:
+            raise RuntimeError("Checksum did not validate. Try again.")
+
+    @property
+    def temperature(self):
+        self.check()
+        return round(self.greenhouse.read('air_temperature'))
+
+    @property
+    def humidity(self):
+        return round(self.greenhouse.read('air_humidity'))
+
+    def exit(self):
+        pass
+
+
+class ADS1115:
+    def __init__(self, i2c, address=0x48):
+        self.i2c = i2c
+        self.address = address
+
+
+class AnalogIn:
+    def __init__(self, greenhouse, ads, channel):
+        self.greenhouse = greenhouse
+        self.channel = channel
+
+    @property
+    def voltage(self):
+        return self.greenhouse.read('light_intensity') * 3.3 / 100
+
+
+class ModbusInstrument:
+    """Sensor de suelo JXBS-3001-TR: los mismos registros y escalas que lee main5."""
+
+    REGISTERS = {0x0013: ('soil_temperature', 10), 0x0012: ('soil_moisture', 10), 0x0006: ('soil_ph', 100)}
+
+    def __init__(self, greenhouse, port, address):
+        self.greenhouse = greenhouse
+        self.port = port
+        self.address = address
+        self.serial = types.SimpleNamespace()
+
+    def read_register(self, register, *args, **kwargs):
+        name, scale = self.REGISTERS[register]
+        return int(round(self.greenhouse.read(name) * scale))
+
+
+# --- Base de datos ----------------------------------------------------------------------
+
+class DatabaseError(Exception):
+    """Equivalente de mysql.connector.Error."""
+
+
+class InterfaceError(DatabaseError):
+    """No se pudo conectar (mysql.connector.InterfaceError, p. ej. 2003)."""
+
+
+class OperationalError(DatabaseError):
+    """Se cortó la conexión o el servidor no pudo atender (mysql.connector.OperationalError, p. ej. 2013)."""
+
+
+class ProgrammingError(DatabaseError):
+    """La base rechazó la sentencia: tabla o columna inexistente, error de sintaxis."""
+
+
+class IntegrityError(DatabaseError):
+    """La base rechazó los datos: clave duplicada, restricción violada."""
+
+
+def database_error(error):
+    """Pasa un error de sqlite3 a la clase de mysql.connector que daría MySQL en el mismo caso."""
+    if isinstance(error, sqlite3.IntegrityError):
+        return IntegrityError(str(error))
+    if isinstance(error, sqlite3.OperationalError) and 'locked' in str(error):
+        return OperationalError(str(error))
+    return ProgrammingError(str(error))
+
+
+@lru_cache(maxsize=256)
+def translate(query):
+    """Pasa una consulta de MySQL al dialecto de SQLite (solo lo que usa main5)."""
+    query = query.replace('%s', '?')
+    query = re.sub(r'INSERT\s+IGNORE', 'INSERT OR IGNORE', query)
+    query = re.sub(r"NOW\(\)\s*-\s*INTERVAL\s+(\d+)\s+HOUR", r"datetime('now', 'localtime', '-\1 hours')", query)
+    return query.replace('NOW()', "datetime('now', 'localtime')")
+
+
+class Database:
+    """
+    Archivo SQLite compartido por todas las conexiones simuladas, con contadores de viajes
+    a la base (execute o executemany) y filas escritas, por tipo de sentencia.
+    query_latency agrega una demora por viaje, como la red hasta un MySQL remoto.
+    Con available = False la base está caída: conexiones y consultas fallan y se cuentan
+    en 'refused' (intentos desperdiciados durante el corte).
+    """
+
+    def __init__(self, path, query_latency=0.0, zone=None, zone_ids=(1,)):
+        self.path = path
+        self.query_latency = query_latency
+        self.lock = Lock()
+        self.available = True
+        self.stats = {'round_trips': 0, 'rows_written': 0, 'commits': 0, 'refused': 0, 'by_statement': {}}
+        connection = sqlite3.connect(path)
+        connection.executescript(SCHEMA)
+        connection.execute("PRAGMA journal_mode=WAL")
+        zone = dict(DEFAULT_ZONE, **(zone or {}))
+        connection.executemany("INSERT OR REPLACE INTO zona (id_zona, max_temp, min_air_humidity, min_soil_moisture, "
+                               "db_update_time, gdd, gdd_for_harvest) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                               [(id_zona, zone['max_temp'], zone['min_air_humidity'], zone['min_soil_moisture'],
+                                 zone['db_update_time'], zone['gdd'], zone['gdd_for_harvest']) for id_zona in zone_ids])
+        connection.commit()
+        connection.close()
+
+    def count(self, query, rows):
+        statement = query.split(None, 1)[0].upper()
+        with self.lock:
+            self.stats['round_trips'] += 1
+            by_statement = self.stats['by_statement']
+            by_statement[statement] = by_statement.get(statement, 0) + 1
+            if statement in ('INSERT', 'UPDATE', 'DELETE'):
+                self.stats['rows_written'] += rows
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.stats, by_statement=dict(self.stats['by_statement']))
+
+    def set_zone(self, id_zona, **values):
+        """Cambia la fila de `zona` desde afuera, como la interfaz web (no cuenta en las estadísticas)."""
+        connection = sqlite3.connect(self.path, timeout=10)
+        try:
+            connection.execute(f"UPDATE zona SET {', '.join(f'{name} = ?' for name in values)} WHERE id_zona = ?",
+                               (*values.values(), id_zona))
+            connection.commit()
+        finally:
+            connection.close()
+
+    def refuse(self, message, error_class=InterfaceError):
+        with self.lock:
+            self.stats['refused'] += 1
+        return error_class(f"{message} (simulated outage)")
+
+    def connect(self, **config):
+        if not self.available:
+            raise self.refuse("2003: Can't connect to MySQL server")
+        return Connection(self)
+
+
+def open_sqlite(path):
+    """Conexión a SQLite con las funciones de MySQL que usa main5 y SQLite no tiene."""
+    connection = sqlite3.connect(path, check_same_thread=False, timeout=10)
+    connection.create_function('CRC32', 1, lambda value: None if value is None else zlib.crc32(str(value).encode()))
+    connection.create_function('CONCAT_WS', -1, lambda separator, *values: separator.join(
+        str(value) for value in values if value is not None))
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+
+class Connection:
+    def __init__(self, database):
+        self.database = database
+        self.lock = Lock()
+        self.connection = open_sqlite(database.path)
+
+    def is_connected(self):
+        return self.connection is not None and self.database.available
+
+    def reconnect(self, *args, **kwargs):
+        if not self.database.available:
+            raise self.database.refuse("2003: Can't connect to MySQL server")
+        if self.connection is None:
+            self.connection = open_sqlite(self.database.path)
+
+    def cursor(self, dictionary=False, **kwargs):
+        return Cursor(self, dictionary)
+
+    def commit(self):
+        with self.lock:
+            self.connection.commit()
+        with self.database.lock:
+            self.database.stats['commits'] += 1
+
+    def rollback(self):
+        if self.connection is not None:
+            with self.lock:
+                self.connection.rollback()
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class Cursor:
+    def __init__(self, connection, dictionary):
+        self.connection = connection
+        self.dictionary = dictionary
+        self.cursor = None
+
+    def run(self, method, query, params):
+        database = self.connection.database
+        if not self.connection.is_connected():
+            raise database.refuse("2013: Lost connection to MySQL server", OperationalError)
+        if database.query_latency:
+            time.sleep(database.query_latency)
+        try:
+            with self.connection.lock:
+                self.cursor = self.connection.connection.cursor()
+                getattr(self.cursor, method)(translate(query), params)
+        except sqlite3.Error as e:
+            raise database_error(e) from e
+        database.count(query, self.cursor.rowcount if self.cursor.rowcount > 0 else 0)
+
+    def execute(self, query, params=()):
+        self.run('execute', query, tuple(params))
+
+    def executemany(self, query, rows):
+        self.run('executemany', query, [tuple(row) for row in rows])
+
+    def row(self, values):
+        if values is None or not self.dictionary:
+            return values
+        return {column[0]: value for column, value in zip(self.cursor.description, values)}
+
+    def fetchone(self):
+        return self.row(self.cursor.fetchone())
+
+    def fetchall(self):
+        return [self.row(values) for values in self.cursor.fetchall()]
+
+    @property
+    def rowcount(self):
+        return self.cursor.rowcount if self.cursor else -1
+
+    def close(self):
+        if self.cursor is not None:
+            self.cursor.close()
+
+
+# --- Servicio de cámaras ----------------------------------------------------------------
+
+class CameraService:
+    """
+    Reemplazo de yolo_sender: devuelve capturas con detecciones al azar, sin cámaras ni YOLO.
+    init_seconds simula lo que tardan init_vision en abrir las cámaras y cargar el modelo.
+    """
+
+    MIN_CAPTURE_INTERVAL = 60
+    MAX_CAPTURE_INTERVAL = 900
+
+    def __init__(self, greenhouse, cameras=SIM_CAMERAS, max_detections=5, init_seconds=0.0):
+        self.greenhouse = greenhouse
+        self.cameras = cameras
+        self.max_detections = max_detections
+        self.init_seconds = init_seconds
+        self.captures = 0
+
+    def init_vision(self):
+        time.sleep(self.init_seconds)
+        return self
+
+    def vision_status(self):
+        return {'model': True, 'cameras': {camera['name']: {'id_zona': camera['id_zona'], 'open': True}
+                                           for camera in self.cameras}}
+
+    def capture_and_process(self, light_intensity=None, archive=True):
+        captures = []
+        for camera in self.cameras:
+            detections = [
+                {'class': self.greenhouse.random.choice(SIM_CLASSES),
+                 'confidence': round(self.greenhouse.random.uniform(0.3, 0.99), 3),
+                 'bbox': [10.0, 20.0, 110.0, 140.0], 'id_zona': camera['id_zona'], 'roi': None}
+                for _ in range(self.greenhouse.random.randint(0, self.max_detections))
+            ]
+            captures.append({
+                'time': datetime.now(), 'camera': camera['name'], 'id_zona': camera['id_zona'],
+                'zones': [camera['id_zona']], 'capture_path': None, 'processed_path': None,
+                'detections': detections, 'inferred': True, 'skip_reason': None, 'scene_diff': None
+            })
+        self.captures += len(captures)
+        return captures
+
+    def next_capture_interval(self, captures, light_intensity=None, anomaly=False):
+        return self.MIN_CAPTURE_INTERVAL / self.greenhouse.speedup
+
+    def module(self):
+        module = types.ModuleType('yolo_sender')
+        module.init_vision = self.init_vision
+        module.vision_status = self.vision_status
+        module.capture_and_process = self.capture_and_process
+        module.next_capture_interval = self.next_capture_interval
+        module.start_http_server = lambda *args, **kwargs: None
+        module.stop_camera_service = lambda: None
+        module.MIN_CAPTURE_INTERVAL = self.MIN_CAPTURE_INTERVAL
+        module.MAX_CAPTURE_INTERVAL = self.MAX_CAPTURE_INTERVAL
+        return module
+
+
+# --- Actuadores sin pines -----------------------------------------------------------------
+
+class SimulatedOutput:
+    """Relé con la interfaz de gpiozero.OutputDevice que usa main5."""
+
+    def __init__(self, pin, active_high=True, initial_value=False):
+        self.pin = pin
+        self.value = bool(initial_value)
+
+    def on(self):
+        self.value = True
+
+    def off(self):
+        self.value = False
+
+    def close(self):
+        pass
+
+
+class SimulatedServo:
+    """Servo con la interfaz de gpiozero.Servo que usa main5 (value de -1 a 1)."""
+
+    def __init__(self, pin, **kwargs):
+        self.pin = pin
+        self.value = 0.0
+
+    def min(self):
+        self.value = -1.0
+
+    def mid(self):
+        self.value = 0.0
+
+    def max(self):
+        self.value = 1.0
+
+    def close(self):
+        pass
+
+
+def zone_configs(count):
+    """Entradas de main5.ZONES para `count` zonas simuladas, con pines y direcciones propios."""
+    if count == 1:
+        return [dict(zone) for zone in DEFAULT_ZONES]
+    return [
+        {'id_zona': id_zona, 'dht_pin': f'D{100 + id_zona}', 'ads_address': 0x48 + (id_zona - 1) // 4,
+         'light_channel': f'P{(id_zona - 1) % 4}', 'modbus_address': id_zona,
+         'lamp_pin': 1000 + 4 * id_zona, 'fan_pin': 1001 + 4 * id_zona,
+         'humidifier_pin': 1002 + 4 * id_zona, 'servo_pin': 1003 + 4 * id_zona}
+        for id_zona in range(1, count + 1)
+    ]
+
+
+def install(greenhouses, db_path, query_latency=0.0, zone=None, zones=DEFAULT_ZONES, gpio='mock'):
+    """
+    Registra los módulos simulados. greenhouses es {id_zona: Greenhouse} para las zonas de
+    `zones`; cada dispositivo lee del Greenhouse de la zona a la que pertenece su pin o dirección.
+    gpio='mock' usa relés y servo reales de gpiozero sobre MockFactory; gpio='simulated' los
+    reemplaza por SimulatedOutput y SimulatedServo. Devuelve (Database, CameraService).
+    """
+    if gpio == 'mock':
+        from gpiozero import Device
+        from gpiozero.pins.mock import MockFactory, MockPWMPin
+        Device.pin_factory = MockFactory(pin_class=MockPWMPin)
+    else:
+        gpiozero = types.ModuleType('gpiozero')
+        gpiozero.OutputDevice = SimulatedOutput
+        gpiozero.Servo = SimulatedServo
+        sys.modules['gpiozero'] = gpiozero
+
+    database = Database(db_path, query_latency, zone, [config['id_zona'] for config in zones])
+    cameras = CameraService(next(iter(greenhouses.values())))
+    by_dht_pin = {config['dht_pin']: greenhouses[config['id_zona']] for config in zones}
+    by_channel = {(config['ads_address'], int(config['light_channel'][1:])): greenhouses[config['id_zona']]
+                  for config in zones}
+    by_modbus_address = {config['modbus_address']: greenhouses[config['id_zona']] for config in zones}
+
+    board = types.ModuleType('board')
+    board.SCL, board.SDA = 'SCL', 'SDA'
+    board.__getattr__ = lambda name: name  # Cualquier pin D<n> existe
+    adafruit_dht = types.ModuleType('adafruit_dht')
+    adafruit_dht.DHT11 = lambda pin, **kwargs: DHT11(by_dht_pin[pin], pin)
+    busio = types.ModuleType('busio')
+    busio.I2C = lambda scl, sda, **kwargs: types.SimpleNamespace(scl=scl, sda=sda)
+    ads1x15 = types.ModuleType('adafruit_ads1x15')
+    ads1x15.ads1115 = types.ModuleType('adafruit_ads1x15.ads1115')
+    ads1x15.ads1115.ADS1115 = ADS1115
+    ads1x15.ads1115.P0, ads1x15.ads1115.P1, ads1x15.ads1115.P2, ads1x15.ads1115.P3 = range(4)
+    ads1x15.analog_in = types.ModuleType('adafruit_ads1x15.analog_in')
+    ads1x15.analog_in.AnalogIn = lambda ads, channel: AnalogIn(by_channel[(ads.address, channel)], ads, channel)
+    minimalmodbus = types.ModuleType('minimalmodbus')
+    minimalmodbus.Instrument = lambda port, address, **kwargs: ModbusInstrument(by_modbus_address[address], port, address)
+    mysql = types.ModuleType('mysql')
+    mysql.connector = types.ModuleType('mysql.connector')
+    mysql.connector.connect = database.connect
+    mysql.connector.Error = DatabaseError
+    mysql.connector.InterfaceError = InterfaceError
+    mysql.connector.OperationalError = OperationalError
+    mysql.connector.ProgrammingError = ProgrammingError
+    mysql.connector.IntegrityError = IntegrityError
+
+    sys.modules.update({
+        'board': board,
+        'adafruit_dht': adafruit_dht,
+        'busio': busio,
+        'adafruit_ads1x15': ads1x15,
+        'adafruit_ads1x15.ads1115': ads1x15.ads1115,
+        'adafruit_ads1x15.analog_in': ads1x15.analog_in,
+        'minimalmodbus': minimalmodbus,
+        'mysql': mysql,
+        'mysql.connector': mysql.connector,
+        'yolo_sender': cameras.module(),
+    })
+    return database, cameras
@@ -0,0 +1,75 @@
+-- Tablas para guardar los resultados de YOLO en la base INVERNADERO.
+-- main5.py las llena en lotes desde database_update_thread.
+-- Una captura se identifica por (id_zona, camara, fecha_hora); las detecciones y conteos la referencian así.
+-- Una cámara dividida en regiones de interés ('rois' en yolo_sender.CAMERAS) guarda una captura por zona que cubre.
+
+USE INVERNADERO;
+
+-- Una fila por captura, con el total de detecciones.
+-- inferida = 0 cuando se saltó YOLO (escena oscura o sin cambios) y se reutilizaron las detecciones anteriores.
+CREATE TABLE IF NOT EXISTS captura (
+    id_zona INT NOT NULL,
+    camara VARCHAR(32) NOT NULL,
+    fecha_hora DATETIME NOT NULL,
+    inferida BOOLEAN NOT NULL,
+    total_detecciones INT NOT NULL,
+    PRIMARY KEY (id_zona, camara, fecha_hora)
+);
+
+-- Conteo por clase de cada captura inferida.
+CREATE TABLE IF NOT EXISTS captura_conteo (
+    id_zona INT NOT NULL,
+    camara VARCHAR(32) NOT NULL,
+    fecha_hora DATETIME NOT NULL,
+    clase VARCHAR(64) NOT NULL,
+    cantidad INT NOT NULL,
+    PRIMARY KEY (id_zona, camara, fecha_hora, clase),
+    INDEX idx_conteo_clase_fecha (clase, fecha_hora)
+);
+
+-- Una fila por caja detectada, en coordenadas del stream main (pixeles).
+-- indice numera las cajas de cada captura y zona; con la clave única, reenviar un lote que
+-- ya llegó (commit perdido en un corte) no duplica detecciones.
+CREATE TABLE IF NOT EXISTS deteccion (
+    id_deteccion BIGINT AUTO_INCREMENT PRIMARY KEY,
+    id_zona INT NOT NULL,
+    camara VARCHAR(32) NOT NULL,
+    fecha_hora DATETIME NOT NULL,
+    indice INT NOT NULL,
+    clase VARCHAR(64) NOT NULL,
+    confianza FLOAT NOT NULL,
+    x1 FLOAT NOT NULL,
+    y1 FLOAT NOT NULL,
+    x2 FLOAT NOT NULL,
+    y2 FLOAT NOT NULL,
+    UNIQUE KEY uk_deteccion_captura (id_zona, camara, fecha_hora, indice),
+    INDEX idx_deteccion_clase_fecha (clase, fecha_hora),
+    INDEX idx_deteccion_zona_fecha (id_zona, fecha_hora)
+);
+
+-- Ejemplos de consultas de tendencia (usan los índices, sin reprocesar imágenes):
+--
+-- Detecciones de una clase en la última semana, por día
+--   SELECT DATE(fecha_hora) AS dia, COUNT(*) AS detecciones
+--   FROM deteccion
+--   WHERE clase = 'plaga' AND fecha_hora >= NOW() - INTERVAL 7 DAY
+--   GROUP BY dia;
+--
+-- Máximo por captura de cada clase en las últimas 24 horas
+--   SELECT clase, MAX(cantidad) AS maximo
+--   FROM captura_conteo
+--   WHERE fecha_hora >= NOW() - INTERVAL 24 HOUR
+--   GROUP BY clase;
+
+-- Bases creadas antes de tener varias cámaras:
+--   ALTER TABLE captura ADD COLUMN camara VARCHAR(32) NOT NULL DEFAULT 'cam0' AFTER id_zona,
+--       DROP PRIMARY KEY, ADD PRIMARY KEY (id_zona, camara, fecha_hora);
+--   ALTER TABLE captura_conteo ADD COLUMN camara VARCHAR(32) NOT NULL DEFAULT 'cam0' AFTER id_zona,
+--       DROP PRIMARY KEY, ADD PRIMARY KEY (id_zona, camara, fecha_hora, clase);
+--   ALTER TABLE deteccion ADD COLUMN camara VARCHAR(32) NOT NULL DEFAULT 'cam0' AFTER id_zona;
+--
+-- Bases creadas antes de la clave única de deteccion (las filas viejas toman su id como índice):
+--   ALTER TABLE deteccion ADD COLUMN indice INT NOT NULL DEFAULT 0 AFTER fecha_hora;
+--   UPDATE deteccion SET indice = id_deteccion;
+--   ALTER TABLE deteccion ALTER COLUMN indice DROP DEFAULT,
+--       ADD UNIQUE KEY uk_deteccion_captura (id_zona, camara, fecha_hora, indice);
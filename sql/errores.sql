@@ -0,0 +1,33 @@
+-- Registro de errores agregado (main5.py, error_log.ErrorLog).
+-- Los errores repetidos de un componente se escriben como una sola fila por ventana
+-- (ERROR_LOG_WINDOW), con la cantidad de repeticiones y la primera y última vez que ocurrieron.
+
+USE INVERNADERO;
+
+CREATE TABLE IF NOT EXISTS sensor_error_log (
+    id_error BIGINT AUTO_INCREMENT PRIMARY KEY,
+    nombre_sensor VARCHAR(64) NOT NULL,
+    id_zona INT NOT NULL,
+    mensaje_error TEXT NOT NULL,
+    repeticiones INT NOT NULL DEFAULT 1,
+    primera_vez DATETIME NULL,
+    ultima_vez DATETIME NULL,
+    fecha_hora TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_error_sensor_fecha (nombre_sensor, ultima_vez)
+);
+
+-- Bases con la tabla anterior (una fila por error):
+--   ALTER TABLE sensor_error_log
+--       ADD COLUMN repeticiones INT NOT NULL DEFAULT 1,
+--       ADD COLUMN primera_vez DATETIME NULL,
+--       ADD COLUMN ultima_vez DATETIME NULL,
+--       ADD INDEX idx_error_sensor_fecha (nombre_sensor, ultima_vez);
+--
+-- Errores más frecuentes del último día:
+--   SELECT nombre_sensor, mensaje_error, SUM(repeticiones) AS veces, MAX(ultima_vez) AS ultima
+--   FROM sensor_error_log
+--   WHERE ultima_vez >= NOW() - INTERVAL 1 DAY
+--   GROUP BY nombre_sensor, mensaje_error
+--   ORDER BY veces DESC;
+--
+-- Las filas que no se pudieron insertar quedan en error_log.jsonl (una por línea) junto al programa.
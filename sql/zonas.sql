@@ -0,0 +1,18 @@
+-- Índices para varias zonas (main5.py, ZONES).
+-- main5 lee el último estado de los cuatro actuadores de todas las zonas en una sola consulta
+-- (MAX(fecha_hora) por id_zona y JOIN) y el promedio de temperatura de 24 h agrupado por zona;
+-- sin un índice (id_zona, fecha_hora) las dos recorren la tabla completa en cada ciclo.
+-- Cada zona necesita su fila en `zona` con los umbrales de control.
+
+USE INVERNADERO;
+
+CREATE INDEX idx_rele1_zona_fecha ON actuador_rele1 (id_zona, fecha_hora);
+CREATE INDEX idx_rele2_zona_fecha ON actuador_rele2 (id_zona, fecha_hora);
+CREATE INDEX idx_rele3_zona_fecha ON actuador_rele3 (id_zona, fecha_hora);
+CREATE INDEX idx_riego_zona_fecha ON actuador_riego (id_zona, fecha_hora);
+CREATE INDEX idx_temperatura_zona_fecha ON sensor_temperatura (id_zona, fecha_hora);
+
+-- Agregar una zona (los pines y direcciones de sus dispositivos van en main5.ZONES):
+--   INSERT INTO zona (id_zona, max_temp, min_air_humidity, min_soil_moisture, db_update_time,
+--                     gdd, gdd_for_harvest)
+--   VALUES (2, 30, 50, 30, 60, 0, <gdd del cultivo>);
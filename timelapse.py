@@ -0,0 +1,114 @@
+import os
+import time
+import logging
+from datetime import datetime
+from threading import Lock
+import av
+
+log = logging.getLogger('invernadero.timelapse')
+
+
+class TimelapseEncoder:
+    """
+    Time-lapse diario en H.264 escrito frame a frame con un encoder persistente.
+    Cada día se abre un archivo nuevo (timelapse_YYYYMMDD.mp4). El MP4 es fragmentado con un
+    fragmento por frame (no por keyframe: con gop=48 y una captura cada 15 min serían 12 h)
+    y el encoder usa zerolatency, así que cada frame se escribe al disco cuando llega el
+    siguiente y un corte de luz solo pierde el último en vez de todo el día.
+    """
+
+    def __init__(self, directory, fps=24, codec="libx264", crf=28, preset="veryfast", gop=48):
+        self.directory = directory
+        self.fps = fps
+        self.codec = codec
+        self.crf = crf
+        self.preset = preset
+        self.gop = gop
+        self.lock = Lock()
+        self.container = None
+        self.stream = None
+        self.path = None
+        self.day = None
+        self.size = None
+        self.day_stats = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def append(self, frame, jpeg_bytes=0, when=None):
+        """
+        Agrega un frame BGR al video del día. jpeg_bytes es el tamaño de este mismo frame en
+        JPEG, solo para comparar cuánto ocupa el video contra guardar las fotos sueltas.
+        """
+        day = (when or datetime.now()).date()
+        height, width = frame.shape[:2]
+        with self.lock:
+            if self.container is None or day != self.day or (width, height) != self.size:
+                self.open(day, width, height)
+
+            start = time.perf_counter()
+            video_frame = av.VideoFrame.from_ndarray(frame, format="bgr24")
+            for packet in self.stream.encode(video_frame):
+                self.container.mux(packet)
+            encode_ms = (time.perf_counter() - start) * 1000
+
+            self.day_stats['frames'] += 1
+            self.day_stats['encode_ms_total'] += encode_ms
+            self.day_stats['encode_ms_last'] = encode_ms
+            self.day_stats['jpeg_bytes'] += jpeg_bytes
+        return encode_ms
+
+    def open(self, day, width, height):
+        self.close_locked()
+        path = os.path.join(self.directory, f"timelapse_{day:%Y%m%d}.mp4")
+        part = 1
+        while os.path.exists(path):
+            # Reinicio a mitad del día: un MP4 cerrado no se puede continuar, se abre otra parte
+            part += 1
+            path = os.path.join(self.directory, f"timelapse_{day:%Y%m%d}_{part}.mp4")
+
+        # flush_packets: sin él avio junta 256 KiB antes de escribir, aunque el fragmento esté cerrado
+        self.container = av.open(path, mode="w", options={"movflags": "frag_every_frame+empty_moov+default_base_moof",
+                                                          "flush_packets": "1"})
+        self.stream = self.container.add_stream(self.codec, rate=self.fps)
+        self.stream.width = width
+        self.stream.height = height
+        self.stream.pix_fmt = "yuv420p"
+        self.stream.options = {
+            "crf": str(self.crf),
+            "preset": self.preset,
+            "tune": "zerolatency",
+            "g": str(self.gop)
+        }
+        self.path = path
+        self.day = day
+        self.size = (width, height)
+        self.day_stats = {'frames': 0, 'encode_ms_total': 0.0, 'encode_ms_last': None, 'jpeg_bytes': 0}
+        log.info("Time-lapse file opened: %s", path)
+
+    def close(self):
+        with self.lock:
+            self.close_locked()
+
+    def close_locked(self):
+        if self.container is None:
+            return
+        try:
+            for packet in self.stream.encode(None):
+                self.container.mux(packet)
+            self.container.close()
+        except Exception as e:
+            log.error("Could not close time-lapse %s: %s", self.path, e, extra={'error_class': type(e).__name__})
+        self.container = None
+        self.stream = None
+
+    def stats(self):
+        with self.lock:
+            frames = self.day_stats.get('frames', 0)
+            video_bytes = os.path.getsize(self.path) if self.path and os.path.exists(self.path) else 0
+            return {
+                'path': self.path,
+                'frames': frames,
+                'avg_encode_ms': self.day_stats['encode_ms_total'] / frames if frames else None,
+                'last_encode_ms': self.day_stats.get('encode_ms_last'),
+                'video_bytes': video_bytes,
+                'jpeg_bytes': self.day_stats.get('jpeg_bytes', 0)
+            }
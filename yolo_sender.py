@@ -1,109 +1,815 @@
-from picamera2 import Picamera2
-from libcamera import controls
-import torch
 import time
-from flask import Flask, jsonify, send_file
+import logging
+from flask import Flask, Response, jsonify, request
 import os
-from datetime import datetime
-import shutil
-from threading import Thread
-from ultralytics import YOLO
+import hashlib
+from datetime import datetime, timezone
+from threading import Thread, Lock, Condition
+import cv2
+import numpy as np
+from waitress import serve
+from cameras import open_camera, ewma
+from image_archive import ImageArchive
+from timelapse import TimelapseEncoder
+import metrics
+from logging_setup import setup_logging, stop_logging
+
+# Para que los mensajes de init_vision vayan al log (no hace nada si main5 ya lo configuró)
+setup_logging()
+log = logging.getLogger('invernadero.vision')
 
 # Directorios de configuración
 BASE_DIR = "camera_images"
 CAPTURE_DIR = os.path.join(BASE_DIR, "captures")
 PROCESSED_DIR = os.path.join(BASE_DIR, "processed")
+TIMELAPSE_DIR = os.path.join(BASE_DIR, "timelapse")
+
+# Cámaras y la zona que cubre cada una ('csi' con Picamera2 o 'usb' por V4L2).
+# 'rois' (opcional) divide la imagen en camas de cultivo: cada región se recorta del stream main
+# y se infiere por separado, con sus detecciones asignadas a su propia zona. Las cajas van en
+# pixeles de CAPTURE_SIZE (x1, y1, x2, y2); con lados de hasta INFERENCE_SIZE el modelo las ve
+# a resolución completa en vez de reducidas junto con paredes y pasillos.
+CAMERAS = [
+    {'name': 'cam0', 'type': 'csi', 'camera_num': 0, 'id_zona': 1},
+    # {'name': 'cam1', 'type': 'usb', 'device': '/dev/video0', 'id_zona': 2,
+    #  'rois': [{'name': 'cama_a', 'id_zona': 2, 'box': (0, 180, 640, 720)},
+    #           {'name': 'cama_b', 'id_zona': 3, 'box': (640, 180, 1280, 720)}]},
+]
+DEFAULT_CAMERA = CAMERAS[0]['name']
+MAX_BATCH_SIZE = 4               # Imágenes (frames o recortes) por llamada al modelo; el resto espera al ciclo siguiente
+CAMERA_RETRY_BASE = 5            # Espera tras el primer fallo de una cámara (s), se duplica en cada fallo
+CAMERA_RETRY_MAX = 300           # Espera máxima entre reintentos de una cámara (s)
+
+# Asegurar que los directorios existan (uno por cámara)
+for camera_config in CAMERAS:
+    os.makedirs(os.path.join(CAPTURE_DIR, camera_config['name']), exist_ok=True)
+    os.makedirs(os.path.join(PROCESSED_DIR, camera_config['name']), exist_ok=True)
+
+# Filtro de cambio de escena (evita correr YOLO cuando nada cambió)
+SCENE_THUMB_SIZE = (32, 18)      # Miniatura (ancho, alto) en escala de grises para comparar escenas
+SCENE_DIFF_THRESHOLD = 6.0       # Diferencia media (0-255) a partir de la cual la escena cambió
+DARK_LIGHT_THRESHOLD = 5.0       # % de light_intensity por debajo del cual no se procesa
+SCENE_MAX_SKIP_SECONDS = 3600    # Forzar inferencia al menos cada hora aunque no haya cambios
+
+# Cámara: stream "main" para el archivo y stream "lores" del tamaño de entrada del modelo
+CAPTURE_SIZE = (1280, 720)       # Resolución de las fotos que se guardan
+LORES_SIZE = (640, 360)          # Resolución del stream de inferencia (YUV420)
+INFERENCE_SIZE = 640             # Lado de entrada del modelo YOLO
+WARMUP_RUNS = 2                  # Inferencias de calentamiento con un frame vacío al arrancar
+CONTINUOUS_INFERENCE = False     # En yolo_sender.main: inferir sin pausa sobre lores y archivar según el planificador
+CONTINUOUS_INFERENCE_PERIOD = 1  # Pausa entre inferencias en modo continuo (s)
 
-# Asegurar que los directorios existan
-os.makedirs(CAPTURE_DIR, exist_ok=True)
-os.makedirs(PROCESSED_DIR, exist_ok=True)
+# Archivo de imágenes: resolución completa las últimas horas, luego decimado y recomprimido
+ARCHIVE_FULL_RES_HOURS = 24              # Horas que se guardan todas las fotos tal cual
+ARCHIVE_DECIMATE_SECONDS = 1800          # Después, una foto cada este intervalo
+ARCHIVE_QUALITY = 60                     # Calidad JPEG de las fotos decimadas
+ARCHIVE_SCALE = 0.5                      # Escala de las fotos decimadas
+CAPTURE_ARCHIVE_BYTES = 2 * 1024 ** 3    # Presupuesto de disco para captures/ (se reparte entre cámaras)
+PROCESSED_ARCHIVE_BYTES = 512 * 1024 ** 2  # Presupuesto de disco para processed/ (se reparte entre cámaras)
 
-# Inicializar la cámara con enfoque automático
-picam2 = Picamera2()
-camera_config = picam2.create_still_configuration(main={"size": (1280, 720)})
-picam2.configure(camera_config)
-picam2.set_controls({"AfMode": controls.AfModeEnum.Continuous})
-picam2.start()
-time.sleep(2)  # Calentamiento de la cámara
+# Time-lapse diario en H.264 (un frame por captura archivada)
+TIMELAPSE_ENABLED = True
+TIMELAPSE_SOURCE = 'raw'                 # 'raw' (frame lores) o 'processed' (frame anotado por YOLO)
+TIMELAPSE_FPS = 24                       # Velocidad de reproducción del video
+TIMELAPSE_CODEC = 'libx264'              # 'h264_v4l2m2m' usa el encoder por hardware de la Pi
+TIMELAPSE_CRF = 28                       # Calidad (más alto = más chico)
 
-# Cargar modelo YOLO
+# Servidor HTTP (waitress: multihilo, con keep-alive)
+HTTP_HOST = '0.0.0.0'
+HTTP_PORT = 5000
+HTTP_THREADS = 16                # Cada cliente conectado a /stream ocupa uno de estos hilos
+MAX_STREAM_CLIENTS = 12          # Clientes de /stream a la vez; los hilos restantes quedan para el resto
+HTTP_OUTBUF_HIGH_WATERMARK = 256 * 1024  # Bytes en cola por conexión antes de frenar al generador
+
+# Stream MJPEG en vivo (/stream)
+STREAM_FPS = 5                   # Frames por segundo que se codifican para el stream raw
+STREAM_JPEG_QUALITY = 70         # Calidad JPEG del stream raw
+STREAM_KEEPALIVE = 10            # Reenviar el último frame si no hay uno nuevo en este tiempo (s)
+
+# Planificador adaptativo de capturas
+MIN_CAPTURE_INTERVAL = 60        # Intervalo con actividad reciente (s)
+STANDALONE_MIN_CAPTURE_INTERVAL = 20  # Mínimo de yolo_sender.py solo, sin main5: el período fijo que tenía
+MAX_CAPTURE_INTERVAL = 900       # Intervalo con escena quieta u oscura (s)
+ACTIVITY_DECAY = 0.6             # Cuánto se conserva la actividad de una captura a la siguiente
+INFERENCE_CPU_BUDGET = 0.05      # Fracción de un núcleo que YOLO puede usar en promedio
+
+# Cámaras y modelo YOLO: los abre init_vision(), no el import, para que main5 pueda arrancar
+# el control mientras tanto (ultralytics y torch se importan recién ahí)
 MODEL_PATH = "best_model.pt"
-model = YOLO(MODEL_PATH)
+CAMERA_WARMUP = 2                # Segundos entre abrir las cámaras y la primera captura
+cameras = {}
+model = None
 
 # Crear la app Flask
 app = Flask(__name__)
 
+# Métricas exportadas en /metrics (ver metrics.py)
+CAPTURE_SECONDS = metrics.Histogram('greenhouse_camera_capture_seconds', 'Frame capture latency (lores only, or lores plus main for archived captures)', ('camera', 'stream'))
+CAPTURES = metrics.Counter('greenhouse_camera_captures_total', 'Frame captures by outcome', ('camera', 'result'))
+INFERENCE_SECONDS = metrics.Histogram('greenhouse_inference_seconds', 'Latency of one batched YOLO call')
+INFERENCE_IMAGES = metrics.Counter('greenhouse_inference_images_total', 'Images (frames or ROI crops) sent to YOLO')
+INFERENCE_SKIPPED = metrics.Counter('greenhouse_inference_skipped_total', 'Camera captures that skipped YOLO', ('reason',))
+
+# Estado del último frame procesado por YOLO (por cámara) y contadores de inferencia
+stats_lock = Lock()
+inference_stats = {
+    'executed': 0,
+    'images_inferred': 0,
+    'skipped_dark': 0,
+    'skipped_unchanged': 0,
+    'skipped_deferred': 0,
+    'avg_inference_s': None,
+    'avg_batch_size': None,
+    'cold_inference_s': None,
+    'warmup_s': None,
+    'startup': {}                # Segundos de cada paso de init_vision
+}
+last_inference = {
+    camera_config['name']: {
+        'thumbnail': None,
+        'time': 0.0,
+        'processed_path': None,
+        'detections': []
+    }
+    for camera_config in CAMERAS
+}
+camera_retry_at = {camera_config['name']: 0.0 for camera_config in CAMERAS}
+capture_schedule = {
+    'activity': 0.0,
+    'class_counts': {},
+    'interval': MAX_CAPTURE_INTERVAL
+}
+
+# Últimas imágenes en memoria: (cámara, 'capture'|'processed') -> (bytes JPEG, etag, fecha de modificación).
+# publish_frame reemplaza la tupla completa, así que los lectores nunca ven una imagen a medias.
+latest_frames = {
+    (camera_config['name'], kind): None
+    for camera_config in CAMERAS
+    for kind in ('capture', 'processed')
+}
+
+# Frames del stream MJPEG: (cámara, fuente) -> (secuencia, parte multipart ya armada).
+# Cada frame se codifica una sola vez y todos los clientes comparten los mismos bytes.
+# Un cliente lento simplemente salta a la secuencia más nueva, sin cola propia.
+stream_condition = Condition()
+stream_frames = {
+    (camera_config['name'], source): (0, None)
+    for camera_config in CAMERAS
+    for source in ('raw', 'processed')
+}
+stream_clients = {key: 0 for key in stream_frames}
+stream_stats = {
+    'frames_encoded': 0,
+    'frames_sent': 0,
+    'frames_dropped': 0,
+    'clients_rejected': 0
+}
+stream_producer = None
+
 # Funciones de manejo de imágenes
-def keep_only_latest_file(directory):
-    files = [os.path.join(directory, f) for f in os.listdir(directory) if os.path.isfile(os.path.join(directory, f))]
-    if files:
-        files.sort(key=os.path.getmtime)
-        for f in files[:-1]:
-            os.remove(f)
+def publish_frame(camera, kind, data, modified=None):
+    """Publica los bytes JPEG de la última imagen para que los sirva Flask desde memoria."""
+    modified = modified or datetime.now(timezone.utc)
+    latest_frames[(camera, kind)] = (data, hashlib.sha1(data).hexdigest(), modified.replace(microsecond=0))
+    if kind == 'processed':
+        push_stream_frame((camera, 'processed'), data)
+
+def push_stream_frame(key, data):
+    """Arma la parte multipart una vez y despierta a los clientes del stream."""
+    part = b'--frame\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n%s\r\n' % (len(data), data)
+    with stream_condition:
+        sequence = stream_frames[key][0] + 1
+        stream_frames[key] = (sequence, part)
+        stream_stats['frames_encoded'] += 1
+        stream_condition.notify_all()
+
+def raw_stream_thread():
+    """Codifica frames lores a STREAM_FPS de cada cámara que tenga clientes en el stream raw."""
+    period = 1.0 / STREAM_FPS
+    while True:
+        with stream_condition:
+            stream_condition.wait_for(lambda: any(stream_clients[(name, 'raw')] for name in cameras))
+            active = [name for name in cameras if stream_clients[(name, 'raw')]]
+        start = time.perf_counter()
+        for name in active:
+            try:
+                push_stream_frame((name, 'raw'), cameras[name].stream_jpeg())
+            except Exception as e:
+                log.error("Stream frame failed for %s: %s", name, e, extra={'camera': name, 'error_class': type(e).__name__})
+        time.sleep(max(0.0, period - (time.perf_counter() - start)))
+
+def start_stream_producer():
+    """Arranca el hilo que alimenta el stream raw la primera vez que alguien lo pide."""
+    global stream_producer
+    with stream_condition:
+        if stream_producer is None:
+            stream_producer = Thread(target=raw_stream_thread, daemon=True)
+            stream_producer.start()
+
+def reserve_stream_client(key):
+    """
+    Anota un cliente de /stream si queda lugar. Cada cliente retiene un hilo de waitress
+    mientras está conectado; sin este tope HTTP_THREADS streams dejarían sin hilos a
+    /latest-capture, /stats y /metrics.
+    """
+    with stream_condition:
+        if sum(stream_clients.values()) >= MAX_STREAM_CLIENTS:
+            stream_stats['clients_rejected'] += 1
+            return False
+        stream_clients[key] += 1
+        stream_condition.notify_all()
+        return True
+
+def release_stream_client(key):
+    with stream_condition:
+        stream_clients[key] -= 1
+
+def mjpeg_stream(key, fps):
+    """Generador multipart para un cliente; nunca acumula frames, siempre manda el más nuevo."""
+    period = 1.0 / fps
+    last_sequence = 0
+    while True:
+        start = time.perf_counter()
+        with stream_condition:
+            stream_condition.wait_for(
+                lambda: stream_frames[key][0] != last_sequence,
+                timeout=STREAM_KEEPALIVE
+            )
+            sequence, part = stream_frames[key]
+            if last_sequence and sequence - last_sequence > 1:
+                stream_stats['frames_dropped'] += sequence - last_sequence - 1
+            # Un keep-alive sin ningún frame todavía no manda nada
+            if part is not None:
+                stream_stats['frames_sent'] += 1
+        if part is None:
+            continue
+        last_sequence = sequence
+        yield part
+        time.sleep(max(0.0, period - (time.perf_counter() - start)))
+
+def save_frame(camera, kind, path, data):
+    """
+    Publica la imagen en memoria y después la escribe al disco: los clientes de /latest-*
+    la ven sin esperar a la tarjeta SD, y si la escritura falla igual se sirve la más nueva.
+    """
+    publish_frame(camera, kind, data)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+def load_latest_frames():
+    """Carga en memoria la imagen más reciente de cada archivo (al arrancar el servicio)."""
+    for name in last_inference:
+        for kind, archive in (('capture', capture_archives[name]), ('processed', processed_archives[name])):
+            latest = archive.latest()
+            if latest:
+                with open(latest, 'rb') as f:
+                    data = f.read()
+                publish_frame(name, kind, data, datetime.fromtimestamp(os.path.getmtime(latest), timezone.utc))
+
+def scene_thumbnail(gray):
+    """Reduce el plano Y (escala de grises) a una miniatura para comparar escenas."""
+    width, height = SCENE_THUMB_SIZE
+    block_h, block_w = gray.shape[0] // height, gray.shape[1] // width
+    gray = gray[:block_h * height, :block_w * width]
+    return gray.reshape(height, block_h, width, block_w).mean(axis=(1, 3))
+
+def scene_difference(camera, thumbnail):
+    """Diferencia media contra el último frame procesado de la cámara, o None si no hay referencia."""
+    previous = last_inference[camera]['thumbnail']
+    if previous is None:
+        return None
+    return float(np.abs(thumbnail - previous).mean())
+
+def zone_light(light_intensity, id_zona=None):
+    """
+    light_intensity puede ser un valor o un diccionario {id_zona: valor} (main5 con varias zonas).
+    Con id_zona devuelve la luz de esa zona; sin zona, la de la zona más iluminada.
+    """
+    if not isinstance(light_intensity, dict):
+        return light_intensity
+    if id_zona is not None:
+        return light_intensity.get(id_zona)
+    return max((value for value in light_intensity.values() if value is not None), default=None)
+
+def inference_skip_reason(camera, scene_diff, light_intensity):
+    """Devuelve por qué no hace falta correr YOLO, o None si hay que correrlo."""
+    if light_intensity is not None and light_intensity < DARK_LIGHT_THRESHOLD:
+        return 'dark'
+    if scene_diff is None or time.time() - last_inference[camera]['time'] >= SCENE_MAX_SKIP_SECONDS:
+        return None
+    if scene_diff < SCENE_DIFF_THRESHOLD:
+        return 'unchanged'
+    return None
+
+def extract_detections(result, id_zona, scale=1.0, offset=(0, 0), roi=None):
+    """
+    Convierte las cajas de un resultado de YOLO en una lista de diccionarios.
+    scale y offset llevan las coordenadas de la imagen inferida (frame lores o recorte de una
+    región) al frame de archivo; id_zona y roi indican a qué zona pertenece cada detección.
+    """
+    boxes = result.boxes
+    dx, dy = offset
+    return [
+        {
+            'class': result.names[int(cls)],
+            'confidence': float(conf),
+            'bbox': [x1 * scale + dx, y1 * scale + dy, x2 * scale + dx, y2 * scale + dy],
+            'id_zona': id_zona,
+            'roi': roi
+        }
+        for cls, conf, (x1, y1, x2, y2) in zip(boxes.cls.tolist(), boxes.conf.tolist(), boxes.xyxy.tolist())
+    ]
+
+def roi_detections(camera, results):
+    """Junta las detecciones de los recortes de una cámara, en coordenadas del frame completo."""
+    detections = []
+    for roi, result in zip(camera.rois, results):
+        detections.extend(extract_detections(result, roi['id_zona'], offset=roi['box'][:2], roi=roi['name']))
+    return detections
+
+def annotate_frame(frame, rois, detections):
+    """
+    Dibuja las regiones de interés y las detecciones sobre una copia del frame: el del stream main
+    cuando la imagen procesada se archiva, el lores cuando solo va al stream.
+    """
+    annotated = frame.copy()
+    scale = frame.shape[1] / CAPTURE_SIZE[0]
+    for roi in rois:
+        x1, y1, x2, y2 = (int(v * scale) for v in roi['box'])
+        cv2.rectangle(annotated, (x1, y1), (x2, y2), (0, 200, 255), 1)
+        cv2.putText(annotated, roi['name'], (x1 + 3, y1 + 14), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (0, 200, 255), 1)
+    for detection in detections:
+        x1, y1, x2, y2 = (int(v * scale) for v in detection['bbox'])
+        cv2.rectangle(annotated, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        label = f"{detection['class']} {detection['confidence']:.2f}"
+        cv2.putText(annotated, label, (x1, max(y1 - 4, 12)), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (0, 255, 0), 1)
+    return annotated
+
+def append_timelapse(camera, frame):
+    """
+    Agrega el frame al time-lapse del día; si el encoder falla, la captura sigue igual.
+    Para comparar tamaños se codifica el mismo frame como JPEG: la foto archivada es del stream
+    main y mide cuatro veces más píxeles que el video.
+    """
+    if not TIMELAPSE_ENABLED:
+        return
+    try:
+        timelapses[camera].append(frame, len(cv2.imencode('.jpg', frame)[1]))
+    except Exception as e:
+        log.error("Time-lapse frame failed for %s: %s", camera, e, extra={'camera': camera, 'error_class': type(e).__name__})
+
+def run_model(frames, warmup=False):
+    """
+    Corre YOLO sobre una lista de imágenes (frames lores o recortes), siempre con los mismos argumentos para que
+    ultralytics reutilice su predictor. La primera llamada del proceso se registra como
+    latencia en frío; las demás, salvo las de calentamiento (warmup=True, frames vacíos), alimentan
+    el promedio en caliente que usa next_capture_interval y las métricas de inferencia.
+    """
+    start = time.perf_counter()
+    results = model(frames, imgsz=INFERENCE_SIZE, verbose=False)
+    inference_s = time.perf_counter() - start
+    with stats_lock:
+        if inference_stats['cold_inference_s'] is None:
+            inference_stats['cold_inference_s'] = inference_s
+        elif not warmup:
+            inference_stats['avg_inference_s'] = ewma(inference_stats['avg_inference_s'], inference_s)
+    if not warmup:
+        INFERENCE_SECONDS.observe(inference_s)
+        INFERENCE_IMAGES.inc(len(frames))
+    return results, inference_s
+
+def warm_up_model():
+    """
+    Paga la preparación del modelo (grafo, memoria, kernels perezosos) al arrancar el servicio
+    con frames vacíos del tamaño de producción, con un solo frame y con un lote completo.
+    """
+    start = time.perf_counter()
+    dummy = np.zeros((LORES_SIZE[1], LORES_SIZE[0], 3), dtype=np.uint8)
+    images = sum(len(camera.rois) or 1 for camera in cameras.values())
+    batch_size = max(1, min(images, MAX_BATCH_SIZE))
+    for _ in range(WARMUP_RUNS):
+        run_model([dummy], warmup=True)
+        if batch_size > 1:
+            run_model([dummy] * batch_size, warmup=True)
+    with stats_lock:
+        inference_stats['warmup_s'] = time.perf_counter() - start
+    log.info("Model warmed up in %.1f s (cold inference %.0f ms)", inference_stats['warmup_s'],
+             inference_stats['cold_inference_s'] * 1000, extra={'latency_ms': inference_stats['cold_inference_s'] * 1000})
 
-def capture_and_process():
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    capture_path = os.path.join(CAPTURE_DIR, f"capture_{timestamp}.jpg")
-    picam2.capture_file(capture_path)
+def capture_camera(camera, timestamp, archive):
+    """
+    Captura un frame de una cámara. Si falla, la cámara queda en espera con backoff
+    exponencial para no frenar al resto en cada ciclo. Devuelve None si no hubo frame, o
+    (ruta archivada, plano Y lores, frame lores, JPEG del stream main, recortes).
+    """
+    capture_path = os.path.join(CAPTURE_DIR, camera.name, f"capture_{timestamp}.jpg") if archive else None
+    start = time.perf_counter()
+    try:
+        gray, frame, jpeg, crops = camera.capture(archive)
+    except Exception as e:
+        CAPTURES.inc(camera=camera.name, result='error')
+        failures = camera.metrics['consecutive_failures']
+        camera_retry_at[camera.name] = time.time() + min(CAMERA_RETRY_MAX, CAMERA_RETRY_BASE * 2 ** (failures - 1))
+        log.error("Camera %s capture failed: %s", camera.name, e,
+                  extra={'camera': camera.name, 'zone': camera.id_zona, 'error_class': type(e).__name__})
+        return None
+    CAPTURE_SECONDS.observe(time.perf_counter() - start, camera=camera.name, stream='main' if archive else 'lores')
+    CAPTURES.inc(camera=camera.name, result='ok')
+    if archive:
+        save_frame(camera.name, 'capture', capture_path, jpeg)
+        capture_archives[camera.name].add(capture_path)
+    return capture_path, gray, frame, jpeg, crops
+
+def capture_and_process(light_intensity=None, archive=True):
+    """
+    Captura un frame de cada cámara y procesa con YOLO, en una sola llamada por lotes,
+    los que lo necesitan: se salta si está oscuro o la escena de esa cámara no cambió,
+    y en ese caso se reutilizan sus últimas detecciones.
+    Las cámaras se atienden de la inferencia más vieja a la más nueva, así que si hay más
+    de MAX_BATCH_SIZE imágenes pendientes, las que quedan afuera van primero en el ciclo siguiente.
+    La inferencia usa el stream lores, o un recorte del stream main por región de interés en las
+    cámaras que las tienen; con archive=True también se guarda la foto del stream main.
+    Devuelve una lista con un resultado por cámara; 'zones' lista las zonas que cubre.
+    """
+    if model is None:
+        raise RuntimeError("Vision not initialized (call init_vision first)")
+    captured_at = datetime.now()
+    timestamp = captured_at.strftime("%Y%m%d_%H%M%S")
+    order = sorted(cameras.values(), key=lambda camera: last_inference[camera.name]['time'])
+
+    captures = []
+    frames = {}
+    batch = []
+    batch_images = 0
+    for camera in order:
+        if time.time() < camera_retry_at[camera.name]:
+            continue
+        captured = capture_camera(camera, timestamp, archive)
+        if captured is None:
+            continue
+        capture_path, gray, frame, jpeg, crops = captured
+        frames[camera.name] = frame
+        images = crops if camera.rois else [frame]
+
+        thumbnail = scene_thumbnail(gray)
+        scene_diff = scene_difference(camera.name, thumbnail)
+        skip_reason = inference_skip_reason(camera.name, scene_diff, zone_light(light_intensity, camera.id_zona))
+        if not skip_reason and batch and batch_images + len(images) > MAX_BATCH_SIZE:
+            skip_reason = 'deferred'
+
+        state = last_inference[camera.name]
+        capture = {
+            'time': captured_at,
+            'camera': camera.name,
+            'id_zona': camera.id_zona,
+            # Varias regiones pueden ser de la misma zona: cada zona una sola vez
+            'zones': list(dict.fromkeys(roi['id_zona'] for roi in camera.rois)) or [camera.id_zona],
+            'capture_path': capture_path,
+            'processed_path': state['processed_path'],
+            'detections': state['detections'],
+            'inferred': False,
+            'skip_reason': skip_reason,
+            'scene_diff': scene_diff
+        }
+        captures.append(capture)
+        if skip_reason:
+            camera.record(False)
+            with stats_lock:
+                inference_stats[f'skipped_{skip_reason}'] += 1
+            INFERENCE_SKIPPED.inc(reason=skip_reason)
+        else:
+            batch.append((capture, frame, jpeg, thumbnail, images))
+            batch_images += len(images)
+
+    if batch:
+        # Procesar todos los frames lores y recortes pendientes con una sola llamada al modelo
+        results, _ = run_model([image for _, _, _, _, images in batch for image in images])
+
+        position = 0
+        for capture, frame, jpeg, thumbnail, images in batch:
+            name = capture['camera']
+            camera = cameras[name]
+            camera_results = results[position:position + len(images)]
+            position += len(images)
+            if camera.rois:
+                detections = roi_detections(camera, camera_results)
+            else:
+                detections = extract_detections(camera_results[0], camera.id_zona, CAPTURE_SIZE[0] / LORES_SIZE[0])
+            # La imagen procesada que se archiva va a la resolución de la foto (stream main), no a la del lores
+            base = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR) if archive else frame
+            annotated = annotate_frame(base, camera.rois, detections)
+
+            if archive:
+                processed_path = os.path.join(PROCESSED_DIR, name, f"processed_{timestamp}.jpg")
+                _, encoded = cv2.imencode('.jpg', annotated)
+                save_frame(name, 'processed', processed_path, encoded.tobytes())
+                processed_archives[name].add(processed_path)
+            else:
+                # Inferencia continua sin archivar: nada va al disco y la última imagen procesada
+                # sigue siendo la archivada; el frame anotado solo se codifica si alguien mira el stream
+                processed_path = last_inference[name]['processed_path']
+                if stream_clients[(name, 'processed')]:
+                    _, encoded = cv2.imencode('.jpg', annotated)
+                    push_stream_frame((name, 'processed'), encoded.tobytes())
+            if TIMELAPSE_SOURCE == 'processed':
+                # El video sigue en lores aunque la imagen anotada sea del stream main
+                frames[name] = cv2.resize(annotated, LORES_SIZE, interpolation=cv2.INTER_AREA) if archive else annotated
+
+            last_inference[name].update({
+                'thumbnail': thumbnail,
+                'time': time.time(),
+                'processed_path': processed_path,
+                'detections': detections
+            })
+            capture.update({
+                'processed_path': processed_path,
+                'detections': detections,
+                'inferred': True
+            })
+            camera.record(True, len(detections))
+
+        with stats_lock:
+            inference_stats['executed'] += 1
+            inference_stats['images_inferred'] += batch_images
+            inference_stats['avg_batch_size'] = ewma(inference_stats['avg_batch_size'], batch_images)
+
+    if archive:
+        for capture in captures:
+            if capture['inferred'] or TIMELAPSE_SOURCE == 'raw':
+                append_timelapse(capture['camera'], frames[capture['camera']])
+
+    return captures
+
+def next_capture_interval(captures, light_intensity=None, anomaly=False, min_interval=MIN_CAPTURE_INTERVAL):
+    """
+    Calcula cuántos segundos esperar hasta la siguiente captura.
+    La actividad sube cuando cambian la escena o las detecciones de alguna cámara, quedan
+    cámaras sin procesar o hay una anomalía en los sensores, y decae en cada captura tranquila.
+    Con actividad alta se captura cada min_interval y sin actividad (o a oscuras)
+    cada MAX_CAPTURE_INTERVAL, sin bajar nunca del intervalo que respeta INFERENCE_CPU_BUDGET.
+    """
+    event = 0.0
+    for capture in captures:
+        if capture['skip_reason'] == 'deferred':
+            event = 1.0
+        if not capture['inferred']:
+            continue
+        counts = {}
+        for detection in capture['detections']:
+            counts[detection['class']] = counts.get(detection['class'], 0) + 1
+        if counts != capture_schedule['class_counts'].get(capture['camera']):
+            event = 1.0
+        elif capture['scene_diff'] is not None and capture['scene_diff'] >= SCENE_DIFF_THRESHOLD:
+            event = max(event, 0.5)
+        capture_schedule['class_counts'][capture['camera']] = counts
+    if anomaly:
+        event = 1.0
+
+    activity = max(event, capture_schedule['activity'] * ACTIVITY_DECAY)
+    capture_schedule['activity'] = activity
+
+    light_intensity = zone_light(light_intensity)
+    if light_intensity is not None and light_intensity < DARK_LIGHT_THRESHOLD and not anomaly:
+        interval = MAX_CAPTURE_INTERVAL
+    else:
+        interval = MAX_CAPTURE_INTERVAL - (MAX_CAPTURE_INTERVAL - min_interval) * activity
+
+    with stats_lock:
+        avg_inference_s = inference_stats['avg_inference_s']
+    if avg_inference_s is not None:
+        interval = max(interval, avg_inference_s / INFERENCE_CPU_BUDGET)
 
-    # Procesar imagen con el modelo YOLO
-    results = model(capture_path, save=True)
-    yolo_output = results.save_dir / f"capture_{timestamp}.jpg"
-    processed_path = os.path.join(PROCESSED_DIR, f"processed_{timestamp}.jpg")
+    capture_schedule['interval'] = interval
+    return interval
 
-    if os.path.exists(yolo_output):
-        shutil.move(yolo_output, processed_path)
-        shutil.rmtree("runs/detect", ignore_errors=True)
+# Índices en memoria de las fotos guardadas por cámara (reemplazan a borrar todo salvo la
+# última) y encoders persistentes del time-lapse; los llena init_vision
+capture_archives = {}
+processed_archives = {}
+timelapses = {}
 
-    keep_only_latest_file(CAPTURE_DIR)
-    keep_only_latest_file(PROCESSED_DIR)
+def init_vision():
+    """
+    Abre las cámaras, los archivos de fotos y los time-lapse, carga y calienta el modelo.
+    Mientras se carga el modelo (lo más lento: importar torch y ultralytics) las cámaras se
+    van calentando, así que solo se espera lo que falte de CAMERA_WARMUP.
+    Una cámara que no abre no detiene el servicio; se sigue con las demás. Se puede volver a
+    llamar para reintentar lo que falló: no reabre las cámaras que ya están abiertas ni recarga
+    el modelo. Devuelve el modelo cuando todas las cámaras configuradas están abiertas, None
+    mientras falte alguna (o el modelo).
+    """
+    global model, cameras
+    steps = {}
+    start = time.perf_counter()
+    for camera_config in CAMERAS:
+        name = camera_config['name']
+        if name in cameras:
+            continue
+        try:
+            # Modo video: sin cambios de modo por captura. Copia del diccionario: el bucle de
+            # fotos y el stream lo recorren mientras se reintenta
+            cameras = {**cameras, name: open_camera(camera_config, CAPTURE_SIZE, LORES_SIZE, STREAM_JPEG_QUALITY)}
+        except Exception as e:
+            log.error("Could not open camera %s: %s", name, e,
+                      extra={'camera': name, 'zone': camera_config['id_zona'], 'error_class': type(e).__name__})
+    opened = time.perf_counter()
+    steps['cameras_s'] = opened - start
+
+    if not capture_archives:
+        capture_archives.update({
+            name: ImageArchive(os.path.join(CAPTURE_DIR, name), CAPTURE_ARCHIVE_BYTES // len(CAMERAS),
+                               ARCHIVE_FULL_RES_HOURS, ARCHIVE_DECIMATE_SECONDS, ARCHIVE_QUALITY, ARCHIVE_SCALE)
+            for name in last_inference
+        })
+        processed_archives.update({
+            name: ImageArchive(os.path.join(PROCESSED_DIR, name), PROCESSED_ARCHIVE_BYTES // len(CAMERAS),
+                               ARCHIVE_FULL_RES_HOURS, ARCHIVE_DECIMATE_SECONDS, ARCHIVE_QUALITY, ARCHIVE_SCALE)
+            for name in last_inference
+        })
+        timelapses.update({
+            name: TimelapseEncoder(os.path.join(TIMELAPSE_DIR, name), TIMELAPSE_FPS, TIMELAPSE_CODEC, TIMELAPSE_CRF)
+            for name in last_inference
+        })
+        # Servir desde memoria las últimas imágenes que quedaron en disco
+        load_latest_frames()
+    archives = time.perf_counter()
+    steps['archives_s'] = archives - opened
+
+    if model is None:
+        from ultralytics import YOLO
+        loaded_model = YOLO(MODEL_PATH)
+        loaded = time.perf_counter()
+        steps['model_load_s'] = loaded - archives
+
+        time.sleep(max(0.0, CAMERA_WARMUP - (loaded - opened)))
+        model = loaded_model
+        # Calentar el modelo antes de la primera captura real
+        warm_up_model()
+        steps['warmup_s'] = time.perf_counter() - loaded
+        steps['total_s'] = time.perf_counter() - start
+        with stats_lock:
+            inference_stats['startup'] = {step: round(seconds, 3) for step, seconds in steps.items()}
+        log.info("Vision ready in %.1f s (cameras %.1f s, archives %.1f s, model load %.1f s, warm-up %.1f s)",
+                 steps['total_s'], steps['cameras_s'], steps['archives_s'], steps['model_load_s'], steps['warmup_s'],
+                 extra={'count': len(cameras)})
 
-    return capture_path, processed_path
+    missing = [camera_config['name'] for camera_config in CAMERAS if camera_config['name'] not in cameras]
+    if missing:
+        log.warning("Cameras not available: %s", ", ".join(missing), extra={'count': len(missing)})
+        return None
+    return model
+
+def vision_status():
+    """Modelo cargado y, por cámara configurada, su zona y si está abierta."""
+    return {
+        'model': model is not None,
+        'cameras': {camera_config['name']: {'id_zona': camera_config['id_zona'], 'open': camera_config['name'] in cameras}
+                    for camera_config in CAMERAS}
+    }
 
 # Rutas de Flask
+def requested_camera():
+    """Cámara pedida con ?camera=, o la primera configurada."""
+    name = request.args.get('camera', DEFAULT_CAMERA)
+    return name if name in last_inference else None
+
+def serve_frame(kind, error):
+    """Sirve una imagen desde memoria con ETag y Last-Modified; responde 304 si el cliente ya la tiene."""
+    camera = requested_camera()
+    if camera is None:
+        return jsonify({"error": "Unknown camera"}), 404
+    frame = latest_frames[(camera, kind)]
+    if frame is None:
+        return jsonify({"error": error}), 404
+    data, etag, modified = frame
+    response = Response(data, mimetype='image/jpeg')
+    response.set_etag(etag)
+    response.last_modified = modified
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
 @app.route('/latest-capture', methods=['GET'])
 def get_latest_capture():
-    try:
-        files = os.listdir(CAPTURE_DIR)
-        if not files:
-            return jsonify({"error": "No captures available"}), 404
-        latest_file = max(files, key=lambda x: os.path.getmtime(os.path.join(CAPTURE_DIR, x)))
-        return send_file(os.path.join(CAPTURE_DIR, latest_file), mimetype='image/jpeg')
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    return serve_frame('capture', "No captures available")
 
 @app.route('/latest-processed', methods=['GET'])
 def get_latest_processed():
-    try:
-        files = os.listdir(PROCESSED_DIR)
-        if not files:
-            return jsonify({"error": "No processed images available"}), 404
-        latest_file = max(files, key=lambda x: os.path.getmtime(os.path.join(PROCESSED_DIR, x)))
-        return send_file(os.path.join(PROCESSED_DIR, latest_file), mimetype='image/jpeg')
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    return serve_frame('processed', "No processed images available")
+
+@app.route('/stream', methods=['GET'])
+def get_stream():
+    camera = requested_camera()
+    source = request.args.get('source', 'raw')
+    fps = request.args.get('fps', STREAM_FPS, type=float)
+    if camera is None or (source == 'raw' and camera not in cameras):
+        return jsonify({"error": "Unknown or unavailable camera"}), 404
+    if source not in ('raw', 'processed'):
+        return jsonify({"error": "source must be 'raw' or 'processed'"}), 400
+    if not fps or fps <= 0:
+        return jsonify({"error": "fps must be a positive number"}), 400
+    key = (camera, source)
+    if not reserve_stream_client(key):
+        return jsonify({"error": "Too many stream clients"}), 503, {'Retry-After': str(STREAM_KEEPALIVE)}
+    if source == 'raw':
+        start_stream_producer()
+    response = Response(
+        mjpeg_stream(key, min(fps, STREAM_FPS)),
+        mimetype='multipart/x-mixed-replace; boundary=frame',
+        headers={'Cache-Control': 'no-cache'}
+    )
+    # waitress cierra la respuesta al terminar, aunque el generador no haya llegado a arrancar
+    response.call_on_close(lambda: release_stream_client(key))
+    return response
+
+@app.route('/stats', methods=['GET'])
+def get_stats():
+    with stats_lock:
+        stats = inference_stats.copy()
+    with stream_condition:
+        stats['stream_clients'] = sum(stream_clients.values())
+        stats.update(stream_stats)
+    stats['capture_interval'] = capture_schedule['interval']
+    stats['activity'] = capture_schedule['activity']
+    stats['cameras'] = {}
+    for name, state in last_inference.items():
+        camera_stats = cameras[name].stats() if name in cameras else {'available': False}
+        camera_stats.update({
+            'last_inference': state['time'] or None,
+            'last_detections': len(state['detections']),
+            'capture_archive': capture_archives[name].stats() if name in capture_archives else None,
+            'processed_archive': processed_archives[name].stats() if name in processed_archives else None,
+            'timelapse': timelapses[name].stats() if name in timelapses else None
+        })
+        stats['cameras'][name] = camera_stats
+    return jsonify(stats)
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+def start_http_server(flask_app=app, port=HTTP_PORT, threads=HTTP_THREADS):
+    """
+    Sirve una app Flask con waitress en un hilo propio, separado del bucle de captura.
+    El límite de buffer de salida hace que un cliente lento frene su propio generador
+    (y salte frames en /stream) en vez de acumular megas en memoria.
+    """
+    server_thread = Thread(
+        target=serve,
+        args=(flask_app,),
+        kwargs={
+            'host': HTTP_HOST,
+            'port': port,
+            'threads': threads,
+            'outbuf_high_watermark': HTTP_OUTBUF_HIGH_WATERMARK,
+            'ident': 'invernadero'
+        },
+        name=f"http-{port}",
+        daemon=True
+    )
+    server_thread.start()
+    return server_thread
+
+def stop_camera_service():
+    """Cierra los time-lapse del día y detiene las cámaras."""
+    for timelapse in timelapses.values():
+        timelapse.close()
+    for camera in cameras.values():
+        camera.stop()
 
-# Función para ejecutar el servidor Flask y capturar imágenes
+# Función para ejecutar el servidor HTTP y capturar imágenes
 def main():
-    print("[INFO] Starting camera service...")
+    log.info("Starting camera service...")
 
-    # Ejecutar Flask en un hilo separado
-    flask_thread = Thread(target=lambda: app.run(host='0.0.0.0', port=5000))
-    flask_thread.daemon = True
-    flask_thread.start()
+    # Servir la API en su propio hilo con waitress (ya responde mientras carga el modelo)
+    start_http_server()
+    init_vision()
 
     # Bucle principal de captura y procesamiento
+    # En modo continuo se infiere sobre lores en cada vuelta y solo se archiva según el planificador
+    next_archive = 0.0
     while True:
+        interval = STANDALONE_MIN_CAPTURE_INTERVAL
         try:
-            capture_and_process()
-            print("[INFO] Image captured and processed successfully")
+            archive = not CONTINUOUS_INFERENCE or time.time() >= next_archive
+            captures = capture_and_process(archive=archive)
+            if archive:
+                for capture in captures:
+                    if capture['inferred']:
+                        log.info("%s: image captured and processed successfully", capture['camera'],
+                                 extra={'camera': capture['camera'], 'count': len(capture['detections'])})
+                    else:
+                        log.info("%s: image captured, inference skipped (%s)", capture['camera'], capture['skip_reason'],
+                                 extra={'camera': capture['camera']})
+                interval = next_capture_interval(captures, min_interval=STANDALONE_MIN_CAPTURE_INTERVAL)
+                next_archive = time.time() + interval
         except Exception as e:
-            print(f"[ERROR] An error occurred: {e}")
-        time.sleep(20)
+            log.exception("An error occurred: %s", e)
+        time.sleep(CONTINUOUS_INFERENCE_PERIOD if CONTINUOUS_INFERENCE else interval)
 
 if __name__ == "__main__":
     try:
         main()
     except KeyboardInterrupt:
-        print("\n[INFO] Shutting down camera service...")
-        picam2.stop()
\ No newline at end of file
+        log.info("Shutting down camera service...")
+        stop_camera_service()
+        stop_logging()
\ No newline at end of file
@@ -0,0 +1,103 @@
+# Benchmark de escala por zonas: arranca main5 con 1, 2, 5, ... 100 zonas simuladas (ver
+# simulation.py y daemon_benchmark.py), corre sus hilos durante --duration s y mide cuántas
+# consultas hace a la base por minuto simulado. Con las consultas agrupadas por zona el total
+# debe crecer menos que linealmente con la cantidad de zonas: se ajusta la pendiente de
+# log(consultas) contra log(zonas) y el script sale con código 1 si llega a 1 (una consulta
+# más por cada zona agregada).
+#
+# Cada tamaño corre en su propio proceso porque main5 guarda el estado a nivel de módulo.
+#
+#   python zone_benchmark.py
+#   python zone_benchmark.py --zones 1,10,100 --duration 20
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import tempfile
+import subprocess
+import daemon_benchmark
+
+ZONE_COUNTS = (1, 2, 5, 10, 20, 50, 100)
+MAX_EXPONENT = 1.0          # Pendiente log-log a partir de la cual las consultas no escalan
+CHECK_REPETITIONS = 1000    # Llamadas a check_environmental_conditions que se cronometran
+
+
+def run_child(args):
+    """Un tamaño: arranca con args.child zonas, corre los hilos y devuelve las métricas."""
+    workdir = tempfile.mkdtemp(prefix=f"invernadero-zones-{args.child}-")
+    main5, greenhouses, database, cameras = daemon_benchmark.boot(args, workdir, zones=args.child)
+    threads = daemon_benchmark.start_threads(main5)
+    results = daemon_benchmark.soak_phase(main5, database, args.speedup, args.duration)
+    main5.running = False
+    for thread in threads:
+        thread.join(timeout=10)
+
+    # Con los actuadores ya en su estado, cada llamada es solo la comparación vectorizada
+    start = time.perf_counter()
+    for _ in range(CHECK_REPETITIONS):
+        main5.check_environmental_conditions()
+    results['check_us'] = (time.perf_counter() - start) / CHECK_REPETITIONS * 1e6
+    main5.error_log.stop()
+    results['zones'] = args.child
+    return results
+
+
+def fit_exponent(points):
+    """Pendiente por mínimos cuadrados de log(y) contra log(x)."""
+    points = [(math.log(x), math.log(y)) for x, y in points if x > 0 and y > 0]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    variance = sum((x - mean_x) ** 2 for x, _ in points)
+    if variance == 0:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / variance
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="main5 database round trips versus number of zones")
+    parser.add_argument('--zones', default=','.join(map(str, ZONE_COUNTS)), help="comma separated zone counts")
+    parser.add_argument('--duration', type=float, default=20, help="soak length per zone count (s)")
+    parser.add_argument('--speedup', type=float, default=20, help="simulated seconds per real second")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--dht-failures', type=float, default=0.05, help="fraction of DHT11 reads that fail")
+    parser.add_argument('--device-latency', type=float, default=0.0, help="seconds per simulated device read")
+    parser.add_argument('--query-latency', type=float, default=0.0, help="seconds per simulated database round trip")
+    parser.add_argument('--child', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_child(args)))
+        sys.exit(0)
+
+    options = ['--duration', str(args.duration), '--speedup', str(args.speedup), '--seed', str(args.seed),
+               '--dht-failures', str(args.dht_failures), '--device-latency', str(args.device_latency),
+               '--query-latency', str(args.query_latency)]
+    rows = []
+    print(f"{'zones':>6} {'queries/min':>12} {'per zone':>10} {'rows/min':>10} "
+          f"{'sensor ms':>10} {'database ms':>12} {'check us':>10}")
+    for count in [int(value) for value in args.zones.split(',')]:
+        child = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', str(count)] + options,
+                               capture_output=True, text=True)
+        if child.returncode != 0:
+            print(child.stderr)
+            sys.exit(f"Benchmark with {count} zones failed")
+        result = json.loads(child.stdout.strip().splitlines()[-1])
+        rows.append(result)
+        print(f"{count:>6} {result['queries_per_min']:>12.1f} {result['queries_per_min'] / count:>10.2f} "
+              f"{result['rows_per_min']:>10.1f} {result['sensor_loop_ms']:>10.2f} "
+              f"{result['database_loop_ms']:>12.2f} {result['check_us']:>10.1f}")
+
+    exponent = fit_exponent([(row['zones'], row['queries_per_min']) for row in rows])
+    rows_exponent = fit_exponent([(row['zones'], row['rows_per_min']) for row in rows])
+    if exponent is None:
+        print("Need at least two zone counts to fit the scaling exponent")
+        sys.exit(0)
+    print(f"round trips grow as zones^{exponent:.2f} (rows written as zones^{rows_exponent:.2f})")
+    if exponent >= MAX_EXPONENT:
+        print(f"Database round trips scale linearly or worse with the number of zones (limit {MAX_EXPONENT})")
+        sys.exit(1)
+    print("Database round trips scale sub-linearly")